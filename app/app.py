@@ -1,67 +1,394 @@
-from flask import Flask, render_template, request, jsonify, send_file
+from flask import Flask, render_template, request, jsonify, Response, stream_with_context, g
 import os
+import time
 from werkzeug.utils import secure_filename
-from app.utils.pdf_processor import process_pdf
-from app.utils.csv_exporter import generate_csv_from_codes
-from app.utils.azure_uploader import upload_to_azure_databricks
+from app.utils.pdf_processor import process_pdf, process_pdfs, extraction_stats
+from app.utils.exporters import EXPORT_FORMATS
+from app.utils.azure_uploader import upload_new_codes
 from app.utils.storage import storage
+from app.utils.extraction_cache import extraction_cache
+from app.utils.jobs import job_manager
+from app.utils.json_provider import configure_json
+from app.utils.code_categories import enrich_codes
+from app.utils.metrics import metrics, span, request_profiler, CODES_SAVED, REQUEST_SECONDS
+from itertools import islice
 import json
-from io import BytesIO
 
 # Initialize Flask app
 app = Flask(__name__)
 app.config['MAX_CONTENT_LENGTH'] = 10 * 1024 * 1024  # 10MB max file size
+app.config['MAX_BATCH_CONTENT_LENGTH'] = 200 * 1024 * 1024  # 200MB max batch upload
 app.config['UPLOAD_FOLDER'] = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tmp')
 
+app.config['EXTRACTION_CACHE_SIZE'] = 64  # documents kept in memory
+app.config['EXTRACTION_CACHE_ON_DISK'] = True
+app.config['JOB_WORKERS'] = 4  # background processing jobs running at once
+app.config['JOB_MAX_PER_TENANT'] = 2  # running jobs any one tenant may hold
+app.config['JOB_MAX_RESULTS'] = 20  # finished job results kept until fetched
+app.config['SEARCH_PAGE_SIZE'] = 100
+app.config['SEARCH_MAX_PAGE_SIZE'] = 1000
+app.config['CODES_PAGE_SIZE'] = 1000
+app.config['CODES_MAX_PAGE_SIZE'] = 10000
+app.config['PROFILE_REQUESTS'] = os.environ.get('PROFILE_REQUESTS', '').lower() in ('1', 'true', 'yes')
+
 # Ensure upload folder exists
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
+# Cache extracted codes by file content; the disk tier survives restarts
+extraction_cache.configure(
+    max_entries=app.config['EXTRACTION_CACHE_SIZE'],
+    cache_dir=os.path.join(app.config['UPLOAD_FOLDER'], 'extraction_cache')
+    if app.config['EXTRACTION_CACHE_ON_DISK'] else None
+)
+
+job_manager.configure(
+    max_workers=app.config['JOB_WORKERS'],
+    max_per_tenant=app.config['JOB_MAX_PER_TENANT'],
+    max_results=app.config['JOB_MAX_RESULTS']
+)
+
+# Serialize JSON with orjson when it is installed (the 'fast-json' extra)
+configure_json(app)
+
+# Requests sent with ?profile=1 write a cProfile dump when profiling is enabled
+request_profiler.configure(
+    enabled=app.config['PROFILE_REQUESTS'],
+    output_dir=os.path.join(app.config['UPLOAD_FOLDER'], 'profiles')
+)
+
+def _extraction_cache_lookups():
+    cache_stats = extraction_cache.stats()
+    return {
+        ('memory_hit',): cache_stats['hits'] - cache_stats['disk_hits'],
+        ('disk_hit',): cache_stats['disk_hits'],
+        ('miss',): cache_stats['misses']
+    }
+
+# Values read from their owners whenever metrics are scraped
+metrics.callback('prior_extractor_stored_codes', 'Codes in storage', storage.count_codes)
+metrics.callback('prior_extractor_storage_bytes', 'Approximate size of the stored codes in bytes',
+                 storage.get_size_bytes)
+metrics.callback('prior_extractor_extraction_cache_lookups_total', 'Extraction cache lookups by result',
+                 _extraction_cache_lookups, kind='counter', label_names=('result',))
+metrics.callback('prior_extractor_extraction_cache_entries', 'Documents in the in-memory extraction cache',
+                 lambda: extraction_cache.stats()['entries'])
+metrics.callback('prior_extractor_extraction_cache_saved_bytes_total',
+                 'PDF bytes not re-extracted thanks to the extraction cache',
+                 lambda: extraction_cache.stats()['bytes_saved'], kind='counter')
+
+@app.before_request
+def start_request_timer():
+    """Time every request, and profile it if asked to"""
+    g.request_started = time.perf_counter()
+    g.profiler = request_profiler.start() if request.args.get('profile') == '1' else None
+
+@app.after_request
+def record_request_metrics(response):
+    """Record request latency by endpoint and write the profile, if any"""
+    started = g.pop('request_started', None)
+    # Label by route pattern, not the URL, to keep the number of series bounded
+    endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    if started is not None:
+        REQUEST_SECONDS.observe(time.perf_counter() - started, method=request.method,
+                                endpoint=endpoint, status=response.status_code)
+    
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        path = request_profiler.stop(profiler, f"{request.method}-{endpoint}")
+        response.headers['X-Profile-File'] = os.path.basename(path)
+    return response
+
+@app.teardown_request
+def stop_request_profiler(error=None):
+    """Release the profiler of a request that failed before after_request ran"""
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        request_profiler.stop(profiler, 'failed-request')
+
+def save_extracted_codes(codes):
+    """
+    Save codes to storage, skipping stored ones, timing the save and counting new codes
+    Args:
+        codes: List of code dictionaries
+    Returns:
+        dict: 'codes' (saved or already stored codes with their ids),
+            'inserted' and 'unchanged' counts
+    """
+    with span('save_codes'):
+        result = storage.upsert_codes(codes)
+    CODES_SAVED.inc(result['inserted'])
+    return result
+
 @app.route('/')
 def index():
     """Render the main page"""
     return render_template('index.html')
 
+class InvalidQueryParameter(ValueError):
+    """
+    Raised when a query string parameter has a value the API can't use
+    """
+
+@app.errorhandler(InvalidQueryParameter)
+def invalid_query_parameter(error):
+    """Answer requests with an invalid query string parameter with a JSON 400"""
+    return jsonify({'error': str(error)}), 400
+
+def get_year_arg(name):
+    """
+    Get an integer year from the query string
+    Args:
+        name: Query parameter name
+    Returns:
+        int: The year
+    Raises:
+        InvalidQueryParameter: If the value is not an integer
+    """
+    value = request.args.get(name)
+    try:
+        return int(value)
+    except ValueError:
+        raise InvalidQueryParameter(f"{name} must be an integer, got {value!r}")
+
+def get_code_filters():
+    """
+    Get indexed field filters from the query string
+    Returns:
+        dict: Filter values keyed by field name, only for fields that were given
+    Raises:
+        InvalidQueryParameter: If year is not an integer
+    """
+    filters = {
+        field: request.args.get(field)
+        for field in ('code', 'code_type', 'payer_name', 'line_of_business', 'source_file', 'category')
+        if request.args.get(field)
+    }
+    if request.args.get('year'):
+        filters['year'] = get_year_arg('year')
+    return filters
+
+def get_slice_filters(prefix=''):
+    """
+    Get the fields selecting a slice of codes to compare from the query string
+    Args:
+        prefix: Query parameter prefix, e.g. 'base.' for 'base.payer_name'
+    Returns:
+        dict: Filter values keyed by field name, only for fields that were given
+    Raises:
+        InvalidQueryParameter: If year is not an integer
+    """
+    filters = {
+        field: request.args.get(prefix + field)
+        for field in ('payer_name', 'line_of_business', 'source_file')
+        if request.args.get(prefix + field)
+    }
+    if request.args.get(prefix + 'year'):
+        filters['year'] = get_year_arg(prefix + 'year')
+    return filters
+
+def storage_etag():
+    """ETag identifying the current contents of storage"""
+    return f"{storage.get_generation()}-{storage.get_version()}"
+
+def not_modified(etag):
+    """
+    Get a 304 response if the request already has the current version
+    Args:
+        etag: Current ETag
+    Returns:
+        Response: 304 response, or None if the client's copy is stale
+    """
+    if not request.if_none_match.contains(etag):
+        return None
+    response = app.response_class(status=304)
+    response.set_etag(etag)
+    return response
+
 @app.route('/api/codes', methods=['GET'])
 def get_codes():
-    """Get all extracted codes"""
-    return jsonify(storage.get_all_codes())
+    """
+    Get extracted codes, optionally filtered by field values
+    Without paging parameters every matching code is returned as a list.
+    With 'limit' or 'cursor' one page is returned, along with the cursor
+    of the next page. 'fields' keeps only the given comma-separated fields
+    of each code. Responses carry an ETag of the storage version, so an
+    unchanged store answers If-None-Match with 304 without reading codes.
+    """
+    etag = storage_etag()
+    unchanged = not_modified(etag)
+    if unchanged:
+        return unchanged
+    
+    filters = get_code_filters()
+    fields = [field for field in request.args.get('fields', '').split(',') if field]
+    paged = 'limit' in request.args or 'cursor' in request.args
+    
+    if paged:
+        cursor = max(request.args.get('cursor', 0, type=int), 0)
+        limit = min(max(request.args.get('limit', app.config['CODES_PAGE_SIZE'], type=int), 1),
+                    app.config['CODES_MAX_PAGE_SIZE'])
+        # One extra code tells whether there is a next page
+        codes = list(islice(storage.iter_codes(batch_size=limit + 1, after_id=cursor, **filters), limit + 1))
+        next_cursor = codes[limit - 1]['id'] if len(codes) > limit else None
+        codes = codes[:limit]
+    elif filters:
+        codes = storage.filter_codes(**filters)
+    else:
+        codes = storage.get_all_codes()
+    
+    if fields:
+        codes = [{field: code[field] for field in fields if field in code} for code in codes]
+    
+    response = jsonify({'codes': codes, 'next_cursor': next_cursor, 'limit': limit} if paged else codes)
+    response.set_etag(etag)
+    response.cache_control.no_cache = True
+    return response
+
+@app.route('/api/codes/changes', methods=['GET'])
+def get_code_changes():
+    """
+    Get codes saved since a client's last sync
+    Clients pass the 'generation' and 'last_id' of their previous response
+    as 'generation' and 'since'. If storage was cleared in between, the
+    generation differs and 'reset' is true: the client should drop its copy
+    and the feed starts again from the first code. 'has_more' means another
+    call is needed to catch up.
+    """
+    since = max(request.args.get('since', 0, type=int), 0)
+    client_generation = request.args.get('generation')
+    limit = min(max(request.args.get('limit', app.config['CODES_PAGE_SIZE'], type=int), 1),
+                app.config['CODES_MAX_PAGE_SIZE'])
+    
+    while True:
+        generation = storage.get_generation()
+        reset = client_generation is not None and client_generation != generation
+        codes = storage.get_codes_since(0 if reset else since, limit + 1)
+        # A clear while reading would mix generations; read again if one happened
+        if storage.get_generation() == generation:
+            break
+    
+    has_more = len(codes) > limit
+    codes = codes[:limit]
+    
+    return jsonify({
+        'generation': generation,
+        'reset': reset,
+        'codes': codes,
+        'last_id': codes[-1]['id'] if codes else (0 if reset else since),
+        'has_more': has_more
+    })
 
 @app.route('/api/codes/search', methods=['GET'])
 def search_codes():
-    """Search extracted codes"""
+    """Search extracted codes, one page at a time, optionally filtered by field values"""
     search_term = request.args.get('term', '')
-    return jsonify(storage.search_codes(search_term))
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    limit = min(max(request.args.get('limit', app.config['SEARCH_PAGE_SIZE'], type=int), 1),
+                app.config['SEARCH_MAX_PAGE_SIZE'])
+    
+    page = storage.search_codes_page(search_term, limit=limit, offset=offset, **get_code_filters())
+    
+    if offset + limit < page['total']:
+        page['next_offset'] = offset + limit
+    return jsonify(page)
+
+@app.route('/api/codes/version', methods=['GET'])
+def get_codes_version():
+    """Get the storage generation and version, which change whenever the codes do"""
+    return jsonify({
+        'generation': storage.get_generation(),
+        'version': storage.get_version(),
+        'total': storage.count_codes()
+    })
+
+@app.route('/api/codes/coverage', methods=['GET'])
+def get_code_coverage():
+    """
+    Check whether a code is covered, e.g. for a payer, by a stored code or code range
+    Filters apply to the covering records; 'code' is the code looked up.
+    """
+    code = request.args.get('code', '').strip().upper()
+    if not code:
+        return jsonify({'error': 'No code provided'}), 400
+    
+    filters = get_code_filters()
+    filters.pop('code', None)
+    matches = storage.find_covering_codes(code, **filters)
+    return jsonify({'code': code, 'covered': bool(matches), 'matches': matches})
+
+@app.route('/api/codes/diff', methods=['GET'])
+def diff_codes():
+    """
+    Compare two slices of codes, e.g. a payer's 2024 and 2025 lists or two payers
+    Slices are given as base.<field> and other.<field> parameters for payer_name,
+    line_of_business, year and source_file.
+    """
+    base = get_slice_filters('base.')
+    other = get_slice_filters('other.')
+    if not base and not other:
+        return jsonify({'error': 'No slices provided'}), 400
+    
+    try:
+        diff = storage.diff_codes(base, other)
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({
+        'base': base,
+        'other': other,
+        'counts': {name: len(codes) for name, codes in diff.items()},
+        **diff
+    })
+
+@app.route('/api/codes/compare', methods=['GET'])
+def compare_codes():
+    """
+    Compare the codes of every payer (or other field given as group_by), optionally
+    within one line of business, year or source file
+    """
+    group_by = request.args.get('group_by', 'payer_name')
+    try:
+        return jsonify(storage.compare_codes(group_by, **get_slice_filters()))
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+
+@app.route('/api/facets/<field>', methods=['GET'])
+def get_facet(field):
+    """Get the distinct values of a filterable field"""
+    try:
+        values = storage.get_facet_values(field)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(sorted(values, key=str))
 
 @app.route('/api/payers', methods=['GET'])
 def get_payers():
     """Get unique payer names"""
-    all_codes = storage.get_all_codes()
-    unique_payers = list(set(code['payer_name'] for code in all_codes))
-    return jsonify(unique_payers)
+    return jsonify(storage.get_facet_values('payer_name'))
 
 @app.route('/api/lines-of-business', methods=['GET'])
 def get_lines_of_business():
     """Get unique lines of business"""
-    all_codes = storage.get_all_codes()
-    unique_lobs = list(set(code['line_of_business'] for code in all_codes))
-    return jsonify(unique_lobs)
+    return jsonify(storage.get_facet_values('line_of_business'))
 
-@app.route('/api/process-pdf', methods=['POST'])
-def process_pdf_endpoint():
-    """Process a PDF file to extract codes"""
+def get_pdf_upload():
+    """
+    Validate an uploaded PDF and its metadata from the current request
+    Returns:
+        tuple: (file, metadata, error_response); error_response is None when valid
+    """
     # Check if file was uploaded
     if 'file' not in request.files:
-        return jsonify({'error': 'No file part'}), 400
+        return None, None, (jsonify({'error': 'No file part'}), 400)
     
     file = request.files['file']
     
     # Check if file is empty
     if file.filename == '':
-        return jsonify({'error': 'No file selected'}), 400
+        return None, None, (jsonify({'error': 'No file selected'}), 400)
     
     # Check if file is a PDF
     if not file.filename.lower().endswith('.pdf'):
-        return jsonify({'error': 'Only PDF files are allowed'}), 400
+        return None, None, (jsonify({'error': 'Only PDF files are allowed'}), 400)
     
     # Get metadata from request
     payer_name = request.form.get('payer_name', '')
@@ -70,32 +397,199 @@ def process_pdf_endpoint():
     
     # Check if metadata is provided
     if not payer_name or not line_of_business:
-        return jsonify({'error': 'Metadata (payer name and line of business) is required'}), 400
+        return None, None, (jsonify({'error': 'Metadata (payer name and line of business) is required'}), 400)
+    
+    metadata = {
+        'payer_name': payer_name,
+        'year': year,
+        'line_of_business': line_of_business,
+        'source_file': secure_filename(file.filename)
+    }
+    
+    return file, metadata, None
+
+def get_tenant():
+    """Get the tenant a request is accounted to for job fairness"""
+    return request.headers.get('X-Tenant-ID') or request.form.get('tenant') or request.remote_addr or 'default'
+
+@app.route('/api/process-pdf', methods=['POST'])
+def process_pdf_endpoint():
+    """Process a PDF file to extract codes"""
+    file, metadata, error_response = get_pdf_upload()
+    if error_response:
+        return error_response
     
     try:
-        # Prepare metadata
-        metadata = {
-            'payer_name': payer_name,
-            'year': year,
-            'line_of_business': line_of_business,
-            'source_file': secure_filename(file.filename)
-        }
-        
         # Process PDF and extract codes
         file_content = file.read()
-        extracted_codes = process_pdf(file_content, metadata)
+        with span('process_pdf'):
+            extracted_codes = process_pdf(file_content, metadata)
         
-        # Save extracted codes
-        saved_codes = storage.save_codes(extracted_codes)
+        # Save extracted codes; codes saved by an earlier upload are kept
+        saved = save_extracted_codes(extracted_codes)
         
         return jsonify({
             'message': f'Successfully processed {file.filename}',
-            'extracted_codes': saved_codes
+            'extracted_codes': saved['codes'],
+            'inserted': saved['inserted'],
+            'unchanged': saved['unchanged']
         })
     
     except Exception as e:
         return jsonify({'error': f'Error processing PDF: {str(e)}'}), 500
 
+@app.route('/api/process-pdf/batch', methods=['POST'])
+def process_pdf_batch_endpoint():
+    """Process several PDF files, each with its own metadata, in one request"""
+    # A batch may be larger than a single upload
+    request.max_content_length = app.config['MAX_BATCH_CONTENT_LENGTH']
+    
+    files = request.files.getlist('files')
+    if not files:
+        return jsonify({'error': 'No files provided'}), 400
+    
+    # Per-file metadata is a JSON list in file order; form fields are the defaults
+    try:
+        file_metadata = json.loads(request.form.get('metadata') or '[]')
+    except ValueError:
+        return jsonify({'error': 'Metadata must be a JSON list'}), 400
+    
+    if not isinstance(file_metadata, list) or len(file_metadata) > len(files):
+        return jsonify({'error': 'Metadata must be a JSON list with at most one entry per file'}), 400
+    
+    summary = []
+    documents = []
+    
+    for index, file in enumerate(files):
+        overrides = file_metadata[index] if index < len(file_metadata) else {}
+        entry = {'filename': file.filename, 'status': 'error', 'codes_extracted': 0}
+        summary.append(entry)
+        
+        if not file.filename.lower().endswith('.pdf'):
+            entry['error'] = 'Only PDF files are allowed'
+            continue
+        
+        try:
+            metadata = {
+                'payer_name': overrides.get('payer_name') or request.form.get('payer_name', ''),
+                'year': int(overrides.get('year') or request.form.get('year', 2023)),
+                'line_of_business': overrides.get('line_of_business') or request.form.get('line_of_business', ''),
+                'source_file': secure_filename(file.filename)
+            }
+        except (AttributeError, ValueError):
+            entry['error'] = 'Invalid metadata'
+            continue
+        
+        if not metadata['payer_name'] or not metadata['line_of_business']:
+            entry['error'] = 'Metadata (payer name and line of business) is required'
+            continue
+        
+        documents.append((entry, file.read(), metadata))
+    
+    try:
+        with span('process_pdf_batch'):
+            results = process_pdfs([(content, metadata) for _, content, metadata in documents])
+        
+        codes_to_save = []
+        for (entry, _, _), (codes, error) in zip(documents, results):
+            if error:
+                entry['error'] = f'Error processing PDF: {error}'
+                continue
+            entry['status'] = 'processed'
+            entry['codes_extracted'] = len(codes)
+            codes_to_save.extend(codes)
+        
+        # Save every file's codes together
+        saved = save_extracted_codes(codes_to_save)
+        
+        processed = sum(1 for entry in summary if entry['status'] == 'processed')
+        return jsonify({
+            'message': f'Successfully processed {processed} of {len(files)} files',
+            'total_codes': len(saved['codes']),
+            'inserted': saved['inserted'],
+            'unchanged': saved['unchanged'],
+            'files': summary
+        })
+    
+    except Exception as e:
+        return jsonify({'error': f'Error processing PDF batch: {str(e)}'}), 500
+
+@app.route('/api/jobs', methods=['POST'])
+def submit_pdf_job():
+    """Queue a PDF file for processing and return a job id immediately"""
+    file, metadata, error_response = get_pdf_upload()
+    if error_response:
+        return error_response
+    
+    filename = file.filename
+    file_content = file.read()
+    
+    def run(job):
+        with span('process_pdf'):
+            extracted_codes = process_pdf(file_content, metadata, progress=job.report_progress)
+        # Don't save results of a job that was cancelled after its last page
+        job.check_cancelled()
+        saved = save_extracted_codes(extracted_codes)
+        job.pages_done = job.pages_total
+        return {
+            'message': f'Successfully processed {filename}',
+            'extracted_codes': saved['codes'],
+            'inserted': saved['inserted'],
+            'unchanged': saved['unchanged']
+        }
+    
+    job = job_manager.submit(run, tenant=get_tenant(), description=filename)
+    
+    response = job.to_dict()
+    response['status_url'] = f'/api/jobs/{job.id}'
+    return jsonify(response), 202
+
+@app.route('/api/jobs', methods=['GET'])
+def list_jobs():
+    """List processing jobs, optionally for one tenant"""
+    tenant = request.args.get('tenant')
+    return jsonify([job.to_dict() for job in job_manager.list_jobs(tenant)])
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Get the status and progress of a processing job"""
+    job = job_manager.get(job_id)
+    
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    return jsonify(job.to_dict())
+
+@app.route('/api/jobs/<job_id>/result', methods=['GET'])
+def get_job_result(job_id):
+    """Get the result of a finished processing job; it can be fetched once"""
+    job = job_manager.get(job_id)
+    
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    if job.status == 'failed':
+        return jsonify({'error': f'Error processing PDF: {job.error}'}), 500
+    
+    if job.status != 'succeeded':
+        return jsonify({**job.to_dict(), 'error': f'Job is {job.status}'}), 409
+    
+    job, result = job_manager.take_result(job_id)
+    if result is None:
+        return jsonify({**job.to_dict(), 'error': 'Job result was already fetched or has expired'}), 410
+    
+    return jsonify(result)
+
+@app.route('/api/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    """Cancel a queued or running processing job"""
+    job = job_manager.cancel(job_id)
+    
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    return jsonify(job.to_dict())
+
 @app.route('/api/codes', methods=['POST'])
 def save_codes():
     """Save extracted codes"""
@@ -105,58 +599,98 @@ def save_codes():
         if not codes_to_save:
             return jsonify({'error': 'No codes provided'}), 400
         
-        saved_codes = storage.save_codes(codes_to_save)
+        # Codes extracted elsewhere get the same categories as extracted ones
+        saved = save_extracted_codes(enrich_codes(codes_to_save))
         
         return jsonify({
-            'message': f'Successfully saved {len(saved_codes)} codes',
-            'saved_codes': saved_codes
+            'message': f"Successfully saved {saved['inserted']} codes ({saved['unchanged']} already stored)",
+            'saved_codes': saved['codes'],
+            'inserted': saved['inserted'],
+            'unchanged': saved['unchanged']
         })
     
     except Exception as e:
         return jsonify({'error': f'Error saving codes: {str(e)}'}), 500
 
-@app.route('/api/export-csv', methods=['GET'])
-def export_csv():
-    """Export extracted codes as CSV"""
+def stream_export(export_format):
+    """
+    Stream the codes matching the query string filters in an export format
+    Args:
+        export_format: One of EXPORT_FORMATS
+    Returns:
+        Response: Streaming attachment, or a JSON error response
+    """
+    filters = get_code_filters()
+    
     try:
-        all_codes = storage.get_all_codes()
-        
-        if not all_codes:
+        if not storage.count_codes():
             return jsonify({'error': 'No codes to export'}), 400
         
-        csv_buffer = generate_csv_from_codes(all_codes)
+        generate, mimetype = EXPORT_FORMATS[export_format]
+        chunks = generate(storage.iter_codes(**filters))
         
-        return send_file(
-            BytesIO(csv_buffer.getvalue().encode('utf-8')),
-            mimetype='text/csv',
-            as_attachment=True,
-            download_name='extracted_codes.csv'
+        return Response(
+            stream_with_context(chunks),
+            mimetype=mimetype,
+            headers={'Content-Disposition': f'attachment; filename=extracted_codes.{export_format}'}
         )
     
     except Exception as e:
-        return jsonify({'error': f'Error exporting CSV: {str(e)}'}), 500
+        return jsonify({'error': f'Error exporting codes: {str(e)}'}), 500
+
+@app.route('/api/export', methods=['GET'])
+def export_codes():
+    """
+    Export extracted codes, optionally filtered by field values
+    The 'format' query parameter selects csv (the default), csv.gz, ndjson,
+    ndjson.gz or parquet.
+    """
+    export_format = request.args.get('format', 'csv').lower()
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({'error': f"Unknown export format: {export_format}. "
+                                 f"Use one of {', '.join(EXPORT_FORMATS)}"}), 400
+    
+    return stream_export(export_format)
+
+@app.route('/api/export-csv', methods=['GET'])
+def export_csv():
+    """Export extracted codes as CSV, optionally filtered by field values"""
+    return stream_export('csv')
 
 @app.route('/api/upload-to-azure', methods=['POST'])
 def upload_to_azure():
-    """Upload extracted codes to Azure Databricks"""
+    """Upload codes saved since the last upload to Azure Databricks"""
     try:
         connection = request.json
         
         if not connection or not all(k in connection for k in ['workspace_url', 'access_token', 'directory_path']):
             return jsonify({'error': 'Invalid Azure connection details'}), 400
         
-        all_codes = storage.get_all_codes()
-        
-        if not all_codes:
+        if not storage.count_codes():
             return jsonify({'error': 'No codes to upload'}), 400
         
-        result = upload_to_azure_databricks(all_codes, connection)
+        result = upload_new_codes(storage, connection)
         
         return jsonify(result)
     
     except Exception as e:
         return jsonify({'error': f'Error uploading to Azure: {str(e)}'}), 500
 
+@app.route('/api/cache-stats', methods=['GET'])
+def get_cache_stats():
+    """Get extraction cache hit/miss counters"""
+    return jsonify(extraction_cache.stats())
+
+@app.route('/api/extraction-stats', methods=['GET'])
+def get_extraction_stats():
+    """Get which extraction engines read the uploaded documents and how long they took"""
+    return jsonify(extraction_stats.stats())
+
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """Get processing, request, storage and cache metrics in the Prometheus text format"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/api/codes', methods=['DELETE'])
 def clear_codes():
     """Clear all extracted codes"""
@@ -4,6 +4,7 @@ import requests
 import os
 import io
 import json
+import time
 from datetime import datetime
 
 # Set page config
@@ -17,26 +18,54 @@ st.set_page_config(
 API_BASE_URL = "http://localhost:5001/api"
 
 # Define state variables
-if 'extracted_codes' not in st.session_state:
-    st.session_state.extracted_codes = []
 if 'uploaded_files' not in st.session_state:
     st.session_state.uploaded_files = []
 
-# Function to get all codes
-def get_all_codes():
+# Rows shown per page of results
+PAGE_SIZES = [50, 100, 250, 500]
+CODE_TYPES = ["CPT", "HCPCS", "PLA"]
+# Seconds between status checks of a processing job
+JOB_POLL_SECONDS = 0.5
+
+# One pooled HTTP session shared by every rerun and user of this app
+@st.cache_resource
+def get_session():
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=10)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+# Function to get the storage version; cached reads are keyed on it
+def get_storage_version():
     try:
-        response = requests.get(f"{API_BASE_URL}/codes")
+        response = get_session().get(f"{API_BASE_URL}/codes/version")
         if response.status_code == 200:
-            st.session_state.extracted_codes = response.json()
-            return response.json()
-        else:
-            st.error(f"Error fetching codes: {response.text}")
-            return []
+            version = response.json()
+            return f"{version['generation']}-{version['version']}", version['total']
+        st.error(f"Error fetching storage version: {response.text}")
     except Exception as e:
         st.error(f"Error connecting to API: {str(e)}")
-        return []
+    return None, 0
+
+# Function to get one page of matching codes; the API does the searching
+@st.cache_data(max_entries=200, show_spinner=False)
+def search_codes(storage_version, search_term, filters, offset, limit):
+    response = get_session().get(
+        f"{API_BASE_URL}/codes/search",
+        params={'term': search_term, 'offset': offset, 'limit': limit, **dict(filters)}
+    )
+    response.raise_for_status()
+    return response.json()
 
-# Function to process PDF file
+# Function to get the distinct values of a field for the filter controls
+@st.cache_data(max_entries=50, show_spinner=False)
+def get_facet_values(storage_version, field):
+    response = get_session().get(f"{API_BASE_URL}/facets/{field}")
+    response.raise_for_status()
+    return response.json()
+
+# Function to process PDF file as a background job, polling its progress
 def process_pdf(file, metadata):
     try:
         # Create a form-data request
@@ -47,13 +76,36 @@ def process_pdf(file, metadata):
             'line_of_business': metadata['line_of_business']
         }
         
-        response = requests.post(f"{API_BASE_URL}/process-pdf", files=files, data=data)
+        response = get_session().post(f"{API_BASE_URL}/jobs", files=files, data=data)
+        if response.status_code != 202:
+            st.error(f"Error processing PDF: {response.text}")
+            return False
+        
+        job = response.json()
+        progress_bar = st.progress(0.0, text=f"Processing {file.name}...")
+        while job['status'] in ('queued', 'running'):
+            time.sleep(JOB_POLL_SECONDS)
+            response = get_session().get(f"{API_BASE_URL}/jobs/{job['job_id']}")
+            if response.status_code != 200:
+                progress_bar.empty()
+                st.error(f"Error checking processing status: {response.text}")
+                return False
+            job = response.json()
+            if job['pages_total']:
+                progress_bar.progress(
+                    min(job['pages_done'] / job['pages_total'], 1.0),
+                    text=f"Processing {file.name}: page {job['pages_done']} of {job['pages_total']}"
+                )
+        progress_bar.empty()
+        
+        if job['status'] != 'succeeded':
+            st.error(f"Error processing PDF: {job['error'] or 'job was ' + job['status']}")
+            return False
         
+        response = get_session().get(f"{API_BASE_URL}/jobs/{job['job_id']}/result")
         if response.status_code == 200:
             result = response.json()
-            st.success(f"Successfully processed {file.name}")
-            # Update extracted codes
-            get_all_codes()
+            st.success(f"Successfully processed {file.name}: {result['inserted']} new codes")
             return True
         else:
             st.error(f"Error processing PDF: {response.text}")
@@ -62,10 +114,35 @@ def process_pdf(file, metadata):
         st.error(f"Error connecting to API: {str(e)}")
         return False
 
-# Function to download CSV
-def download_csv():
+# Function to process several PDF files in one batch request
+def process_pdfs(files, metadata_list):
+    try:
+        files_payload = [('files', (file.name, file.getvalue(), 'application/pdf')) for file in files]
+        data = {'metadata': json.dumps(metadata_list)}
+        
+        response = get_session().post(f"{API_BASE_URL}/process-pdf/batch", files=files_payload, data=data)
+        
+        if response.status_code == 200:
+            result = response.json()
+            processed = []
+            for file_result in result['files']:
+                if file_result['status'] == 'processed':
+                    st.success(f"Processed {file_result['filename']}: {file_result['codes_extracted']} codes")
+                    processed.append(file_result['filename'])
+                else:
+                    st.error(f"Error processing {file_result['filename']}: {file_result.get('error')}")
+            return processed
+        else:
+            st.error(f"Error processing PDFs: {response.text}")
+            return []
+    except Exception as e:
+        st.error(f"Error connecting to API: {str(e)}")
+        return []
+
+# Function to download CSV of the codes matching the filters
+def download_csv(filters):
     try:
-        response = requests.get(f"{API_BASE_URL}/export-csv")
+        response = get_session().get(f"{API_BASE_URL}/export-csv", params=dict(filters))
         if response.status_code == 200:
             return response.content
         else:
@@ -78,7 +155,7 @@ def download_csv():
 # Function to upload to Azure
 def upload_to_azure(connection):
     try:
-        response = requests.post(
+        response = get_session().post(
             f"{API_BASE_URL}/upload-to-azure",
             json=connection
         )
@@ -109,10 +186,10 @@ with col1:
     st.header("Upload Documents")
     
     # File uploader
-    uploaded_file = st.file_uploader("Upload PDF files", type=["pdf"], accept_multiple_files=False)
+    uploaded_files = st.file_uploader("Upload PDF files", type=["pdf"], accept_multiple_files=True)
     
-    if uploaded_file is not None:
-        st.write(f"Selected file: {uploaded_file.name}")
+    if uploaded_files:
+        st.write(f"Selected files: {', '.join(file.name for file in uploaded_files)}")
         
         # Display metadata form
         st.subheader("File Metadata")
@@ -129,27 +206,57 @@ with col1:
             lines_of_business = ["Medicare", "Medicaid", "Commercial", "Marketplace", "Other"]
             line_of_business = st.selectbox("Line of Business", options=lines_of_business)
             
+            # Per-file overrides; blank cells use the values above
+            if len(uploaded_files) > 1:
+                st.caption("Override metadata per file (leave blank to use the values above)")
+                overrides = st.data_editor(
+                    pd.DataFrame({
+                        'file': [file.name for file in uploaded_files],
+                        'payer_name': [''] * len(uploaded_files),
+                        'year': [None] * len(uploaded_files),
+                        'line_of_business': [None] * len(uploaded_files)
+                    }),
+                    column_config={
+                        'file': st.column_config.TextColumn("File", disabled=True),
+                        'payer_name': st.column_config.TextColumn("Payer Name"),
+                        'year': st.column_config.SelectboxColumn("Year", options=years),
+                        'line_of_business': st.column_config.SelectboxColumn("Line of Business", options=lines_of_business)
+                    },
+                    hide_index=True,
+                    use_container_width=True
+                )
+                override_rows = overrides.to_dict('records')
+            else:
+                override_rows = [{}]
+            
             # Process button
-            process_button = st.form_submit_button("Process File")
+            process_button = st.form_submit_button("Process Files" if len(uploaded_files) > 1 else "Process File")
             
             if process_button:
-                if not payer_name:
+                metadata_list = []
+                for row in override_rows:
+                    metadata_list.append({
+                        'payer_name': row.get('payer_name') or payer_name,
+                        'year': int(row['year']) if pd.notna(row.get('year')) else year,
+                        'line_of_business': row.get('line_of_business') or line_of_business
+                    })
+                
+                if not all(metadata['payer_name'] for metadata in metadata_list):
                     st.error("Please enter a payer name")
                 else:
-                    metadata = {
-                        'payer_name': payer_name,
-                        'year': year,
-                        'line_of_business': line_of_business
-                    }
+                    # Process the files and add to uploaded files if successful
+                    if len(uploaded_files) > 1:
+                        processed = process_pdfs(uploaded_files, metadata_list)
+                    else:
+                        processed = [uploaded_files[0].name] if process_pdf(uploaded_files[0], metadata_list[0]) else []
                     
-                    # Process the file and add to uploaded files if successful
-                    if process_pdf(uploaded_file, metadata):
+                    for uploaded_file, metadata in zip(uploaded_files, metadata_list):
+                        if uploaded_file.name not in processed:
+                            continue
                         if uploaded_file.name not in [f['name'] for f in st.session_state.uploaded_files]:
                             st.session_state.uploaded_files.append({
                                 'name': uploaded_file.name,
-                                'payer_name': payer_name,
-                                'year': year,
-                                'line_of_business': line_of_business,
+                                **metadata,
                                 'processed': True
                             })
     
@@ -163,11 +270,9 @@ with col1:
 with col2:
     st.header("Extracted Data")
     
-    # Get all codes when the page loads
-    if not st.session_state.extracted_codes:
-        get_all_codes()
+    storage_version, total_codes = get_storage_version()
     
-    # Filter and sort controls
+    # Search and filter controls; matching and paging happen in the API
     col_search, col_filter = st.columns([2, 1])
     
     with col_search:
@@ -175,33 +280,66 @@ with col2:
     
     with col_filter:
         if st.button("Refresh Data"):
-            get_all_codes()
+            st.cache_data.clear()
+            st.rerun()
     
-    # Create DataFrame from extracted codes
-    if st.session_state.extracted_codes:
-        df = pd.DataFrame(st.session_state.extracted_codes)
-        
-        # Apply search filter if needed
-        if search_term:
-            # Convert all columns to string for searching
-            df_str = df.astype(str)
-            
-            # Check if any column contains the search term
-            mask = df_str.apply(lambda x: x.str.contains(search_term, case=False)).any(axis=1)
-            filtered_df = df[mask]
-        else:
-            filtered_df = df
+    if total_codes:
+        col_payer, col_lob, col_year, col_type, col_category = st.columns(5)
+        with col_payer:
+            payer_filter = st.selectbox("Payer", ["All"] + get_facet_values(storage_version, 'payer_name'))
+        with col_lob:
+            lob_filter = st.selectbox("Line of Business", ["All"] + get_facet_values(storage_version, 'line_of_business'))
+        with col_year:
+            year_filter = st.selectbox("Year", ["All"] + get_facet_values(storage_version, 'year'))
+        with col_type:
+            type_filter = st.selectbox("Code Type", ["All"] + CODE_TYPES)
+        with col_category:
+            category_filter = st.selectbox("Category", ["All"] + sorted(
+                value for value in get_facet_values(storage_version, 'category') if value
+            ))
         
-        # Display results
-        st.write(f"Showing {len(filtered_df)} of {len(df)} codes")
-        st.dataframe(filtered_df, use_container_width=True)
+        # Sorted tuple so equal filters hit the same cache entry
+        filters = tuple(sorted(
+            (field, value) for field, value in (
+                ('payer_name', payer_filter),
+                ('line_of_business', lob_filter),
+                ('year', year_filter),
+                ('code_type', type_filter),
+                ('category', category_filter)
+            ) if value != "All"
+        ))
+        
+        col_page_size, col_page = st.columns([1, 1])
+        with col_page_size:
+            page_size = st.selectbox("Rows per page", PAGE_SIZES, index=1)
+        
+        try:
+            # Fetch the first page to learn how many codes match
+            page = search_codes(storage_version, search_term, filters, 0, page_size)
+            page_count = max((page['total'] + page_size - 1) // page_size, 1)
+            with col_page:
+                page_number = st.number_input("Page", min_value=1, max_value=page_count, value=1, step=1)
+            if page_number > 1:
+                page = search_codes(storage_version, search_term, filters, (page_number - 1) * page_size, page_size)
+        except Exception as e:
+            st.error(f"Error fetching codes: {str(e)}")
+            page = {'codes': [], 'total': 0, 'offset': 0}
+        
+        # Display results; only the visible page is ever downloaded
+        if page['codes']:
+            first = page['offset'] + 1
+            st.write(f"Showing {first}-{first + len(page['codes']) - 1} of {page['total']} matching codes "
+                     f"({total_codes} in total)")
+        else:
+            st.write(f"No matching codes ({total_codes} in total)")
+        st.dataframe(pd.DataFrame(page['codes']), use_container_width=True, hide_index=True)
         
         # Download and upload buttons
         col_download, col_upload = st.columns([1, 1])
         
         with col_download:
             if st.button("Download CSV"):
-                csv_data = download_csv()
+                csv_data = download_csv(filters)
                 if csv_data:
                     st.download_button(
                         label="Download CSV File",
@@ -224,6 +362,9 @@ if st.session_state.get('show_azure_form', False):
         workspace_url = st.text_input("Workspace URL", placeholder="https://adb-xxx.azuredatabricks.net")
         access_token = st.text_input("Access Token", type="password")
         directory_path = st.text_input("Directory Path", placeholder="/FileStore/tables/extracted_codes")
+        compress = st.checkbox("Compress files (gzip)", value=True)
+        full_refresh = st.checkbox("Re-upload all codes", value=False,
+                                   help="Only codes saved since the last upload to this directory are sent unless this is checked")
         
         submit_button = st.form_submit_button("Upload")
         
@@ -234,7 +375,9 @@ if st.session_state.get('show_azure_form', False):
                 connection = {
                     'workspace_url': workspace_url,
                     'access_token': access_token,
-                    'directory_path': directory_path
+                    'directory_path': directory_path,
+                    'compress': compress,
+                    'full_refresh': full_refresh
                 }
                 upload_to_azure(connection)
                 st.session_state.show_azure_form = False
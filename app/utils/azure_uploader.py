@@ -1,70 +1,470 @@
-import requests
+import io
+import csv
+import gzip
 import json
-import pandas as pd
-from io import StringIO
+import time
+import base64
+import random
+import logging
+import tempfile
+import threading
+from datetime import datetime, timezone
+from itertools import takewhile
+from urllib.parse import quote
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+from app.utils.csv_exporter import COLUMN_ORDER, iter_csv_from_codes
+from app.utils.exporters import iter_gzip
+from app.utils.storage import INDEXED_FIELDS
+
+# Setup logging
+logging.basicConfig(level=logging.INFO, 
+                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# DBFS add-block accepts at most 1 MB of data per call (before base64 encoding)
+DBFS_BLOCK_SIZE = 1024 * 1024
+
+# Files uploaded at once; blocks of one file must be added in order
+UPLOAD_PARALLELISM = 4
+
+# Retry policy for throttled or failed DBFS calls
+MAX_RETRIES = 5
+RETRY_BACKOFF = 0.5  # seconds, doubled on each attempt
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+REQUEST_TIMEOUT = 60  # seconds
+
+# Incremental uploads keep a manifest of uploaded part files in the destination directory
+MANIFEST_NAME = '_manifest.json'
+MANIFEST_VERSION = 1
+PARTITION_FIELD = 'year'
+PART_SPOOL_SIZE = 8 * 1024 * 1024  # part file bytes held in memory before spilling to disk
+
+# One pooled session per workspace, shared by every upload to it
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+def get_session(workspace_url):
+    """
+    Get the pooled HTTP session for a workspace, creating it on first use
+    Args:
+        workspace_url: Databricks workspace URL
+    Returns:
+        requests.Session: Session whose connection pool fits UPLOAD_PARALLELISM uploads
+    """
+    with _sessions_lock:
+        session = _sessions.get(workspace_url)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=UPLOAD_PARALLELISM)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            _sessions[workspace_url] = session
+        return session
+
+class DBFSError(Exception):
+    """
+    A DBFS API call failed after all retries
+    """
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+class DBFSClient:
+    """
+    Client for the DBFS streaming upload API
+    Files are written through a handle: create, then add-block for each
+    chunk of at most DBFS_BLOCK_SIZE bytes, then close. Calls are retried
+    with exponential backoff on connection errors and on throttling or
+    server error responses. The handle API has no offsets, so an add-block
+    that reached the server but lost its response is sent again; callers
+    that can't tolerate that should re-upload the file on failure instead.
+    Safe to share between threads.
+    """
+    def __init__(self, workspace_url, access_token, session=None,
+                 max_retries=None, backoff=None, block_size=None):
+        self.workspace_url = workspace_url.rstrip('/')
+        self.session = session or get_session(self.workspace_url)
+        self.headers = {
+            "Authorization": f"Bearer {access_token}",
+            "Content-Type": "application/json"
+        }
+        self.max_retries = MAX_RETRIES if max_retries is None else max_retries
+        self.backoff = RETRY_BACKOFF if backoff is None else backoff
+        self.block_size = block_size or DBFS_BLOCK_SIZE
+    
+    def _post(self, endpoint, payload, metrics=None, method='POST'):
+        """
+        Call a DBFS endpoint, retrying transient failures
+        Args:
+            endpoint: Endpoint name, e.g. 'create'
+            payload: JSON payload (query parameters for GET)
+            metrics: Optional metrics dictionary; 'retries' is incremented
+            method: HTTP method
+        Returns:
+            dict: Decoded JSON response
+        Raises:
+            DBFSError: If the call fails with a permanent error or runs out of retries
+        """
+        url = f"{self.workspace_url}/api/2.0/dbfs/{endpoint}"
+        body = {'params': payload} if method == 'GET' else {'json': payload}
+        
+        for attempt in range(self.max_retries + 1):
+            status_code = None
+            try:
+                response = self.session.request(method, url, headers=self.headers,
+                                                timeout=REQUEST_TIMEOUT, **body)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = f"{endpoint} failed: {str(e)}"
+            else:
+                if response.status_code == 200:
+                    return response.json() if response.content else {}
+                status_code = response.status_code
+                error = f"{endpoint} failed with HTTP {status_code}: {response.text}"
+                if status_code not in RETRY_STATUSES:
+                    raise DBFSError(error, status_code)
+            
+            if attempt == self.max_retries:
+                raise DBFSError(error, status_code)
+            
+            if metrics is not None:
+                metrics['retries'] += 1
+            delay = self.backoff * 2 ** attempt
+            logger.warning(f"{error}; retrying in {delay:.1f}s")
+            time.sleep(delay * random.uniform(0.5, 1.0))
+    
+    def read(self, path):
+        """
+        Read a whole DBFS file
+        Args:
+            path: DBFS file path
+        Returns:
+            bytes: File contents, or None if the file doesn't exist
+        """
+        data = bytearray()
+        while True:
+            try:
+                response = self._post('read', {'path': path, 'offset': len(data), 'length': self.block_size},
+                                      method='GET')
+            except DBFSError as e:
+                if e.status_code == 404:
+                    return None
+                raise
+            if not response.get('bytes_read'):
+                return bytes(data)
+            data += base64.b64decode(response['data'])
+    
+    def delete(self, path):
+        """
+        Delete a DBFS file; deleting a file that doesn't exist is not an error
+        Args:
+            path: DBFS file path
+        """
+        try:
+            self._post('delete', {'path': path, 'recursive': False})
+        except DBFSError as e:
+            if e.status_code != 404:
+                raise
+    
+    def upload(self, path, chunks, overwrite=True):
+        """
+        Upload a stream of data to a DBFS file
+        Args:
+            path: DBFS file path
+            chunks: Iterable of bytes (or str, encoded as UTF-8) of any size
+            overwrite: Replace the file if it exists
+        Returns:
+            dict: Metrics - 'path', 'bytes' (file size), 'bytes_sent' (request
+                payload bytes), 'blocks', 'retries', 'seconds' and 'mb_per_second'
+        """
+        metrics = {'path': path, 'bytes': 0, 'bytes_sent': 0, 'blocks': 0, 'retries': 0}
+        start = time.perf_counter()
+        
+        handle = self._post('create', {'path': path, 'overwrite': overwrite}, metrics)['handle']
+        
+        for block in self._blocks(chunks):
+            data = base64.b64encode(block).decode('ascii')
+            self._post('add-block', {'handle': handle, 'data': data}, metrics)
+            metrics['bytes'] += len(block)
+            metrics['bytes_sent'] += len(data)
+            metrics['blocks'] += 1
+        
+        self._post('close', {'handle': handle}, metrics)
+        
+        metrics['seconds'] = time.perf_counter() - start
+        metrics['mb_per_second'] = metrics['bytes'] / 2**20 / metrics['seconds'] if metrics['seconds'] else 0.0
+        logger.info(f"Uploaded {metrics['bytes']} bytes to {path} in {metrics['blocks']} blocks "
+                    f"({metrics['mb_per_second']:.1f} MB/s, {metrics['retries']} retries)")
+        return metrics
+    
+    def _blocks(self, chunks):
+        """
+        Regroup a stream of chunks into blocks of exactly block_size bytes
+        (the last one may be shorter)
+        """
+        buffer = bytearray()
+        for chunk in chunks:
+            buffer += chunk.encode('utf-8') if isinstance(chunk, str) else chunk
+            while len(buffer) >= self.block_size:
+                yield bytes(buffer[:self.block_size])
+                del buffer[:self.block_size]
+        if buffer:
+            yield bytes(buffer)
+    
+    def upload_files(self, files, overwrite=True, max_workers=UPLOAD_PARALLELISM):
+        """
+        Upload several files, up to max_workers at a time
+        Args:
+            files: List of (path, chunks) tuples
+            overwrite: Replace files that exist
+            max_workers: Maximum number of files uploaded at once
+        Returns:
+            list: Metrics dictionary for each file, in the order given
+        Raises:
+            DBFSError: If any upload fails (the others still run to completion)
+        """
+        if len(files) <= 1 or max_workers <= 1:
+            return [self.upload(path, chunks, overwrite) for path, chunks in files]
+        
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(files))) as executor:
+            futures = [executor.submit(self.upload, path, chunks, overwrite) for path, chunks in files]
+            return [future.result() for future in futures]
+
+def summarize_metrics(file_metrics, seconds):
+    """
+    Combine per-file upload metrics
+    Args:
+        file_metrics: List of metrics dictionaries from DBFSClient.upload
+        seconds: Wall-clock time of the whole upload
+    Returns:
+        dict: Totals of 'files', 'bytes', 'bytes_sent', 'blocks' and 'retries',
+            plus 'seconds' and 'mb_per_second'
+    """
+    summary = {
+        'files': len(file_metrics),
+        'bytes': sum(metrics['bytes'] for metrics in file_metrics),
+        'bytes_sent': sum(metrics['bytes_sent'] for metrics in file_metrics),
+        'blocks': sum(metrics['blocks'] for metrics in file_metrics),
+        'retries': sum(metrics['retries'] for metrics in file_metrics),
+        'seconds': round(seconds, 3)
+    }
+    summary['mb_per_second'] = round(summary['bytes'] / 2**20 / seconds, 2) if seconds else 0.0
+    return summary
 
 def upload_to_azure_databricks(codes, connection):
     """
     Upload extracted codes to Azure Databricks
+    The codes are written as CSV and streamed to DBFS in blocks, so neither
+    the CSV nor its base64 encoding is ever held in memory as a whole.
     Args:
-        codes: List of dictionaries containing extracted codes
+        codes: Iterable of dictionaries containing extracted codes
         connection: Dictionary containing Azure Databricks connection details
-            (workspace_url, access_token, directory_path)
+            (workspace_url, access_token, directory_path, and optionally
+            compress to upload gzip-compressed CSV)
     Returns:
-        dict: Result of the upload operation
+        dict: Result of the upload operation, with upload metrics on success
     """
-    if not codes:
-        return {"success": False, "message": "No codes to upload"}
-    
     try:
-        # Convert codes to DataFrame
-        df = pd.DataFrame(codes)
+        client = DBFSClient(connection['workspace_url'], connection['access_token'])
         
-        # Convert DataFrame to CSV string
-        csv_buffer = StringIO()
-        df.to_csv(csv_buffer, index=False)
-        csv_string = csv_buffer.getvalue()
+        chunks = iter_csv_from_codes(codes)
+        file_path = f"{connection['directory_path'].rstrip('/')}/extracted_codes.csv"
+        if connection.get('compress'):
+            chunks = iter_gzip(chunks)
+            file_path += '.gz'
         
-        # Prepare the API endpoint
-        api_url = f"{connection['workspace_url']}/api/2.0/dbfs/put"
+        start = time.perf_counter()
+        file_metrics = client.upload_files([(file_path, chunks)])
         
-        # Prepare the headers
-        headers = {
-            "Authorization": f"Bearer {connection['access_token']}",
-            "Content-Type": "application/json"
+        return {
+            "success": True,
+            "message": f"Codes successfully uploaded to Azure Databricks at {file_path}",
+            "metrics": summarize_metrics(file_metrics, time.perf_counter() - start)
         }
+    
+    except DBFSError as e:
+        return {
+            "success": False,
+            "message": f"Failed to upload to Azure Databricks: {str(e)}"
+        }
+    
+    except Exception as e:
+        return {
+            "success": False,
+            "message": f"Error uploading to Azure Databricks: {str(e)}"
+        }
+
+def _load_manifest(client, manifest_path):
+    """
+    Read an incremental upload manifest, or None if the destination has none
+    """
+    data = client.read(manifest_path)
+    if data is None:
+        return None
+    manifest = json.loads(data)
+    if manifest.get('version') != MANIFEST_VERSION:
+        logger.warning(f"Ignoring manifest {manifest_path} with unknown version {manifest.get('version')}")
+        return None
+    return manifest
+
+def _spool_partitions(codes, partition_field, compress):
+    """
+    Write codes as one CSV file per partition value, in a single pass
+    Files are spooled in memory and spill to disk once they pass PART_SPOOL_SIZE.
+    Args:
+        codes: Iterable of code dictionaries, in id order
+        partition_field: Field whose value selects the file
+        compress: Gzip-compress the files
+    Returns:
+        dict: Partition value -> dict with the open spool 'file' (positioned
+            at the start), 'rows', 'first_id' and 'last_id'
+    """
+    partitions = {}
+    for code in codes:
+        value = code.get(partition_field)
+        part = partitions.get(value)
+        if part is None:
+            spool = tempfile.SpooledTemporaryFile(max_size=PART_SPOOL_SIZE)
+            stream = gzip.GzipFile(fileobj=spool, mode='wb', mtime=0) if compress else spool
+            text = io.TextIOWrapper(stream, encoding='utf-8', newline='')
+            writer = csv.writer(text, lineterminator='\n')
+            writer.writerow(COLUMN_ORDER)
+            part = partitions[value] = {
+                'file': spool, 'stream': stream, 'text': text, 'writer': writer,
+                'rows': 0, 'first_id': code['id']
+            }
+        part['writer'].writerow([code.get(column, '') for column in COLUMN_ORDER])
+        part['rows'] += 1
+        part['last_id'] = code['id']
+    
+    for part in partitions.values():
+        part['text'].flush()
+        part['text'].detach()
+        if compress:
+            part['stream'].close()
+        part['file'].seek(0)
+        del part['stream'], part['text'], part['writer']
+    return partitions
+
+def upload_new_codes(storage, connection):
+    """
+    Upload the codes saved since the last upload to the same destination
+    The destination directory holds part files partitioned Hive-style by
+    partition_field (e.g. year=2024/part-0000000001-0000004200.csv) and a
+    manifest listing every part along with the high-water mark: the largest
+    storage id uploaded so far. Each call only uploads codes above the mark,
+    so the cost is proportional to new data; reading every part in the
+    manifest gives the full set. When storage has been cleared (a new
+    storage generation), or the partitioning, format or exported columns
+    change, the destination is rebuilt from scratch and the old parts are
+    deleted.
+    The manifest is only rewritten after all new parts are uploaded, and
+    part names are derived from their id range, so a failed upload is
+    simply repeated by the next call.
+    Args:
+        storage: Storage backend to upload from
+        connection: Dictionary containing Azure Databricks connection details
+            (workspace_url, access_token, directory_path, and optionally
+            compress, partition_by and full_refresh)
+    Returns:
+        dict: Result of the upload operation, with the number of 'rows'
+            uploaded, the new 'high_water_mark' and upload metrics on success
+    """
+    try:
+        partition_field = connection.get('partition_by') or PARTITION_FIELD
+        if partition_field not in INDEXED_FIELDS:
+            return {"success": False, "message": f"Cannot partition by {partition_field}"}
+        extension = 'csv.gz' if connection.get('compress') else 'csv'
         
-        # Prepare the file path in DBFS
-        file_path = f"{connection['directory_path']}/extracted_codes.csv"
+        client = DBFSClient(connection['workspace_url'], connection['access_token'])
+        directory = connection['directory_path'].rstrip('/')
+        manifest_path = f"{directory}/{MANIFEST_NAME}"
         
-        # Prepare the request payload
-        payload = {
-            "path": file_path,
-            "contents": csv_string,
-            "overwrite": True
-        }
+        generation = storage.get_generation()
+        last_id = storage.get_last_id()
+        manifest = _load_manifest(client, manifest_path)
         
-        # Make the API request
-        response = requests.post(
-            api_url,
-            headers=headers,
-            data=json.dumps(payload)
-        )
+        stale_paths = []
+        if (manifest is None or connection.get('full_refresh') or
+                (manifest['generation'], manifest['partition_by'], manifest['format'], manifest.get('columns')) !=
+                (generation, partition_field, extension, COLUMN_ORDER)):
+            stale_paths = [part['path'] for part in manifest['parts']] if manifest else []
+            manifest = {
+                'version': MANIFEST_VERSION,
+                'generation': generation,
+                'partition_by': partition_field,
+                'format': extension,
+                'columns': COLUMN_ORDER,
+                'high_water_mark': 0,
+                'parts': []
+            }
         
-        # Check if the request was successful
-        if response.status_code == 200:
+        high_water_mark = manifest['high_water_mark']
+        if last_id <= high_water_mark and not stale_paths:
             return {
                 "success": True,
-                "message": f"Codes successfully uploaded to Azure Databricks at {file_path}"
-            }
-        else:
-            return {
-                "success": False,
-                "message": f"Failed to upload to Azure Databricks: {response.text}"
+                "message": f"Azure Databricks at {directory} is already up to date",
+                "rows": 0,
+                "high_water_mark": high_water_mark,
+                "metrics": summarize_metrics([], 0)
             }
+        
+        start = time.perf_counter()
+        new_codes = takewhile(lambda code: code['id'] <= last_id, storage.iter_codes(after_id=high_water_mark))
+        partitions = _spool_partitions(new_codes, partition_field, extension == 'csv.gz')
+        
+        try:
+            files = []
+            for value, part in partitions.items():
+                folder = '__HIVE_DEFAULT_PARTITION__' if value is None else quote(str(value), safe='')
+                part['path'] = (f"{directory}/{partition_field}={folder}/"
+                                f"part-{part['first_id']:010d}-{part['last_id']:010d}.{extension}")
+                files.append((part['path'], iter(lambda spool=part['file']: spool.read(client.block_size), b'')))
+            
+            file_metrics = client.upload_files(files)
+        finally:
+            for part in partitions.values():
+                part['file'].close()
+        
+        uploaded_at = datetime.now(timezone.utc).isoformat()
+        for (value, part), metrics in zip(partitions.items(), file_metrics):
+            manifest['parts'].append({
+                'path': part['path'],
+                'partition': value,
+                'first_id': part['first_id'],
+                'last_id': part['last_id'],
+                'rows': part['rows'],
+                'bytes': metrics['bytes'],
+                'uploaded_at': uploaded_at
+            })
+        manifest['high_water_mark'] = last_id
+        client.upload(manifest_path, [json.dumps(manifest, indent=2)])
+        
+        # Old parts go only once the new manifest no longer lists them
+        current_paths = {part['path'] for part in manifest['parts']}
+        for path in stale_paths:
+            if path not in current_paths:
+                client.delete(path)
+        
+        rows = sum(part['rows'] for part in partitions.values())
+        return {
+            "success": True,
+            "message": f"Uploaded {rows} new codes to Azure Databricks at {directory} in {len(partitions)} files",
+            "rows": rows,
+            "high_water_mark": last_id,
+            "metrics": summarize_metrics(file_metrics, time.perf_counter() - start)
+        }
+    
+    except DBFSError as e:
+        return {
+            "success": False,
+            "message": f"Failed to upload to Azure Databricks: {str(e)}"
+        }
     
     except Exception as e:
         return {
             "success": False,
             "message": f"Error uploading to Azure Databricks: {str(e)}"
-        }
\ No newline at end of file
+        }
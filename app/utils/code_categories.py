@@ -0,0 +1,98 @@
+from bisect import bisect_right
+from app.utils.code_ranges import code_sort_key
+
+# Code ranges with their category and description, as in server/code-lookup.ts.
+# Where ranges overlap the one listed first wins, like the TypeScript lookup.
+CODE_RANGES = [
+    # CPT Code Ranges
+    ('00100', '01999', 'Anesthesia', 'Anesthesia for surgical procedures'),
+    ('10021', '69990', 'Surgery', 'Surgical procedures across body systems'),
+    ('70010', '79999', 'Radiology', 'Diagnostic imaging and radiation oncology services'),
+    ('80047', '89398', 'Pathology and Laboratory', 'Lab tests including blood panels and cytopathology'),
+    ('90281', '99607', 'Medicine', 'Medical services such as immunology, psychiatry, dialysis'),
+    ('99202', '99499', 'Evaluation and Management', 'Office visits, hospital care, consultations'),
+    ('0001U', '0389U', 'PLA (Proprietary Lab Analyses)', 'Lab tests assigned to specific manufacturers'),
+    ('99091', '99499', 'E/M (Misc)', 'Additional evaluation and management services'),
+    
+    # HCPCS Code Ranges (Level II)
+    ('A0000', 'A0999', 'Transportation Services', 'Ambulance and non-emergency transport'),
+    ('B0000', 'B9999', 'Enteral and Parenteral Therapy', 'Nutritional therapy and equipment'),
+    ('C0000', 'C9999', 'Temporary Codes', 'Temporary outpatient hospital codes (CMS)'),
+    ('D0000', 'D9999', 'Dental Procedures', 'Dental services and procedures'),
+    ('E0000', 'E9999', 'Durable Medical Equipment', 'Wheelchairs, prosthetics, oxygen equipment'),
+    ('G0000', 'G9999', 'Procedures & Professional Services', 'CMS-assigned codes for Medicare services'),
+    ('H0000', 'H9999', 'Behavioral Health', 'Mental health, substance abuse treatment'),
+    ('J0000', 'J9999', 'Drugs (Injectable)', 'Drugs administered other than oral method'),
+    ('K0000', 'K9999', 'Temporary Codes', 'Temporary DME codes not covered elsewhere'),
+    ('L0000', 'L9999', 'Orthotics and Prosthetics', 'Braces, artificial limbs'),
+    ('M0000', 'M9999', 'Medical Services', 'Therapy, assessments, and testing'),
+    ('P0000', 'P9999', 'Pathology and Lab', 'Clinical diagnostic lab services'),
+    ('Q0000', 'Q9999', 'Temporary Codes', 'CMS-assigned temporary codes'),
+    ('R0000', 'R9999', 'Diagnostic Radiology', 'Radiopharmaceutical imaging and testing'),
+    ('S0000', 'S9999', 'Private Payer Codes', 'HCPCS codes used by commercial payers'),
+    ('T0000', 'T9999', 'State Medicaid Codes', 'Medicaid-specific services and supplies'),
+    ('V0000', 'V9999', 'Vision and Hearing', 'Eyeglasses, hearing aids, lenses')
+]
+
+class CategoryTable:
+    """
+    Category lookup compiled from overlapping code ranges
+    The ranges are flattened once into disjoint segments over code_sort_key
+    values, each holding the category of the first listed range covering
+    it (or none), so a lookup is a single binary search however many
+    ranges there are.
+    """
+    def __init__(self, ranges=CODE_RANGES):
+        """
+        Args:
+            ranges: List of (first code, last code, category, description) tuples
+        """
+        bounds = [(code_sort_key(start), code_sort_key(end), (category, description))
+                  for start, end, category, description in ranges]
+        
+        # Every range start and every point just past a range end opens a segment
+        points = sorted({start for start, _, _ in bounds} | {end + 1 for _, end, _ in bounds})
+        self.starts = []
+        self.entries = []
+        for point in points:
+            entry = next((entry for start, end, entry in bounds if start <= point <= end), None)
+            # Merge neighbouring segments of the same range
+            if self.entries and self.entries[-1] is entry:
+                continue
+            self.starts.append(point)
+            self.entries.append(entry)
+    
+    def lookup(self, code):
+        """
+        Get the category of a code
+        Args:
+            code: CPT, HCPCS or PLA code
+        Returns:
+            tuple: (category, description), or None if no range holds the code
+        """
+        key = code_sort_key(code)
+        if key is None:
+            return None
+        index = bisect_right(self.starts, key) - 1
+        return self.entries[index] if index >= 0 else None
+
+# Compiled once for the process
+category_table = CategoryTable()
+
+def enrich_codes(codes):
+    """
+    Add the category of each code in a batch, in place
+    Codes that already have a 'category' are left alone. Codes outside
+    every range get empty values. A code range is categorized by its first code.
+    Args:
+        codes: List of code dictionaries
+    Returns:
+        list: The same codes, with 'category' and 'category_description'
+    """
+    lookup = category_table.lookup
+    for code in codes:
+        if 'category' in code:
+            continue
+        entry = lookup(code.get('code'))
+        code['category'], code['category_description'] = entry if entry else ('', '')
+    return codes
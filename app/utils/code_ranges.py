@@ -0,0 +1,149 @@
+from bisect import bisect_right
+
+# Offsets that keep the code types apart on one integer scale: CPT codes
+# map to themselves, PLA codes follow and HCPCS codes come last
+PLA_KEY_OFFSET = 100000
+HCPCS_KEY_OFFSET = 200000
+
+def code_sort_key(code):
+    """
+    Map a CPT, HCPCS or PLA code to an integer
+    Keys order codes the same way as comparing the codes of one type, and
+    codes of different types never fall between each other, so a range of
+    CPT codes can't cover a PLA code.
+    Args:
+        code: 5-character code, e.g. '99213', 'J1234' or '0001U'
+    Returns:
+        int: Sort key, or None if the value is not a code
+    """
+    if not isinstance(code, str) or len(code) != 5 or not code[1:4].isdigit():
+        return None
+    
+    head, tail = code[0], code[4]
+    if head.isdigit():
+        if tail == 'U':
+            return PLA_KEY_OFFSET + int(code[:4])
+        return int(code) if tail.isdigit() else None
+    if 'A' <= head <= 'Z' and tail.isdigit():
+        return HCPCS_KEY_OFFSET + (ord(head) - ord('A')) * 10000 + int(code[1:])
+    return None
+
+class _CenterNode:
+    """
+    Node of a centered interval tree: the intervals containing its center,
+    sorted both ways, and subtrees for the intervals wholly below and above it
+    """
+    __slots__ = ('center', 'starts', 'by_start', 'neg_ends', 'by_end', 'below', 'above')
+
+class IntervalIndex:
+    """
+    Static index of closed integer intervals, answering which of them
+    contain a point
+    The intervals form a centered interval tree. Each node takes the median
+    endpoint of its intervals as its center and keeps the intervals
+    containing the center twice, sorted by start and by end; the rest go to
+    the subtree below or above the center, each with at most half of them.
+    A lookup follows one path of O(log n) nodes, and at each node the
+    intervals holding the point are a prefix of one of the sorted lists,
+    found with a bisect. Finding the k matches takes O(log n + k) however
+    the intervals nest, so a catch-all range such as J0000-J9999 costs one
+    more match and nothing else.
+    """
+    def __init__(self, intervals=()):
+        """
+        Args:
+            intervals: Iterable of (start, end, value) tuples
+        """
+        entries = list(intervals)
+        self._size = len(entries)
+        self._root = self._build(entries)
+    
+    def __len__(self):
+        return self._size
+    
+    @staticmethod
+    def _build(entries):
+        """
+        Build the tree of a list of (start, end, value) tuples
+        Returns:
+            _CenterNode: Root node, or None for no intervals
+        """
+        root = None
+        # (entries, parent, attribute) still to build; avoids deep recursion
+        pending = [(entries, None, None)]
+        while pending:
+            entries, parent, side = pending.pop()
+            if not entries:
+                continue
+            
+            endpoints = sorted(point for entry in entries for point in entry[:2])
+            center = endpoints[len(endpoints) // 2]
+            below, above, overlapping = [], [], []
+            for entry in entries:
+                if entry[1] < center:
+                    below.append(entry)
+                elif entry[0] > center:
+                    above.append(entry)
+                else:
+                    overlapping.append(entry)
+            
+            node = _CenterNode()
+            node.center = center
+            overlapping.sort(key=lambda entry: entry[0])
+            node.starts = [entry[0] for entry in overlapping]
+            node.by_start = [entry[2] for entry in overlapping]
+            # Negated ends keep the by-end list ascending for bisect
+            overlapping.sort(key=lambda entry: -entry[1])
+            node.neg_ends = [-entry[1] for entry in overlapping]
+            node.by_end = [entry[2] for entry in overlapping]
+            node.below = node.above = None
+            
+            if parent is None:
+                root = node
+            else:
+                setattr(parent, side, node)
+            pending.append((below, node, 'below'))
+            pending.append((above, node, 'above'))
+        return root
+    
+    def covers(self, point):
+        """
+        Check whether any interval contains a point
+        """
+        node = self._root
+        while node is not None:
+            if point < node.center:
+                if node.starts and node.starts[0] <= point:
+                    return True
+                node = node.below
+            elif point > node.center:
+                if node.neg_ends and node.neg_ends[0] <= -point:
+                    return True
+                node = node.above
+            else:
+                return True
+        return False
+    
+    def find(self, point):
+        """
+        Get the values of the intervals containing a point
+        Args:
+            point: Point to look up
+        Returns:
+            list: Values of the matching intervals, in no particular order
+        """
+        found = []
+        node = self._root
+        while node is not None:
+            if point < node.center:
+                if node.starts and node.starts[0] <= point:
+                    found.extend(node.by_start[:bisect_right(node.starts, point)])
+                node = node.below
+            elif point > node.center:
+                if node.neg_ends and node.neg_ends[0] <= -point:
+                    found.extend(node.by_end[:bisect_right(node.neg_ends, -point)])
+                node = node.above
+            else:
+                found.extend(node.by_start)
+                break
+        return found
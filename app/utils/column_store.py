@@ -0,0 +1,279 @@
+from array import array
+
+# Marks a field that a row doesn't have; always stored at dictionary index 0
+_MISSING = object()
+
+# Array typecodes from narrowest to widest with the largest index each holds
+_TYPECODES = (('B', 0xFF), ('H', 0xFFFF), ('I', 0xFFFFFFFF))
+
+class DictColumn:
+    """
+    Dictionary-encoded column
+    Each distinct value is stored once and rows hold its index in a compact
+    array, which starts one byte wide and widens as distinct values are added.
+    Indexed columns also keep a posting array of row positions per value.
+    """
+    def __init__(self, row_count=0, indexed=False):
+        self.values = [_MISSING]
+        self.lookup = {}
+        self.codes = array('B', bytes(row_count))
+        self.postings = {} if indexed else None
+    
+    def code_of(self, value):
+        """
+        Get the dictionary index of a value
+        Args:
+            value: Value to look up
+        Returns:
+            int: Dictionary index, or None if the value was never stored
+        """
+        try:
+            return self.lookup.get(value)
+        except TypeError:
+            return None
+    
+    def append(self, value, position):
+        """
+        Append a value for the row at position
+        Args:
+            value: Value to store; must be hashable
+            position: Row position, used for the posting array
+        Raises:
+            TypeError: If the value is not hashable
+        """
+        code = self.lookup.get(value)
+        if code is None:
+            code = len(self.values)
+            self.lookup[value] = code
+            self.values.append(value)
+            self._widen(code)
+        
+        self.codes.append(code)
+        if self.postings is not None:
+            postings = self.postings.get(code)
+            if postings is None:
+                postings = self.postings[code] = array('I')
+            postings.append(position)
+    
+    def append_missing(self):
+        """
+        Append an empty cell
+        """
+        self.codes.append(0)
+    
+    def value_at(self, position):
+        """
+        Get the value of a row, or _MISSING if the row doesn't have one
+        """
+        return self.values[self.codes[position]]
+    
+    def positions(self, value):
+        """
+        Get the row positions holding a value (indexed columns only)
+        Args:
+            value: Value to look up
+        Returns:
+            array: Row positions in ascending order
+        """
+        code = self.code_of(value)
+        if code is None:
+            return array('I')
+        return self.postings[code]
+    
+    def _widen(self, code):
+        for typecode, max_code in _TYPECODES:
+            if code <= max_code:
+                if array(typecode).itemsize > self.codes.itemsize:
+                    self.codes = array(typecode, self.codes)
+                return
+    
+    def nbytes(self):
+        """
+        Approximate size of the row arrays and posting arrays in bytes
+        """
+        size = self.codes.itemsize * len(self.codes)
+        if self.postings is not None:
+            size += sum(postings.itemsize * len(postings) for postings in self.postings.values())
+        return size
+
+# Share of HashIndex slots that may be in use before the table doubles
+_HASH_LOAD_FACTOR = 0.5
+
+class HashIndex:
+    """
+    Compact hash table from 64-bit hashes to row positions
+    Open addressing with linear probing over an array of entry numbers; the
+    hashes and positions themselves are kept in arrays by entry. An entry
+    costs about 20 bytes, where a dictionary of boxed integers needs over 100.
+    A hash may be added more than once, so keys whose hashes collide are
+    all indexed; callers compare the keys of the rows found.
+    """
+    def __init__(self):
+        self.hashes = array('q')
+        self.positions = array('I')
+        # entry number + 1 per slot, 0 for an empty slot
+        self.slots = array('I', bytes(4 * 8))
+        self.mask = 7
+    
+    def __len__(self):
+        return len(self.hashes)
+    
+    def find(self, key_hash):
+        """
+        Get the positions stored for a hash
+        Args:
+            key_hash: Signed 64-bit hash
+        Returns:
+            list: Row positions, empty if the hash was never added
+        """
+        found = []
+        slot = key_hash & self.mask
+        while True:
+            entry = self.slots[slot]
+            if not entry:
+                return found
+            if self.hashes[entry - 1] == key_hash:
+                found.append(self.positions[entry - 1])
+            slot = (slot + 1) & self.mask
+    
+    def add(self, key_hash, position):
+        """
+        Add a hash and its position
+        Args:
+            key_hash: Signed 64-bit hash
+            position: Row position
+        """
+        self.hashes.append(key_hash)
+        self.positions.append(position)
+        if len(self.hashes) > len(self.slots) * _HASH_LOAD_FACTOR:
+            self._resize(len(self.slots) * 2)
+        else:
+            self._place(len(self.hashes))
+    
+    def _place(self, entry):
+        slot = self.hashes[entry - 1] & self.mask
+        while self.slots[slot]:
+            slot = (slot + 1) & self.mask
+        self.slots[slot] = entry
+    
+    def _resize(self, size):
+        self.slots = array('I', bytes(4 * size))
+        self.mask = size - 1
+        for entry in range(1, len(self.hashes) + 1):
+            self._place(entry)
+    
+    def nbytes(self):
+        """
+        Size of the index arrays in bytes
+        """
+        return 8 * len(self.hashes) + 4 * len(self.positions) + 4 * len(self.slots)
+
+class ColumnStore:
+    """
+    Columnar row storage
+    Every field gets a dictionary-encoded column the first time it appears,
+    so repeated values such as payer names are held once per store instead
+    of once per row. Ids are kept in an array. Rows are only materialized
+    as dictionaries when they are read. Values that can't be dictionary
+    encoded (lists, dicts) are kept per row in a sparse side table.
+    """
+    def __init__(self, indexed_fields=()):
+        self.indexed_fields = set(indexed_fields)
+        self.ids = array('I')
+        self.columns = {field: DictColumn(indexed=True) for field in indexed_fields}
+        self.extras = {}
+    
+    def __len__(self):
+        return len(self.ids)
+    
+    def append(self, row):
+        """
+        Append a row
+        Args:
+            row: Dictionary with an integer 'id' and any other fields
+        Returns:
+            int: Position of the new row
+        """
+        position = len(self.ids)
+        
+        for field, value in row.items():
+            if field == 'id' or field in self.columns:
+                continue
+            self.columns[field] = DictColumn(position, indexed=field in self.indexed_fields)
+        
+        for field, column in self.columns.items():
+            value = row.get(field, _MISSING)
+            if value is _MISSING:
+                column.append_missing()
+                continue
+            try:
+                column.append(value, position)
+            except TypeError:
+                column.append_missing()
+                self.extras.setdefault(position, {})[field] = value
+        
+        self.ids.append(row['id'])
+        return position
+    
+    def row(self, position):
+        """
+        Materialize a row as a dictionary
+        Args:
+            position: Row position
+        Returns:
+            dict: Row fields with 'id' last
+        """
+        row = {}
+        for field, column in self.columns.items():
+            value = column.values[column.codes[position]]
+            if value is not _MISSING:
+                row[field] = value
+        if position in self.extras:
+            row.update(self.extras[position])
+        row['id'] = self.ids[position]
+        return row
+    
+    def rows(self, positions):
+        """
+        Materialize several rows
+        Args:
+            positions: Iterable of row positions
+        Returns:
+            list: List of row dictionaries
+        """
+        return [self.row(position) for position in positions]
+    
+    def column(self, field):
+        """
+        Get the column of a field, or None if no row has had that field
+        """
+        return self.columns.get(field)
+    
+    def positions(self, field, value):
+        """
+        Get the positions of rows whose indexed field equals value
+        Args:
+            field: Indexed field name
+            value: Value to look up
+        Returns:
+            array: Row positions in ascending order
+        """
+        return self.columns[field].positions(value)
+    
+    def distinct_values(self, field):
+        """
+        Get the distinct values stored in a field
+        Args:
+            field: Field name
+        Returns:
+            list: Distinct values in order of first appearance
+        """
+        column = self.columns.get(field)
+        return column.values[1:] if column else []
+    
+    def nbytes(self):
+        """
+        Approximate size of the row and posting arrays in bytes (dictionary
+        values are not included)
+        """
+        return self.ids.itemsize * len(self.ids) + sum(column.nbytes() for column in self.columns.values())
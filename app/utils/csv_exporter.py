@@ -1,5 +1,6 @@
 import pandas as pd
 import io
+import csv
 import logging
 
 # Setup logging
@@ -7,6 +8,23 @@ logging.basicConfig(level=logging.INFO,
                     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Column order for exported files
+COLUMN_ORDER = [
+    'code', 
+    'range_end', 
+    'code_type', 
+    'payer_name', 
+    'line_of_business', 
+    'year', 
+    'source_file',
+    'description',
+    'category',
+    'category_description'
+]
+
+# Approximate size of the chunks yielded by iter_csv_from_codes
+CSV_CHUNK_SIZE = 64 * 1024
+
 def generate_csv_from_codes(codes):
     """
     Generate CSV content from extracted codes
@@ -22,14 +40,7 @@ def generate_csv_from_codes(codes):
         df = pd.DataFrame(codes)
         
         # Reorder columns for better readability
-        column_order = [
-            'code', 
-            'code_type', 
-            'payer_name', 
-            'line_of_business', 
-            'year', 
-            'source_file'
-        ]
+        column_order = COLUMN_ORDER
         
         # Add any missing columns with empty values
         for col in column_order:
@@ -48,4 +59,31 @@ def generate_csv_from_codes(codes):
     
     except Exception as e:
         logger.error(f"Error generating CSV: {str(e)}")
-        raise Exception(f"Failed to generate CSV: {str(e)}")
\ No newline at end of file
+        raise Exception(f"Failed to generate CSV: {str(e)}")
+
+def iter_csv_from_codes(codes, chunk_size=CSV_CHUNK_SIZE):
+    """
+    Generate CSV content from extracted codes incrementally
+    Produces the same output as generate_csv_from_codes without building a
+    DataFrame, so memory stays flat however many codes there are.
+    Args:
+        codes: Iterable of dictionaries containing extracted codes
+        chunk_size: Approximate number of characters per yielded chunk
+    Yields:
+        str: Consecutive chunks of CSV content, starting with the header
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    writer.writerow(COLUMN_ORDER)
+    
+    count = 0
+    for code in codes:
+        writer.writerow([code.get(column, '') for column in COLUMN_ORDER])
+        count += 1
+        if buffer.tell() >= chunk_size:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    
+    yield buffer.getvalue()
+    logger.info(f"Streamed CSV for {count} codes")
\ No newline at end of file
@@ -0,0 +1,166 @@
+import io
+import json
+import zlib
+import logging
+from app.utils.csv_exporter import iter_csv_from_codes
+
+# Setup logging
+logging.basicConfig(level=logging.INFO, 
+                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Columns written to Parquet files; string columns are dictionary encoded
+PARQUET_STRING_COLUMNS = ['code', 'range_end', 'code_type', 'payer_name', 'line_of_business', 'source_file', 'description',
+                          'category', 'category_description']
+PARQUET_INT_COLUMNS = ['year', 'page']
+
+# Rows per Parquet row group
+PARQUET_ROW_GROUP_SIZE = 64 * 1024
+
+# Lines per chunk yielded by iter_ndjson_from_codes
+NDJSON_CHUNK_LINES = 500
+
+def iter_gzip(chunks, level=6):
+    """
+    Gzip-compress a stream of chunks
+    Args:
+        chunks: Iterable of str or bytes chunks; str is encoded as UTF-8
+        level: zlib compression level
+    Yields:
+        bytes: Consecutive chunks of a single gzip member
+    """
+    # wbits=31 selects the gzip container rather than raw zlib
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode('utf-8')
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+def iter_ndjson_from_codes(codes, chunk_lines=NDJSON_CHUNK_LINES):
+    """
+    Generate newline-delimited JSON from extracted codes, one object per line
+    Args:
+        codes: Iterable of dictionaries containing extracted codes
+        chunk_lines: Number of lines per yielded chunk
+    Yields:
+        str: Consecutive chunks of NDJSON content
+    """
+    lines = []
+    for code in codes:
+        lines.append(json.dumps(code, default=str))
+        if len(lines) >= chunk_lines:
+            lines.append('')
+            yield '\n'.join(lines)
+            lines = []
+    if lines:
+        lines.append('')
+        yield '\n'.join(lines)
+
+class _StreamSink(io.RawIOBase):
+    """
+    Write-only file that hands written bytes back to a generator
+    ParquetWriter needs a file object that knows its position; this one
+    keeps the position but only holds the bytes written since the last drain.
+    """
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+    
+    def writable(self):
+        return True
+    
+    def write(self, data):
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+    
+    def tell(self):
+        return self._position
+    
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+def _int_or_none(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+def iter_parquet_from_codes(codes, row_group_size=PARQUET_ROW_GROUP_SIZE):
+    """
+    Generate a Parquet file from extracted codes
+    String columns are written dictionary encoded, so a payer name repeated
+    over thousands of rows is stored once per row group. Rows are buffered
+    one row group at a time. Requires pyarrow, which is checked when this is
+    called rather than when the first chunk is requested.
+    Args:
+        codes: Iterable of dictionaries containing extracted codes
+        row_group_size: Number of rows per row group
+    Returns:
+        generator: Yields consecutive bytes chunks of the Parquet file
+    Raises:
+        RuntimeError: If pyarrow is not installed
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Parquet export requires pyarrow")
+    
+    category = pa.dictionary(pa.int32(), pa.string())
+    schema = pa.schema(
+        [(column, category) for column in PARQUET_STRING_COLUMNS] +
+        [(column, pa.int32()) for column in PARQUET_INT_COLUMNS]
+    )
+    
+    def to_table(columns):
+        arrays = [
+            pa.array(columns[column], pa.string()).dictionary_encode()
+            for column in PARQUET_STRING_COLUMNS
+        ] + [
+            pa.array(columns[column], pa.int32())
+            for column in PARQUET_INT_COLUMNS
+        ]
+        return pa.Table.from_arrays(arrays, schema=schema)
+    
+    def generate():
+        sink = _StreamSink()
+        writer = pq.ParquetWriter(sink, schema, compression='snappy')
+        columns = {column: [] for column in schema.names}
+        row_count = 0
+        
+        for code in codes:
+            for column in PARQUET_STRING_COLUMNS:
+                value = code.get(column)
+                columns[column].append(None if value is None else str(value))
+            for column in PARQUET_INT_COLUMNS:
+                columns[column].append(_int_or_none(code.get(column)))
+            row_count += 1
+            
+            if row_count % row_group_size == 0:
+                writer.write_table(to_table(columns))
+                columns = {column: [] for column in schema.names}
+                yield sink.drain()
+        
+        if row_count % row_group_size:
+            writer.write_table(to_table(columns))
+        writer.close()
+        yield sink.drain()
+        logger.info(f"Streamed Parquet for {row_count} codes")
+    
+    return generate()
+
+# Export formats, also used as file extensions: name -> (chunk generator factory, mimetype)
+EXPORT_FORMATS = {
+    'csv': (iter_csv_from_codes, 'text/csv'),
+    'csv.gz': (lambda codes: iter_gzip(iter_csv_from_codes(codes)), 'application/gzip'),
+    'ndjson': (iter_ndjson_from_codes, 'application/x-ndjson'),
+    'ndjson.gz': (lambda codes: iter_gzip(iter_ndjson_from_codes(codes)), 'application/gzip'),
+    'parquet': (iter_parquet_from_codes, 'application/vnd.apache.parquet'),
+}
@@ -0,0 +1,209 @@
+import os
+import json
+import hashlib
+import threading
+import logging
+from collections import OrderedDict
+
+# Setup logging
+logging.basicConfig(level=logging.INFO, 
+                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Per-upload fields that are stripped before caching and reapplied on a hit
+METADATA_FIELDS = ('payer_name', 'year', 'line_of_business', 'source_file')
+
+# Bump whenever the extraction output changes so stale entries are not reused
+CACHE_VERSION = 4
+
+class ExtractionCache:
+    """
+    Cache of extracted codes keyed by a hash of the PDF file bytes
+    Entries hold the codes without upload metadata. There is a bounded
+    in-memory LRU tier and an optional on-disk tier that survives restarts.
+    """
+    def __init__(self, max_entries=64, cache_dir=None):
+        self.max_entries = max_entries
+        self.cache_dir = cache_dir
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+    
+    def configure(self, max_entries=None, cache_dir=None):
+        """
+        Update cache settings
+        Args:
+            max_entries: Maximum number of documents kept in memory
+            cache_dir: Directory for the on-disk tier, or None to disable it
+        """
+        with self._lock:
+            if max_entries is not None:
+                self.max_entries = max_entries
+                self._evict()
+            self.cache_dir = cache_dir
+        
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+    
+    @staticmethod
+    def key_for(file_bytes, variant=None):
+        """
+        Get the cache key for PDF file content
+        Args:
+            file_bytes: PDF file content as bytes
+            variant: Name of an extraction mode whose output differs from
+                the default, so its entries are kept apart
+        Returns:
+            str: Cache key
+        """
+        prefix = f"v{CACHE_VERSION}-{variant}" if variant else f"v{CACHE_VERSION}"
+        return f"{prefix}-{hashlib.sha256(file_bytes).hexdigest()}"
+    
+    def get(self, key, file_size=0):
+        """
+        Look up the cached codes for a document
+        Args:
+            key: Cache key from key_for
+            file_size: Size of the document in bytes, counted as saved on a hit
+        Returns:
+            list: Cached codes without metadata, or None on a miss
+        """
+        with self._lock:
+            codes = self._entries.get(key)
+            if codes is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                self.bytes_saved += file_size
+                return codes
+        
+        codes = self._read_from_disk(key)
+        
+        with self._lock:
+            if codes is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.disk_hits += 1
+            self.bytes_saved += file_size
+            self._entries[key] = codes
+            self._evict()
+        
+        return codes
+    
+    def put(self, key, codes):
+        """
+        Store the codes extracted from a document
+        Args:
+            key: Cache key from key_for
+            codes: List of code dictionaries; metadata fields are stripped
+        """
+        codes = strip_metadata(codes)
+        
+        with self._lock:
+            self._entries[key] = codes
+            self._entries.move_to_end(key)
+            self._evict()
+        
+        self._write_to_disk(key, codes)
+    
+    def clear(self):
+        """
+        Clear the in-memory tier and reset counters (the disk tier is kept)
+        """
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.disk_hits = 0
+            self.misses = 0
+            self.bytes_saved = 0
+    
+    def stats(self):
+        """
+        Get cache counters
+        Returns:
+            dict: Hit/miss counters and cache size
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'bytes_saved': self.bytes_saved,
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'disk_enabled': bool(self.cache_dir)
+            }
+    
+    def _evict(self):
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+    
+    def _disk_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+    
+    def _read_from_disk(self, key):
+        if not self.cache_dir:
+            return None
+        
+        try:
+            with open(self._disk_path(key), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable cache entry {key}: {str(e)}")
+            return None
+    
+    def _write_to_disk(self, key, codes):
+        if not self.cache_dir:
+            return
+        
+        path = self._disk_path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(codes, f)
+            # Atomic rename so concurrent readers never see a partial file
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logger.warning(f"Could not write cache entry {key}: {str(e)}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+def strip_metadata(codes):
+    """
+    Remove upload metadata from extracted codes
+    Args:
+        codes: List of dictionaries containing extracted codes with metadata
+    Returns:
+        list: List of dictionaries without the metadata fields
+    """
+    return [
+        {key: value for key, value in code.items() if key not in METADATA_FIELDS}
+        for code in codes
+    ]
+
+def apply_metadata(codes, metadata):
+    """
+    Attach upload metadata to cached codes
+    Args:
+        codes: List of dictionaries without metadata
+        metadata: Dictionary containing payer_name, year, line_of_business, and source_file
+    Returns:
+        list: List of dictionaries containing the codes with metadata
+    """
+    fields = {
+        'payer_name': metadata['payer_name'],
+        'year': metadata['year'],
+        'line_of_business': metadata['line_of_business'],
+        'source_file': metadata.get('source_file', 'Unknown')
+    }
+    return [{**code, **fields} for code in codes]
+
+# Create a singleton instance of the cache
+extraction_cache = ExtractionCache()
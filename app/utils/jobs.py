@@ -0,0 +1,305 @@
+import time
+import uuid
+import threading
+import logging
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+# Setup logging
+logging.basicConfig(level=logging.INFO, 
+                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+FINISHED_STATUSES = (SUCCEEDED, FAILED, CANCELLED)
+
+class JobCancelled(Exception):
+    """
+    Raised inside a running job when cancellation was requested
+    """
+
+class Job:
+    """
+    A unit of background work with progress reporting
+    """
+    def __init__(self, func, tenant, description=''):
+        self.id = uuid.uuid4().hex
+        self.func = func
+        self.tenant = tenant
+        self.description = description
+        self.status = QUEUED
+        self.pages_done = 0
+        self.pages_total = 0
+        self.result = None
+        # Whether the result was handed out or dropped to free memory
+        self.result_released = False
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._cancel_requested = threading.Event()
+    
+    @property
+    def cancel_requested(self):
+        return self._cancel_requested.is_set()
+    
+    def check_cancelled(self):
+        """
+        Stop the job if cancellation was requested
+        Raises:
+            JobCancelled: If the job was cancelled
+        """
+        if self._cancel_requested.is_set():
+            raise JobCancelled(f"Job {self.id} was cancelled")
+    
+    def report_progress(self, pages_done, pages_total):
+        """
+        Record progress; also the point where a running job notices cancellation
+        Args:
+            pages_done: Number of pages processed so far
+            pages_total: Total number of pages
+        """
+        self.pages_done = pages_done
+        self.pages_total = pages_total
+        self.check_cancelled()
+    
+    def to_dict(self):
+        """
+        Get the job status without its result
+        Returns:
+            dict: Job status and progress
+        """
+        return {
+            'job_id': self.id,
+            'tenant': self.tenant,
+            'description': self.description,
+            'status': self.status,
+            'pages_done': self.pages_done,
+            'pages_total': self.pages_total,
+            'error': self.error,
+            'result_available': self.status == SUCCEEDED and not self.result_released,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at
+        }
+
+class JobManager:
+    """
+    Bounded worker pool for background jobs with per-tenant fairness
+    At most max_workers jobs run at once and each tenant may hold at most
+    max_per_tenant of those slots. Queued jobs are dispatched round-robin
+    across tenants, so one tenant's backlog cannot starve the others.
+    The status of the last max_finished finished jobs is kept, but results
+    can be large: a result is dropped once it has been taken, and only the
+    last max_results unclaimed results are kept.
+    """
+    def __init__(self, max_workers=4, max_per_tenant=2, max_finished=500, max_results=20):
+        self.max_workers = max_workers
+        self.max_per_tenant = max_per_tenant
+        self.max_finished = max_finished
+        self.max_results = max_results
+        self._jobs = {}
+        self._finished = deque()
+        # Ids of finished jobs still holding their result, oldest first
+        self._results = deque()
+        # tenant -> queue of job ids waiting for a slot
+        self._queues = OrderedDict()
+        self._running = 0
+        self._running_by_tenant = {}
+        self._executor = None
+        self._lock = threading.Lock()
+    
+    def configure(self, max_workers=None, max_per_tenant=None, max_results=None):
+        """
+        Update concurrency limits
+        Args:
+            max_workers: Maximum number of jobs running at once
+            max_per_tenant: Maximum number of running jobs per tenant
+            max_results: Maximum number of unclaimed results kept
+        """
+        with self._lock:
+            if max_results is not None:
+                self.max_results = max_results
+            if max_workers is not None and max_workers != self.max_workers:
+                self.max_workers = max_workers
+                if self._executor is not None:
+                    self._executor.shutdown(wait=False)
+                    self._executor = None
+            if max_per_tenant is not None:
+                self.max_per_tenant = max_per_tenant
+            self._dispatch()
+    
+    def submit(self, func, tenant='default', description=''):
+        """
+        Queue a job
+        Args:
+            func: Callable taking the Job; its return value becomes the result
+            tenant: Tenant the job is accounted to
+            description: Human readable description
+        Returns:
+            Job: The queued job
+        """
+        job = Job(func, tenant, description)
+        
+        with self._lock:
+            self._jobs[job.id] = job
+            self._queues.setdefault(tenant, deque()).append(job.id)
+            self._dispatch()
+        
+        return job
+    
+    def get(self, job_id):
+        """
+        Get a job by id
+        Args:
+            job_id: Job id
+        Returns:
+            Job: The job, or None if unknown
+        """
+        return self._jobs.get(job_id)
+    
+    def take_result(self, job_id):
+        """
+        Get the result of a succeeded job and release it
+        Args:
+            job_id: Job id
+        Returns:
+            tuple: (job, result); job is None if unknown and result is None
+                if the job hasn't succeeded or its result was already released
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.status != SUCCEEDED or job.result_released:
+                return job, None
+            
+            result = job.result
+            job.result = None
+            job.result_released = True
+            self._results.remove(job_id)
+            return job, result
+    
+    def list_jobs(self, tenant=None):
+        """
+        Get known jobs, oldest first
+        Args:
+            tenant: Only return jobs of this tenant
+        Returns:
+            list: List of Job objects
+        """
+        with self._lock:
+            jobs = list(self._jobs.values())
+        
+        if tenant is not None:
+            jobs = [job for job in jobs if job.tenant == tenant]
+        return sorted(jobs, key=lambda job: job.created_at)
+    
+    def cancel(self, job_id):
+        """
+        Cancel a job
+        Queued jobs are cancelled immediately; running jobs stop at their
+        next progress report.
+        Args:
+            job_id: Job id
+        Returns:
+            Job: The job, or None if unknown
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.status in FINISHED_STATUSES:
+                return job
+            
+            job._cancel_requested.set()
+            if job.status == QUEUED:
+                queue = self._queues.get(job.tenant)
+                if queue is not None and job_id in queue:
+                    queue.remove(job_id)
+                    if not queue:
+                        del self._queues[job.tenant]
+                self._finish(job, CANCELLED)
+        
+        return job
+    
+    def _next_job(self):
+        """
+        Pick the next queued job from the first tenant with a free slot
+        """
+        for tenant in list(self._queues):
+            if self._running_by_tenant.get(tenant, 0) >= self.max_per_tenant:
+                continue
+            queue = self._queues.pop(tenant)
+            job_id = queue.popleft()
+            if queue:
+                # Re-append so the tenant goes to the back of the rotation
+                self._queues[tenant] = queue
+            return self._jobs[job_id]
+        return None
+    
+    def _dispatch(self):
+        """
+        Start queued jobs while there are free slots (called with the lock held)
+        """
+        while self._running < self.max_workers:
+            job = self._next_job()
+            if job is None:
+                break
+            
+            job.status = RUNNING
+            job.started_at = time.time()
+            self._running += 1
+            self._running_by_tenant[job.tenant] = self._running_by_tenant.get(job.tenant, 0) + 1
+            
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                    thread_name_prefix='job')
+            self._executor.submit(self._run, job)
+    
+    def _run(self, job):
+        status = SUCCEEDED
+        try:
+            job.check_cancelled()
+            job.result = job.func(job)
+        except JobCancelled:
+            status = CANCELLED
+        except Exception as e:
+            logger.error(f"Job {job.id} failed: {str(e)}")
+            job.error = str(e)
+            status = FAILED
+        
+        with self._lock:
+            self._running -= 1
+            self._running_by_tenant[job.tenant] -= 1
+            if not self._running_by_tenant[job.tenant]:
+                del self._running_by_tenant[job.tenant]
+            self._finish(job, status)
+            self._dispatch()
+    
+    def _finish(self, job, status):
+        """
+        Mark a job finished and drop the oldest finished jobs beyond the limit
+        (called with the lock held)
+        """
+        job.status = status
+        job.finished_at = time.time()
+        job.func = None
+        self._finished.append(job.id)
+        if status == SUCCEEDED:
+            self._results.append(job.id)
+        
+        while len(self._results) > self.max_results:
+            expired = self._jobs[self._results.popleft()]
+            expired.result = None
+            expired.result_released = True
+        
+        while len(self._finished) > self.max_finished:
+            job_id = self._finished.popleft()
+            if job_id in self._results:
+                self._results.remove(job_id)
+            self._jobs.pop(job_id, None)
+
+# Create a singleton instance of the job manager
+job_manager = JobManager()
@@ -0,0 +1,273 @@
+import os
+import re
+import time
+import uuid
+import cProfile
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# Histogram bucket upper bounds in seconds
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs += [f'{name}="{_escape(value)}"' for name, value in extra]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    """
+    Monotonically increasing value per label combination
+    """
+    kind = 'counter'
+    
+    def __init__(self, name, documentation, label_names=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._values = {}
+        self._lock = threading.Lock()
+    
+    def inc(self, amount=1, **labels):
+        """
+        Add to the counter
+        Args:
+            amount: Non-negative amount to add
+            **labels: Value of every label name
+        """
+        key = tuple(labels[name] for name in self.label_names)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+    
+    def collect(self):
+        with self._lock:
+            values = dict(self._values)
+        return [
+            f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"
+            for key, value in sorted(values.items())
+        ]
+
+class Histogram:
+    """
+    Distribution of observed values per label combination, in cumulative buckets
+    """
+    kind = 'histogram'
+    
+    def __init__(self, name, documentation, label_names=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [count per bucket (last is +Inf), sum]
+        self._values = {}
+        self._lock = threading.Lock()
+    
+    def observe(self, value, **labels):
+        """
+        Record an observation
+        Args:
+            value: Observed value, e.g. seconds
+            **labels: Value of every label name
+        """
+        key = tuple(labels[name] for name in self.label_names)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+    
+    def collect(self):
+        with self._lock:
+            values = {key: (list(counts), total) for key, (counts, total) in self._values.items()}
+        
+        lines = []
+        for key, (counts, total) in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                labels = _format_labels(self.label_names, key, (('le', _format_value(bound)),))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.label_names, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+class Callback:
+    """
+    Metric whose values are read when metrics are rendered, such as storage size
+    """
+    def __init__(self, name, documentation, kind, read, label_names=()):
+        self.name = name
+        self.documentation = documentation
+        self.kind = kind
+        self.label_names = tuple(label_names)
+        self._read = read
+    
+    def collect(self):
+        values = self._read()
+        if not isinstance(values, dict):
+            values = {(): values}
+        return [
+            f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"
+            for key, value in sorted(values.items())
+        ]
+
+class MetricsRegistry:
+    """
+    Set of metrics rendered together in the Prometheus text format
+    """
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+    
+    def _register(self, metric):
+        with self._lock:
+            # Registering the same name again returns the existing metric,
+            # so modules can be reloaded
+            return self._metrics.setdefault(metric.name, metric)
+    
+    def counter(self, name, documentation, label_names=()):
+        return self._register(Counter(name, documentation, label_names))
+    
+    def histogram(self, name, documentation, label_names=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, documentation, label_names, buckets))
+    
+    def callback(self, name, documentation, read, kind='gauge', label_names=()):
+        """
+        Register a metric read from a function when metrics are rendered
+        Args:
+            name: Metric name
+            documentation: Help text
+            read: Function returning a number, or a dictionary of numbers keyed
+                by tuples of label values
+            kind: Prometheus metric type, 'gauge' or 'counter'
+            label_names: Label names matching the keys returned by read
+        """
+        with self._lock:
+            self._metrics[name] = Callback(name, documentation, kind, read, label_names)
+    
+    def render(self):
+        """
+        Render every metric in the Prometheus text exposition format
+        Returns:
+            str: Metrics text
+        """
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda metric: metric.name)
+        
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.collect())
+        return '\n'.join(lines) + '\n'
+
+# Metrics for this process
+metrics = MetricsRegistry()
+
+STAGE_SECONDS = metrics.histogram(
+    'prior_extractor_stage_seconds', 'Time spent in each processing stage', ('stage',)
+)
+PAGES = metrics.counter(
+    'prior_extractor_pages_total', 'PDF pages extracted, by the engine that read them', ('engine',)
+)
+DOCUMENTS = metrics.counter(
+    'prior_extractor_documents_total', 'PDF documents processed, by how their codes were obtained', ('source',)
+)
+DOCUMENT_BYTES = metrics.counter(
+    'prior_extractor_document_bytes_total', 'Bytes of PDF documents processed', ('source',)
+)
+CODES_SAVED = metrics.counter(
+    'prior_extractor_codes_saved_total', 'Codes saved to storage'
+)
+REQUEST_SECONDS = metrics.histogram(
+    'prior_extractor_request_seconds', 'HTTP request latency until the response is returned',
+    ('method', 'endpoint', 'status')
+)
+
+@contextmanager
+def span(stage):
+    """
+    Time a block of code as a processing stage
+    Costs two clock reads and one histogram update, so it is cheap enough
+    for per-request and per-document stages (not per page or per code).
+    Args:
+        stage: Stage name, used as the 'stage' label
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - started, stage=stage)
+
+class RequestProfiler:
+    """
+    Optional cProfile capture of individual requests
+    Only one request is profiled at a time, since cProfile hooks the whole
+    interpreter; other requests asking for a profile run unprofiled.
+    """
+    def __init__(self):
+        self.enabled = False
+        self.output_dir = None
+        self._lock = threading.Lock()
+    
+    def configure(self, enabled=False, output_dir=None):
+        """
+        Args:
+            enabled: Whether requests may ask to be profiled
+            output_dir: Directory receiving one .prof file per profiled request
+        """
+        self.enabled = enabled
+        self.output_dir = output_dir
+        if enabled and output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+    
+    def start(self):
+        """
+        Start profiling the current request
+        Returns:
+            cProfile.Profile: Running profiler, or None if profiling is disabled
+            or another request is being profiled
+        """
+        if not self.enabled or not self._lock.acquire(blocking=False):
+            return None
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Another profiling tool is already active
+            self._lock.release()
+            return None
+        return profiler
+    
+    def stop(self, profiler, name):
+        """
+        Stop a profiler returned by start and write its statistics
+        Args:
+            profiler: Running profiler
+            name: Label for the output file, e.g. the endpoint
+        Returns:
+            str: Path of the written .prof file
+        """
+        try:
+            profiler.disable()
+        finally:
+            self._lock.release()
+        
+        safe_name = re.sub(r'[^\w.-]+', '_', name).strip('_') or 'request'
+        path = os.path.join(self.output_dir, f"{time.strftime('%Y%m%d-%H%M%S')}-{safe_name}-{uuid.uuid4().hex[:8]}.prof")
+        profiler.dump_stats(path)
+        return path
+
+# Profiler for requests sent with ?profile=1, once enabled
+request_profiler = RequestProfiler()
@@ -1,56 +1,907 @@
 import io
+import os
 import re
+import time
+import atexit
+import tempfile
+import threading
+import multiprocessing
+from bisect import bisect_right
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 import pdfplumber
+from pdfplumber import utils
 from PyPDF2 import PdfReader
 import sys
 import logging
+from app.utils.extraction_cache import extraction_cache, apply_metadata, strip_metadata
+from app.utils.metrics import PAGES, DOCUMENTS, DOCUMENT_BYTES, STAGE_SECONDS
+from app.utils.code_categories import enrich_codes
 
 # Setup logging
 logging.basicConfig(level=logging.INFO, 
                     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-def extract_text_from_pdf(pdf_file_content):
+# Page-sharded extraction settings. Documents with more pages than the
+# threshold are split into shards and extracted across a process pool.
+PARALLEL_PAGE_THRESHOLD = int(os.environ.get('PDF_PARALLEL_PAGE_THRESHOLD', 50))
+PAGES_PER_SHARD = int(os.environ.get('PDF_PAGES_PER_SHARD', 25))
+PAGE_POOL_WORKERS = int(os.environ.get('PDF_PAGE_WORKERS', os.cpu_count() or 1))
+
+# Extraction strategy: 'adaptive' probes each document and uses PyPDF2 when
+# it reads the document the same way pdfplumber does, 'pdfplumber' always
+# starts with pdfplumber, 'pypdf2' always starts with PyPDF2. Whenever
+# PyPDF2 is used, pages whose text looks wrong are re-read with pdfplumber.
+# 'tables' reads with pdfplumber and also takes code descriptions from the
+# code tables on each page.
+EXTRACTION_STRATEGIES = ('adaptive', 'pdfplumber', 'pypdf2', 'tables')
+EXTRACTION_STRATEGY = os.environ.get('PDF_EXTRACTION_STRATEGY', 'adaptive').lower()
+# Pages compared between the two engines when probing a document
+PROBE_PAGES = int(os.environ.get('PDF_PROBE_PAGES', 3))
+
+_page_pool = None
+_page_pool_lock = threading.Lock()
+
+def get_page_pool():
     """
-    Extract text content from a PDF file
+    Get the process pool used for page-sharded extraction
+    The pool is created on first use and lives for the whole process, so
+    it is not respawned for every request.
+    Returns:
+        ProcessPoolExecutor: Shared extraction pool
+    """
+    global _page_pool
+    
+    with _page_pool_lock:
+        if _page_pool is None:
+            # Spawned workers don't inherit locks held by the server's threads
+            _page_pool = ProcessPoolExecutor(
+                max_workers=PAGE_POOL_WORKERS,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+            logger.info(f"Started page extraction pool with {PAGE_POOL_WORKERS} workers")
+        return _page_pool
+
+def shutdown_page_pool():
+    """
+    Shut down the shared page extraction pool if it was started
+    """
+    global _page_pool
+    
+    with _page_pool_lock:
+        if _page_pool is not None:
+            _page_pool.shutdown(wait=False, cancel_futures=True)
+            _page_pool = None
+
+atexit.register(shutdown_page_pool)
+
+def _extract_page_range(pdf_path, start, end):
+    """
+    Extract text from a range of pages with pdfplumber (runs in a pool worker)
     Args:
-        pdf_file_content: PDF file content as bytes or BytesIO object
+        pdf_path: Path of the PDF file
+        start: Index of the first page to extract
+        end: Index one past the last page to extract
     Returns:
-        str: Extracted text content
+        list: Text of each page in the range, in page order
     """
-    logger.info("Starting text extraction from PDF")
+    texts = []
     
-    if isinstance(pdf_file_content, bytes):
-        pdf_file_content = io.BytesIO(pdf_file_content)
+    with pdfplumber.open(pdf_path) as pdf:
+        for page in pdf.pages[start:end]:
+            texts.append(page.extract_text() or "")
+            page.close()
+    
+    return texts
+
+def _iter_pages_parallel(pdf_bytes, page_count, start_index=0):
+    """
+    Extract pages by fanning page shards across the shared pool
+    The document is written to a temporary file once and each shard gets
+    its path, so the file content isn't sent to a worker for every shard.
+    Only a bounded number of shards is in flight at a time, so memory
+    doesn't grow with the page count.
+    Args:
+        pdf_bytes: PDF file content as bytes
+        page_count: Number of pages in the document
+        start_index: Index of the first page to extract
+    Yields:
+        tuple: (page_number, text) for each page, in page order
+    """
+    pool = get_page_pool()
+    max_in_flight = PAGE_POOL_WORKERS * 2
+    pending = deque()
+    next_start = start_index
     
-    all_text = ""
+    logger.info(f"Extracting {page_count} pages in shards of {PAGES_PER_SHARD}")
+    
+    with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as pdf_file:
+        pdf_file.write(pdf_bytes)
     
-    # First try with pdfplumber which handles most PDFs well
     try:
-        with pdfplumber.open(pdf_file_content) as pdf:
-            for page in pdf.pages:
-                text = page.extract_text() or ""
-                all_text += text + "\n\n"
+        while next_start < page_count or pending:
+            while next_start < page_count and len(pending) < max_in_flight:
+                end = min(next_start + PAGES_PER_SHARD, page_count)
+                pending.append((next_start, pool.submit(_extract_page_range, pdf_file.name, next_start, end)))
+                next_start = end
+            
+            shard_start, future = pending.popleft()
+            for offset, text in enumerate(future.result()):
+                yield shard_start + offset + 1, text
+    finally:
+        for _, future in pending:
+            future.cancel()
+        # Workers still reading keep their open handle; their results are discarded
+        os.unlink(pdf_file.name)
+
+def _iter_pdfplumber_pages(pdf_file_content, parallel=None, start_index=0):
+    """
+    Extract pages with pdfplumber, page-sharded across the pool for large documents
+    Args:
+        pdf_file_content: PDF file content as a BytesIO object
+        parallel: Force page-sharded extraction on (True) or off (False)
+        start_index: Index of the first page to extract
+    Yields:
+        tuple: (page_number, page_count, text) for each page, in page order
+    """
+    with pdfplumber.open(pdf_file_content) as pdf:
+        page_count = len(pdf.pages)
+        if parallel is None:
+            parallel = page_count - start_index > PARALLEL_PAGE_THRESHOLD and PAGE_POOL_WORKERS > 1
         
-        if all_text.strip():
-            logger.info("Successfully extracted text with pdfplumber")
-            return all_text
+        next_index = start_index
+        if parallel:
+            shards = _iter_pages_parallel(pdf_file_content.getvalue(), page_count, start_index)
+            while True:
+                try:
+                    page_number, text = next(shards)
+                except StopIteration:
+                    break
+                except Exception as e:
+                    logger.warning(f"Parallel extraction failed, continuing serially: {str(e)}")
+                    if isinstance(e, BrokenProcessPool):
+                        # Let the next request start a fresh pool
+                        shutdown_page_pool()
+                    break
+                next_index = page_number
+                yield page_number, page_count, text
+        
+        for index in range(next_index, page_count):
+            page = pdf.pages[index]
+            text = page.extract_text() or ""
+            page.close()
+            yield index + 1, page_count, text
+
+def _iter_pypdf2_pages(pdf_file_content, start_index=0):
+    """
+    Extract pages with PyPDF2
+    Args:
+        pdf_file_content: PDF file content as a BytesIO object
+        start_index: Index of the first page to extract
+    Yields:
+        tuple: (page_number, page_count, text) for each page, in page order
+    """
+    pdf_file_content.seek(0)  # Reset file pointer
+    reader = PdfReader(pdf_file_content)
+    page_count = len(reader.pages)
+    for index in range(start_index, page_count):
+        yield index + 1, page_count, reader.pages[index].extract_text() or ""
+
+# Code-shaped tokens glued to neighbouring word characters, e.g.
+# "9921399214" or "99213Office". PyPDF2 produces these when it misses the
+# gap between table cells, and CODE_PATTERN can't find codes inside them.
+SUSPECT_PATTERN = re.compile(r'\b[\dA-Z]\d{3}[\dU]\w|\w[\dA-Z]\d{3}[\dU]\b')
+
+def needs_escalation(text):
+    """
+    Check whether PyPDF2 text of a page should be re-read with pdfplumber
+    Args:
+        text: Page text extracted by PyPDF2
+    Returns:
+        bool: True if the page has no text or contains glued code-like tokens
+    """
+    return not text.strip() or SUSPECT_PATTERN.search(text) is not None
+
+def _has_unmapped_fonts(page):
+    """
+    Check whether a PyPDF2 page uses fonts whose text PyPDF2 can't decode
+    reliably: Type 3 fonts and composite fonts without a ToUnicode map
+    """
+    resources = page.get('/Resources')
+    fonts = resources.get_object().get('/Font') if resources is not None else None
+    if fonts is None:
+        return False
+    for font in fonts.get_object().values():
+        font = font.get_object()
+        subtype = font.get('/Subtype')
+        if subtype == '/Type3' or (subtype == '/Type0' and '/ToUnicode' not in font):
+            return True
+    return False
+
+def choose_extractor(pdf_file_content):
+    """
+    Probe a document to pick the cheapest extractor that yields the same codes
+    PyPDF2 is many times faster than pdfplumber but reads some layouts
+    differently. It is chosen when a few sample pages spread through the
+    document use fonts it can decode and give exactly the same codes, in
+    the same order, as pdfplumber.
+    Args:
+        pdf_file_content: PDF file content as a BytesIO object
+    Returns:
+        tuple: ('pypdf2' or 'pdfplumber', reason for the choice)
+    """
+    try:
+        pdf_file_content.seek(0)
+        reader = PdfReader(pdf_file_content)
+        page_count = len(reader.pages)
+        if page_count <= PROBE_PAGES:
+            return 'pdfplumber', 'short document'
+        
+        sample = sorted({index * (page_count - 1) // (PROBE_PAGES - 1) for index in range(PROBE_PAGES)})
+        if any(_has_unmapped_fonts(reader.pages[index]) for index in sample):
+            return 'pdfplumber', 'fonts without a text mapping'
+        
+        found_text = False
+        # pdfplumber gets its own file object so the two parsers don't share a position
+        with pdfplumber.open(io.BytesIO(pdf_file_content.getvalue())) as pdf:
+            for index in sample:
+                fast_text = reader.pages[index].extract_text() or ""
+                page = pdf.pages[index]
+                layout_text = page.extract_text() or ""
+                page.close()
+                if scan_codes(fast_text) != scan_codes(layout_text):
+                    return 'pdfplumber', f'engines disagree on page {index + 1}'
+                found_text = found_text or bool(fast_text.strip())
+        
+        if not found_text:
+            return 'pdfplumber', 'no text on sample pages'
+        return 'pypdf2', 'engines agree on sample pages'
+    
     except Exception as e:
-        logger.warning(f"Error extracting text with pdfplumber: {str(e)}")
+        return 'pdfplumber', f'probe failed: {str(e)}'
+
+def _iter_pdfplumber_first(pdf_file_content, pages):
+    """
+    Extract pages with pdfplumber, falling back to PyPDF2
+    If pdfplumber fails part way, PyPDF2 picks up from the failed page; if
+    it finds no text at all, PyPDF2 re-reads every page.
+    Args:
+        pdf_file_content: PDF file content as a BytesIO object
+        pages: pdfplumber page iterator yielding (page_number, page_count, text)
+    Yields:
+        tuple: (page_number, page_count, text, engine) for each page
+    """
+    pages_done = 0
+    found_text = False
+    
+    while True:
+        try:
+            page_number, page_count, text = next(pages)
+        except StopIteration:
+            if found_text:
+                logger.info("Successfully extracted text with pdfplumber")
+                return
+            pages_done = 0
+            break
+        except Exception as e:
+            logger.warning(f"Error extracting text with pdfplumber: {str(e)}")
+            break
+        pages_done = page_number
+        found_text = found_text or bool(text.strip())
+        yield page_number, page_count, text, 'pdfplumber'
     
     # Fallback to PyPDF2 if pdfplumber fails
+    for page_number, page_count, text in _iter_pypdf2_pages(pdf_file_content, pages_done):
+        yield page_number, page_count, text, 'pypdf2'
+    
+    logger.info("Successfully extracted text with PyPDF2")
+
+def _iter_pypdf2_first(pdf_file_content, escalated_pages):
+    """
+    Extract pages with PyPDF2, re-reading suspicious pages with pdfplumber
+    If PyPDF2 fails on a page, pdfplumber extracts the rest of the document.
+    Args:
+        pdf_file_content: PDF file content as a BytesIO object
+        escalated_pages: List that the numbers of re-read pages are appended to
+    Yields:
+        tuple: (page_number, page_count, text, engine) for each page
+    """
+    pdf_file_content.seek(0)
+    reader = PdfReader(pdf_file_content)
+    page_count = len(reader.pages)
+    layout_pdf = None
+    
     try:
-        pdf_file_content.seek(0)  # Reset file pointer
-        reader = PdfReader(pdf_file_content)
-        for page in reader.pages:
+        for index in range(page_count):
+            try:
+                text = reader.pages[index].extract_text() or ""
+            except Exception as e:
+                logger.warning(f"Error extracting page {index + 1} with PyPDF2, continuing with pdfplumber: {str(e)}")
+                pages = _iter_pdfplumber_pages(io.BytesIO(pdf_file_content.getvalue()), start_index=index)
+                for page_number, _, text in pages:
+                    yield page_number, page_count, text, 'pdfplumber'
+                return
+            
+            if not needs_escalation(text):
+                yield index + 1, page_count, text, 'pypdf2'
+                continue
+            
+            if layout_pdf is None:
+                layout_pdf = pdfplumber.open(io.BytesIO(pdf_file_content.getvalue()))
+            page = layout_pdf.pages[index]
             text = page.extract_text() or ""
-            all_text += text + "\n\n"
+            page.close()
+            escalated_pages.append(index + 1)
+            yield index + 1, page_count, text, 'pdfplumber'
+    finally:
+        if layout_pdf is not None:
+            layout_pdf.close()
+
+def iter_pdf_pages(pdf_file_content, parallel=None, progress=None, strategy=None, report=None,
+                   descriptions=None, layout_key=None):
+    """
+    Extract text from a PDF file one page at a time
+    The extraction strategy decides which engine reads the document (see
+    EXTRACTION_STRATEGY). With pdfplumber first, PyPDF2 takes over if
+    pdfplumber fails or finds no text. With PyPDF2 first, pages whose text
+    looks wrong are re-read with pdfplumber. The 'tables' strategy reads
+    pages one after another, since each page reuses the table layout
+    found on the pages before it.
+    Args:
+        pdf_file_content: PDF file content as bytes or BytesIO object
+        parallel: Force page-sharded pdfplumber extraction on (True) or off (False).
+            By default it is used for documents above PARALLEL_PAGE_THRESHOLD pages.
+        progress: Optional callable taking (pages_done, page_count), called
+            before each page is yielded. Exceptions it raises stop extraction.
+        strategy: One of EXTRACTION_STRATEGIES; defaults to EXTRACTION_STRATEGY
+        report: Optional dictionary filled in with the 'strategy', the chosen
+            'engine' and the 'reason', 'pages_by_engine', 'seconds_by_engine',
+            'escalated_pages', 'probe_seconds' and 'seconds' spent extracting
+            (including the probe).
+            The 'tables' strategy also fills in 'table_pages', the number of
+            pages descriptions were read from, and the final 'table_layout'.
+        descriptions: Optional dictionary that the 'tables' strategy adds
+            range_key -> description pairs to; the first description of a code wins
+        layout_key: Key of the table layout to start from, normally the payer
+            name, since documents from the same payer share a layout
+    Yields:
+        tuple: (page_number, text) for each page, in page order
+    """
+    if isinstance(pdf_file_content, bytes):
+        pdf_file_content = io.BytesIO(pdf_file_content)
+    
+    strategy = (strategy or EXTRACTION_STRATEGY).lower()
+    if strategy not in EXTRACTION_STRATEGIES:
+        raise ValueError(f"Unknown extraction strategy: {strategy}")
+    
+    if report is None:
+        report = {}
+    report.update({
+        'strategy': strategy,
+        'engine': strategy,
+        'reason': 'configured',
+        'pages_by_engine': {},
+        'seconds_by_engine': {},
+        'escalated_pages': [],
+        'probe_seconds': 0.0,
+        'seconds': 0.0
+    })
+    
+    if strategy == 'adaptive':
+        started = time.perf_counter()
+        report['engine'], report['reason'] = choose_extractor(pdf_file_content)
+        report['probe_seconds'] = report['seconds'] = time.perf_counter() - started
+        logger.info(f"Extracting with {report['engine']}: {report['reason']}")
+    
+    if report['engine'] == 'pypdf2':
+        pages = _iter_pypdf2_first(pdf_file_content, report['escalated_pages'])
+    elif strategy == 'tables':
+        report['engine'] = 'pdfplumber'
+        report.update({'table_pages': 0, 'table_layout': table_layouts.get(layout_key)})
+        table_pages = _iter_table_pages(
+            pdf_file_content, {} if descriptions is None else descriptions, layout_key, report
+        )
+        pages = _iter_pdfplumber_first(pdf_file_content, table_pages)
+    else:
+        pages = _iter_pdfplumber_first(pdf_file_content, _iter_pdfplumber_pages(pdf_file_content, parallel))
+    
+    # Only the extraction step is guarded and timed, so errors raised by the
+    # consumer of this generator are not mistaken for extraction failures
+    while True:
+        started = time.perf_counter()
+        try:
+            page_number, page_count, text, engine = next(pages)
+        except StopIteration:
+            break
+        except Exception as e:
+            logger.error(f"Error extracting text from PDF: {str(e)}")
+            raise Exception(f"Failed to extract text from PDF: {str(e)}")
+        finally:
+            elapsed = time.perf_counter() - started
+            report['seconds'] += elapsed
         
-        logger.info("Successfully extracted text with PyPDF2")
-        return all_text
-    except Exception as e:
-        logger.error(f"Error extracting text with PyPDF2: {str(e)}")
-        raise Exception(f"Failed to extract text from PDF: {str(e)}")
+        report['pages_by_engine'][engine] = report['pages_by_engine'].get(engine, 0) + 1
+        report['seconds_by_engine'][engine] = report['seconds_by_engine'].get(engine, 0.0) + elapsed
+        if progress:
+            progress(page_number, page_count)
+        yield page_number, text
+    
+    if report['escalated_pages']:
+        logger.info(f"Re-read {len(report['escalated_pages'])} pages with pdfplumber")
+
+def extract_text_from_pdf(pdf_file_content, parallel=None, strategy=None):
+    """
+    Extract text content from a PDF file
+    Args:
+        pdf_file_content: PDF file content as bytes or BytesIO object
+        parallel: Force page-sharded extraction on (True) or off (False).
+            By default it is used for documents above PARALLEL_PAGE_THRESHOLD pages.
+        strategy: One of EXTRACTION_STRATEGIES; defaults to EXTRACTION_STRATEGY
+    Returns:
+        str: Extracted text content
+    """
+    logger.info("Starting text extraction from PDF")
+    
+    pages = iter_pdf_pages(pdf_file_content, parallel, strategy=strategy)
+    return "".join(text + "\n\n" for _, text in pages)
+
+class ExtractionStats:
+    """
+    Running totals of which extraction engine read which pages and how long
+    it took, plus the reports of the most recent documents
+    """
+    def __init__(self, recent=20):
+        self._lock = threading.Lock()
+        self._recent = deque(maxlen=recent)
+        self.documents = {}
+        self.pages = {}
+        self.escalated_pages = 0
+        self.seconds = 0.0
+        self.probe_seconds = 0.0
+    
+    def record(self, report, source_file=None):
+        """
+        Add the report of one extracted document, also to the process metrics
+        Args:
+            report: Report dictionary filled in by iter_pdf_pages, with the
+                'scan_seconds' spent outside extraction if known
+            source_file: Name of the document
+        """
+        for engine, pages in report['pages_by_engine'].items():
+            PAGES.inc(pages, engine=engine)
+        for engine, seconds in report['seconds_by_engine'].items():
+            STAGE_SECONDS.observe(seconds, stage=f'extract_{engine}')
+        if report['probe_seconds']:
+            STAGE_SECONDS.observe(report['probe_seconds'], stage='probe')
+        if 'scan_seconds' in report:
+            STAGE_SECONDS.observe(report['scan_seconds'], stage='scan')
+        
+        with self._lock:
+            self.documents[report['engine']] = self.documents.get(report['engine'], 0) + 1
+            for engine, pages in report['pages_by_engine'].items():
+                self.pages[engine] = self.pages.get(engine, 0) + pages
+            self.escalated_pages += len(report['escalated_pages'])
+            self.seconds += report['seconds']
+            self.probe_seconds += report['probe_seconds']
+            self._recent.append(dict(report, source_file=source_file))
+    
+    def stats(self):
+        """
+        Get extraction counters
+        Returns:
+            dict: Documents per chosen engine, pages per engine that read them,
+                timings and the most recent document reports
+        """
+        with self._lock:
+            return {
+                'strategy': EXTRACTION_STRATEGY,
+                'documents': dict(self.documents),
+                'pages': dict(self.pages),
+                'escalated_pages': self.escalated_pages,
+                'seconds': round(self.seconds, 3),
+                'probe_seconds': round(self.probe_seconds, 3),
+                'recent': list(self._recent)
+            }
+
+# Extraction engine counters for this process
+extraction_stats = ExtractionStats()
+
+# Single-pass scanner for all three code types: CPT codes are 5 digits,
+# HCPCS codes are a letter followed by 4 digits and PLA codes are 4 digits
+# followed by U. The pattern starts with a character class (with the word
+# boundary as a lookbehind) so the regex engine can skip ahead quickly, and
+# matches are classified afterwards. Modifier suffixes such as "-26" are
+# left unconsumed, so a code directly after a hyphen is still found. Two
+# codes joined by a dash, as in "70010-79999" or "J0120 - J9999", are
+# matched together and become a range if they make one (see _match_codes).
+# There are no capture groups, which keeps matching as fast as for single
+# codes: a match longer than a code is a pair, and its first and last five
+# characters are the two codes.
+CODE_PATTERN = re.compile(
+    r'[\dA-Z](?<!\w\w)\d{3}[\dU]\b(?:\s{0,3}[-\u2013\u2014]\s{0,3}[\dA-Z]\d{3}[\dU]\b)?'
+)
+CODE_TYPE_ORDER = {'CPT': 0, 'HCPCS': 1, 'PLA': 2}
+CODE_LENGTH = 5
+# Longest possible match; the regex needs one more character to decide it
+CODE_MATCH_LENGTH = 17
+
+def classify_code(code):
+    """
+    Classify a 5-character token matched by CODE_PATTERN
+    Args:
+        code: Matched token
+    Returns:
+        str: 'CPT', 'HCPCS' or 'PLA', or None if the token is not a valid code
+    """
+    if 'A' <= code[0] <= 'Z':
+        return None if code[-1] == 'U' else 'HCPCS'
+    if code[-1] == 'U':
+        return 'PLA'
+    return 'CPT'
+
+def _match_codes(token):
+    """
+    Turn a CODE_PATTERN match into codes
+    Two codes of the same type in ascending order make a range; otherwise
+    they are read as separate codes, as before ranges were recognized.
+    Args:
+        token: Matched text, a code or two codes joined by a dash
+    Returns:
+        list: (code, code_type, range_end) tuples; range_end is None for single codes
+    """
+    start = token[:CODE_LENGTH]
+    start_type = classify_code(start)
+    if len(token) == CODE_LENGTH:
+        return [(start, start_type, None)] if start_type else []
+    
+    end = token[-CODE_LENGTH:]
+    end_type = classify_code(end)
+    if start_type and start_type == end_type and start < end:
+        return [(start, start_type, end)]
+    return [(code, code_type, None) for code, code_type in ((start, start_type), (end, end_type)) if code_type]
+
+def range_key(code, range_end=None):
+    """
+    Get the key a code or code range is deduplicated by, e.g. '99213' or '70010-79999'
+    """
+    return code if range_end is None else f"{code}-{range_end}"
+
+def scan_codes(text):
+    """
+    Find the unique CPT, HCPCS, and PLA codes and code ranges in text in a single pass
+    Args:
+        text: Text content to scan
+    Returns:
+        list: Unique (code, code_type, range_end) tuples, CPT codes first,
+            then HCPCS, then PLA, each in order of first appearance; range_end
+            is the last code of a range, or None for single codes
+    """
+    by_type = ([], [], [])
+    seen = set()
+    
+    # dict.fromkeys dedupes the matches while keeping first-seen order,
+    # so only unique matches are classified
+    for token in dict.fromkeys(CODE_PATTERN.findall(text)):
+        if len(token) == CODE_LENGTH and token not in seen:
+            # Single codes are by far the most common, so skip _match_codes
+            code_type = classify_code(token)
+            if code_type:
+                seen.add(token)
+                by_type[CODE_TYPE_ORDER[code_type]].append((token, code_type, None))
+            continue
+        
+        for code, code_type, range_end in _match_codes(token):
+            key = range_key(code, range_end)
+            if key not in seen:
+                seen.add(key)
+                by_type[CODE_TYPE_ORDER[code_type]].append((code, code_type, range_end))
+    
+    return by_type[0] + by_type[1] + by_type[2]
+
+class CodeScanner:
+    """
+    Incremental code scanner for text that arrives in chunks, such as pages
+    Matches near the end of a chunk are held back until the next chunk
+    arrives, so codes straddling a chunk boundary are found exactly as if
+    the whole text had been scanned at once. Only a few characters are
+    carried between chunks.
+    """
+    def __init__(self):
+        self.seen = set()
+        self._buffer = ""
+        self._scan_from = 0
+        # (buffer offset, page number) for each chunk in the buffer
+        self._marks = []
+    
+    def feed(self, text, page_number=None):
+        """
+        Scan the next chunk of text
+        Args:
+            text: Text content of the chunk
+            page_number: Page the chunk came from
+        Returns:
+            list: (code, code_type, page_number, range_end) tuples for new
+                unique codes and code ranges
+        """
+        if not text:
+            return []
+        
+        self._marks.append((len(self._buffer), page_number))
+        self._buffer += text
+        return self._scan(final=False)
+    
+    def finish(self):
+        """
+        Scan whatever text is still held back at the end of the input
+        Returns:
+            list: (code, code_type, page_number, range_end) tuples for new
+                unique codes and code ranges
+        """
+        return self._scan(final=True)
+    
+    def _page_at(self, offset):
+        """
+        Get the page number of a buffer offset
+        """
+        index = bisect_right(self._marks, offset, key=lambda mark: mark[0]) - 1
+        return self._marks[index][1]
+    
+    def _scan(self, final):
+        buffer = self._buffer
+        found = []
+        
+        # A match is decided once the character after it has arrived
+        decided_until = len(buffer) if final else len(buffer) - CODE_MATCH_LENGTH
+        scan_from = max(self._scan_from, decided_until)
+        
+        for match in CODE_PATTERN.finditer(buffer, self._scan_from):
+            if match.start() >= decided_until:
+                break
+            scan_from = max(decided_until, match.end())
+            token = match.group()
+            if len(token) == CODE_LENGTH:
+                # Single codes are by far the most common, so skip _match_codes
+                if token in self.seen:
+                    continue
+                code_type = classify_code(token)
+                if code_type:
+                    self.seen.add(token)
+                    found.append((token, code_type, self._page_at(match.start()), None))
+                continue
+            
+            for code, code_type, range_end in _match_codes(token):
+                key = range_key(code, range_end)
+                if key not in self.seen:
+                    self.seen.add(key)
+                    found.append((code, code_type, self._page_at(match.start()), range_end))
+        
+        # Keep one character before the next scan position for the word boundary check
+        keep_from = max(scan_from - 1, 0)
+        if keep_from:
+            self._buffer = buffer[keep_from:]
+            page = self._page_at(keep_from)
+            self._marks = [(0, page)] + [
+                (offset - keep_from, page_number)
+                for offset, page_number in self._marks
+                if offset > keep_from
+            ]
+        self._scan_from = scan_from - keep_from
+        
+        return found
+
+# Table extraction. Candidate pdfplumber table settings, tried in order when
+# a layout has to be found: ruled tables, tables with ruled rows only, and
+# tables aligned by text alone
+TABLE_SETTINGS = (
+    {'vertical_strategy': 'lines', 'horizontal_strategy': 'lines'},
+    {'vertical_strategy': 'text', 'horizontal_strategy': 'lines'},
+    {'vertical_strategy': 'text', 'horizontal_strategy': 'text'},
+)
+# Share of a column's non-empty cells that must start with a code for it to
+# be taken as the code column
+CODE_COLUMN_SHARE = 0.5
+# Vertical distance in points within which characters are on the same line
+TABLE_LINE_TOLERANCE = 3
+DESCRIPTION_HEADER = re.compile(r'desc', re.IGNORECASE)
+
+def _starts_with_code(text):
+    match = CODE_PATTERN.match(text)
+    return match is not None and classify_code(match.group()[:CODE_LENGTH]) is not None
+
+def _classify_columns(table):
+    """
+    Find the code and description columns of a table found by pdfplumber
+    Returns:
+        dict: Column bounds and the number of code cells, or None if the
+            table has no code column
+    """
+    rows = table.extract()
+    column_count = min(len(rows[0]), len(table.columns)) if rows else 0
+    cells = [
+        [' '.join((row[column] or '').split()) for row in rows if column < len(row)]
+        for column in range(column_count)
+    ]
+    
+    code_column, code_cells = None, 0
+    for column, values in enumerate(cells):
+        filled = [value for value in values if value]
+        hits = sum(1 for value in filled if _starts_with_code(value))
+        if hits > code_cells and hits >= 2 and hits >= CODE_COLUMN_SHARE * len(filled):
+            code_column, code_cells = column, hits
+    if code_column is None:
+        return None
+    
+    # A column headed "Description" wins, otherwise the wordiest other column
+    others = [column for column in range(column_count) if column != code_column]
+    headed = [column for column in others if DESCRIPTION_HEADER.search(cells[column][0])]
+    if headed:
+        description_column = headed[0]
+    else:
+        letters = {column: sum(char.isalpha() for value in cells[column] for char in value) for column in others}
+        description_column = max(letters, key=letters.get) if any(letters.values()) else None
+    
+    def bounds(column):
+        x0, _, x1, _ = table.columns[column].bbox
+        return [x0, x1]
+    
+    return {
+        'code_bounds': bounds(code_column),
+        'description_bounds': bounds(description_column) if description_column is not None else None,
+        'code_cells': code_cells
+    }
+
+def find_table_layout(page, preferred=None):
+    """
+    Find the layout of the code table on a page with pdfplumber's table finder
+    Args:
+        page: pdfplumber page
+        preferred: Layout to try the table settings of first
+    Returns:
+        dict: Layout with the index of the table 'settings' that found it and
+            the x bounds of the code and description columns, or None if the
+            page has no table with a code column
+    """
+    order = list(range(len(TABLE_SETTINGS)))
+    if preferred is not None:
+        order.remove(preferred['settings'])
+        order.insert(0, preferred['settings'])
+    
+    for settings in order:
+        layouts = [_classify_columns(table) for table in page.find_tables(TABLE_SETTINGS[settings])]
+        layouts = [layout for layout in layouts if layout]
+        if layouts:
+            layout = max(layouts, key=lambda layout: layout['code_cells'])
+            del layout['code_cells']
+            layout['settings'] = settings
+            return layout
+    return None
+
+def read_table_rows(page, layout):
+    """
+    Read code and description cells from a page using known column bounds
+    Once a layout is known, rows are read straight from the page characters
+    without running the table finder: every line of the code column starts
+    a row, and description lines belong to the row they are level with or
+    below. Only code cells that start with a code make rows.
+    Args:
+        page: pdfplumber page
+        layout: Layout from find_table_layout
+    Returns:
+        list: (code, description) tuples in page order, one per code in a code
+            cell; ranges are given by their range_key
+    """
+    code_x0, code_x1 = layout['code_bounds']
+    description_x0, description_x1 = layout['description_bounds'] or (0, 0)
+    code_chars, description_chars = [], []
+    for char in page.chars:
+        middle = (char['x0'] + char['x1']) / 2
+        if code_x0 <= middle < code_x1:
+            code_chars.append(char)
+        elif description_x0 <= middle < description_x1:
+            description_chars.append(char)
+    
+    lines = utils.cluster_objects(code_chars, 'top', TABLE_LINE_TOLERANCE)
+    if not lines:
+        return []
+    starts = [min(char['top'] for char in line) - TABLE_LINE_TOLERANCE for line in lines]
+    # The last row is assumed to be no taller than the tallest row above it
+    heights = [following - start for start, following in zip(starts, starts[1:])]
+    bottom = starts[-1] + max(heights, default=max(char['bottom'] for char in lines[-1]) - starts[-1])
+    
+    row_chars = [[] for _ in lines]
+    for char in description_chars:
+        if starts[0] <= char['top'] < bottom:
+            row_chars[bisect_right(starts, char['top']) - 1].append(char)
+    
+    rows = []
+    for line, chars in zip(lines, row_chars):
+        text = utils.extract_text(line)
+        if not _starts_with_code(text):
+            continue
+        description = ' '.join(utils.extract_text(chars).split())
+        rows.extend((range_key(code, range_end), description) for code, _, range_end in scan_codes(text))
+    return rows
+
+class TableLayouts:
+    """
+    Table layouts keyed by payer, so documents from a payer that was seen
+    before skip the table finder until their layout stops matching
+    """
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._layouts = OrderedDict()
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def _normalize(key):
+        return ' '.join(str(key).lower().split()) if key else None
+    
+    def get(self, key):
+        """
+        Get the last layout seen for a key, or None
+        """
+        key = self._normalize(key)
+        with self._lock:
+            layout = self._layouts.get(key)
+            if layout is not None:
+                self._layouts.move_to_end(key)
+            return layout
+    
+    def put(self, key, layout):
+        """
+        Remember the layout for a key
+        """
+        key = self._normalize(key)
+        if key is None or layout is None:
+            return
+        with self._lock:
+            self._layouts[key] = layout
+            self._layouts.move_to_end(key)
+            while len(self._layouts) > self.max_entries:
+                self._layouts.popitem(last=False)
+
+# Table layouts for this process
+table_layouts = TableLayouts()
+
+def _iter_table_pages(pdf_file_content, descriptions, layout_key, report):
+    """
+    Extract pages with pdfplumber and read the code table on each page
+    The table finder only runs on pages with codes where the current layout
+    yields no rows; the layout it finds is used for the following pages and
+    remembered for layout_key.
+    Args:
+        pdf_file_content: PDF file content as a BytesIO object
+        descriptions: Dictionary that code -> description pairs are added to
+        layout_key: Key the layout is remembered under
+        report: Report dictionary; 'table_pages' and 'table_layout' are updated
+    Yields:
+        tuple: (page_number, page_count, text) for each page, in page order
+    """
+    layout = report['table_layout']
+    
+    with pdfplumber.open(pdf_file_content) as pdf:
+        page_count = len(pdf.pages)
+        for index in range(page_count):
+            page = pdf.pages[index]
+            text = page.extract_text() or ""
+            
+            rows = read_table_rows(page, layout) if layout else []
+            if not rows and CODE_PATTERN.search(text):
+                found = find_table_layout(page, layout)
+                if found:
+                    layout = report['table_layout'] = found
+                    table_layouts.put(layout_key, layout)
+                    rows = read_table_rows(page, layout)
+            page.close()
+            
+            if rows:
+                report['table_pages'] += 1
+            for code, description in rows:
+                if description:
+                    descriptions.setdefault(code, description)
+            yield index + 1, page_count, text
 
 def extract_codes_from_text(text, metadata):
     """
@@ -60,107 +911,278 @@ def extract_codes_from_text(text, metadata):
         metadata: Dictionary containing payer_name, year, and line_of_business
     Returns:
         list: List of dictionaries containing the extracted codes with metadata
+            and category; code ranges have the last code of the range in 'range_end'
     """
     logger.info("Starting code extraction from text")
     
-    # Patterns for CPT, HCPCS, and PLA codes
-    # CPT codes are 5 digits, sometimes with modifiers
-    cpt_pattern = r'\b(\d{5})(?:-[A-Za-z0-9]{1,5})?\b'
-    
-    # HCPCS codes are alphanumeric, starting with letter
-    hcpcs_pattern = r'\b([A-Z]\d{4})(?:-[A-Za-z0-9]{1,5})?\b'
-    
-    # PLA codes are 4 digits followed by U
-    pla_pattern = r'\b(\d{4}U)(?:-[A-Za-z0-9]{1,5})?\b'
-    
-    # Find all matches
-    cpt_matches = re.finditer(cpt_pattern, text)
-    hcpcs_matches = re.finditer(hcpcs_pattern, text)
-    pla_matches = re.finditer(pla_pattern, text)
-    
-    # Process CPT codes
-    cpt_codes = []
-    for match in cpt_matches:
-        code = match.group(1)
-        # Get context around the code for potential description
-        start_pos = max(0, match.start() - 100)
-        end_pos = min(len(text), match.end() + 100)
-        context = text[start_pos:end_pos]
-        
-        cpt_codes.append({
-            'code': code,
-            'code_type': 'CPT',
-            'payer_name': metadata['payer_name'],
-            'year': metadata['year'],
-            'line_of_business': metadata['line_of_business'],
-            'source_file': metadata.get('source_file', 'Unknown')
-        })
-    
-    # Process HCPCS codes
-    hcpcs_codes = []
-    for match in hcpcs_matches:
-        code = match.group(1)
-        # Get context around the code for potential description
-        start_pos = max(0, match.start() - 100)
-        end_pos = min(len(text), match.end() + 100)
-        context = text[start_pos:end_pos]
-        
-        hcpcs_codes.append({
-            'code': code,
-            'code_type': 'HCPCS',
-            'payer_name': metadata['payer_name'],
-            'year': metadata['year'],
-            'line_of_business': metadata['line_of_business'],
-            'source_file': metadata.get('source_file', 'Unknown')
-        })
-    
-    # Process PLA codes
-    pla_codes = []
-    for match in pla_matches:
-        code = match.group(1)
-        # Get context around the code for potential description
-        start_pos = max(0, match.start() - 100)
-        end_pos = min(len(text), match.end() + 100)
-        context = text[start_pos:end_pos]
-        
-        pla_codes.append({
-            'code': code,
-            'code_type': 'PLA',
-            'payer_name': metadata['payer_name'],
-            'year': metadata['year'],
-            'line_of_business': metadata['line_of_business'],
-            'source_file': metadata.get('source_file', 'Unknown')
-        })
-    
-    # Combine and deduplicate codes
+    payer_name = metadata['payer_name']
+    year = metadata['year']
+    line_of_business = metadata['line_of_business']
+    source_file = metadata.get('source_file', 'Unknown')
+    
+    # Records are only built for unique codes
     all_codes = []
-    seen_codes = set()
+    for code, code_type, range_end in scan_codes(text):
+        record = {
+            'code': code,
+            'code_type': code_type,
+            'payer_name': payer_name,
+            'year': year,
+            'line_of_business': line_of_business,
+            'source_file': source_file,
+            'description': ''
+        }
+        if range_end is not None:
+            record['range_end'] = range_end
+        all_codes.append(record)
     
-    for code_dict in cpt_codes + hcpcs_codes + pla_codes:
-        code_key = (code_dict['code'], code_dict['code_type'])
-        if code_key not in seen_codes:
-            all_codes.append(code_dict)
-            seen_codes.add(code_key)
+    enrich_codes(all_codes)
     
     logger.info(f"Extracted {len(all_codes)} unique codes from text")
     return all_codes
 
-def process_pdf(file_content, metadata):
+def iter_codes_from_pages(pages, metadata, descriptions=None):
+    """
+    Extract CPT, HCPCS, and PLA codes from pages as they arrive
+    Args:
+        pages: Iterable of (page_number, text) tuples
+        metadata: Dictionary containing payer_name, year, line_of_business, and source_file
+        descriptions: Optional dictionary of code descriptions, looked up when
+            each code is found; it may keep filling up while pages arrive
+    Yields:
+        dict: Each unique code or code range with metadata, category and the page
+            it was first found on; ranges have the last code of the range in 'range_end'
+    """
+    payer_name = metadata['payer_name']
+    year = metadata['year']
+    line_of_business = metadata['line_of_business']
+    source_file = metadata.get('source_file', 'Unknown')
+    
+    scanner = CodeScanner()
+    if descriptions is None:
+        descriptions = {}
+    
+    def build_records(found):
+        for code, code_type, page_number, range_end in found:
+            record = {
+                'code': code,
+                'code_type': code_type,
+                'payer_name': payer_name,
+                'year': year,
+                'line_of_business': line_of_business,
+                'source_file': source_file,
+                'page': page_number,
+                'description': descriptions.get(range_key(code, range_end), '')
+            }
+            if range_end is not None:
+                record['range_end'] = range_end
+            yield record
+    
+    for page_number, text in pages:
+        # Pages are separated the same way as in extract_text_from_pdf;
+        # each page's codes are categorized as one batch
+        yield from enrich_codes(list(build_records(scanner.feed(text + "\n\n", page_number))))
+    
+    yield from enrich_codes(list(build_records(scanner.finish())))
+
+def iter_codes_from_pdf(file_content, metadata, parallel=None, progress=None, report=None, strategy=None):
+    """
+    Stream codes out of a PDF file page by page
+    Memory use stays constant regardless of page count: no page text is
+    kept after it has been scanned.
+    Args:
+        file_content: PDF file content as bytes or BytesIO object
+        metadata: Dictionary containing payer_name, year, line_of_business, and source_file
+        parallel: Force page-sharded extraction on (True) or off (False)
+        progress: Optional callable taking (pages_done, page_count)
+        report: Optional dictionary filled in with the engines used (see iter_pdf_pages)
+        strategy: One of EXTRACTION_STRATEGIES; defaults to EXTRACTION_STRATEGY
+    Yields:
+        dict: Each unique code with metadata, the page it was first found on
+            and its description, if the strategy reads descriptions
+    """
+    descriptions = {}
+    pages = iter_pdf_pages(file_content, parallel, progress, strategy, report,
+                           descriptions=descriptions, layout_key=metadata.get('payer_name'))
+    return iter_codes_from_pages(pages, metadata, descriptions)
+
+def count_pages(file_content):
+    """
+    Count the pages of a PDF without extracting them
+    Args:
+        file_content: PDF file content as bytes
+    Returns:
+        int: Number of pages, or 0 if the document can't be read
+    """
+    try:
+        return len(PdfReader(io.BytesIO(file_content)).pages)
+    except Exception as e:
+        logger.warning(f"Could not count PDF pages: {str(e)}")
+        return 0
+
+def _cache_variant(strategy):
+    """
+    Get the extraction cache variant of a strategy; only the 'tables'
+    strategy adds descriptions, the others extract the same codes
+    """
+    return 'tables' if strategy == 'tables' else None
+
+def process_pdf(file_content, metadata, use_cache=True, progress=None, strategy=None):
     """
     Process a PDF file to extract CPT, HCPCS, and PLA codes with metadata
+    Documents that were processed before are served from the extraction
+    cache and only get the new metadata applied.
     Args:
         file_content: PDF file content as bytes or BytesIO object
         metadata: Dictionary containing payer_name, year, line_of_business, and source_file
+        use_cache: Whether to consult and fill the extraction cache
+        progress: Optional callable taking (pages_done, page_count); a cache
+            hit reports every page done at once
+        strategy: One of EXTRACTION_STRATEGIES; defaults to EXTRACTION_STRATEGY
     Returns:
-        list: List of dictionaries containing the extracted codes with metadata
+        list: List of dictionaries containing the extracted codes with metadata,
+            the page each code was first found on and its description
     """
     logger.info(f"Processing PDF file: {metadata.get('source_file', 'Unknown')}")
     
-    # Extract text from PDF
-    text = extract_text_from_pdf(file_content)
+    if isinstance(file_content, io.BytesIO):
+        file_content = file_content.getvalue()
+    
+    strategy = strategy or EXTRACTION_STRATEGY
+    cache_key = extraction_cache.key_for(file_content, _cache_variant(strategy)) if use_cache else None
+    if cache_key:
+        cached_codes = extraction_cache.get(cache_key, len(file_content))
+        if cached_codes is not None:
+            logger.info(f"Extraction cache hit. Reusing {len(cached_codes)} codes.")
+            if progress:
+                page_count = count_pages(file_content)
+                progress(page_count, page_count)
+            DOCUMENTS.inc(source='cache')
+            DOCUMENT_BYTES.inc(len(file_content), source='cache')
+            return apply_metadata(cached_codes, metadata)
+    
+    # Stream pages through the code scanner
+    report = {}
+    started = time.perf_counter()
+    codes = list(iter_codes_from_pdf(file_content, metadata, progress=progress, report=report, strategy=strategy))
+    
+    # Keep the established output order: CPT, then HCPCS, then PLA
+    codes.sort(key=lambda code: CODE_TYPE_ORDER[code['code_type']])
     
-    # Extract codes from text
-    codes = extract_codes_from_text(text, metadata)
+    # Whatever wasn't spent extracting went to scanning and building records
+    report['scan_seconds'] = max(time.perf_counter() - started - report['seconds'], 0.0)
+    extraction_stats.record(report, metadata.get('source_file'))
+    DOCUMENTS.inc(source='extracted')
+    DOCUMENT_BYTES.inc(len(file_content), source='extracted')
+    
+    if cache_key:
+        extraction_cache.put(cache_key, codes)
     
     logger.info(f"Finished processing PDF. Extracted {len(codes)} codes.")
-    return codes
\ No newline at end of file
+    return codes
+
+# Placeholder metadata for documents extracted in pool workers; the real
+# metadata is applied in the parent process
+_WORKER_METADATA = {'payer_name': '', 'year': 0, 'line_of_business': '', 'source_file': ''}
+
+def _extract_document(file_bytes, strategy=None, layout_key=None, layout=None):
+    """
+    Extract the codes of a whole document without metadata (runs in a pool worker)
+    Args:
+        file_bytes: PDF file content as bytes
+        strategy: One of EXTRACTION_STRATEGIES; defaults to EXTRACTION_STRATEGY
+        layout_key: Key of the document's table layout
+        layout: Table layout the parent process knows for layout_key
+    Returns:
+        tuple: (codes without metadata in process_pdf order, extraction report)
+    """
+    # Workers have their own layouts, so the parent's is handed over
+    table_layouts.put(layout_key, layout)
+    metadata = dict(_WORKER_METADATA, payer_name=layout_key)
+    report = {}
+    started = time.perf_counter()
+    codes = list(iter_codes_from_pdf(file_bytes, metadata, parallel=False, report=report, strategy=strategy))
+    codes.sort(key=lambda code: CODE_TYPE_ORDER[code['code_type']])
+    report['scan_seconds'] = max(time.perf_counter() - started - report['seconds'], 0.0)
+    return strip_metadata(codes), report
+
+def process_pdfs(documents, use_cache=True, strategy=None):
+    """
+    Process several PDF files concurrently
+    Cached documents are answered from the extraction cache; the rest are
+    spread across the shared process pool, one document per worker.
+    Args:
+        documents: List of (file_content, metadata) tuples
+        use_cache: Whether to consult and fill the extraction cache
+        strategy: One of EXTRACTION_STRATEGIES; defaults to EXTRACTION_STRATEGY
+    Returns:
+        list: One (codes, error) tuple per document, in input order. codes is
+            the list process_pdf would return, or None if error is set.
+    """
+    logger.info(f"Processing batch of {len(documents)} PDF files")
+    
+    strategy = strategy or EXTRACTION_STRATEGY
+    results = [None] * len(documents)
+    pending = []
+    
+    for index, (file_content, metadata) in enumerate(documents):
+        if isinstance(file_content, io.BytesIO):
+            file_content = file_content.getvalue()
+        
+        cache_key = extraction_cache.key_for(file_content, _cache_variant(strategy)) if use_cache else None
+        cached_codes = extraction_cache.get(cache_key, len(file_content)) if cache_key else None
+        if cached_codes is not None:
+            results[index] = (apply_metadata(cached_codes, metadata), None)
+            DOCUMENTS.inc(source='cache')
+            DOCUMENT_BYTES.inc(len(file_content), source='cache')
+        else:
+            pending.append((index, file_content, cache_key))
+    
+    def finish(index, cache_key, file_size, extracted):
+        codes, report = extracted
+        # Reports come back from the workers; the counters live in this process
+        extraction_stats.record(report, documents[index][1].get('source_file'))
+        DOCUMENTS.inc(source='extracted')
+        DOCUMENT_BYTES.inc(file_size, source='extracted')
+        table_layouts.put(documents[index][1].get('payer_name'), report.get('table_layout'))
+        if cache_key:
+            extraction_cache.put(cache_key, codes)
+        results[index] = (apply_metadata(codes, documents[index][1]), None)
+    
+    def fail(index, e):
+        logger.error(f"Error processing {documents[index][1].get('source_file', 'Unknown')}: {str(e)}")
+        results[index] = (None, str(e))
+    
+    if len(pending) > 1 and PAGE_POOL_WORKERS > 1:
+        try:
+            pool = get_page_pool()
+            futures = []
+            for index, file_content, cache_key in pending:
+                layout_key = documents[index][1].get('payer_name')
+                future = pool.submit(_extract_document, file_content, strategy,
+                                     layout_key, table_layouts.get(layout_key))
+                futures.append((index, cache_key, len(file_content), future))
+        except Exception as e:
+            logger.warning(f"Could not use the extraction pool, processing serially: {str(e)}")
+            futures = None
+        
+        if futures is not None:
+            for index, cache_key, file_size, future in futures:
+                try:
+                    finish(index, cache_key, file_size, future.result())
+                except BrokenProcessPool as e:
+                    shutdown_page_pool()
+                    fail(index, e)
+                except Exception as e:
+                    fail(index, e)
+            pending = []
+    
+    for index, file_content, cache_key in pending:
+        try:
+            layout_key = documents[index][1].get('payer_name')
+            finish(index, cache_key, len(file_content), _extract_document(file_content, strategy, layout_key))
+        except Exception as e:
+            fail(index, e)
+    
+    logger.info(f"Finished processing batch of {len(documents)} PDF files")
+    return results
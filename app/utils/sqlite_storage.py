@@ -0,0 +1,616 @@
+import os
+import json
+import uuid
+import sqlite3
+import threading
+import logging
+from collections import Counter
+from app.utils.storage import (INDEXED_FIELDS, SEARCH_FIELDS, SLICE_FIELDS, natural_key, natural_key_hash,
+                               normalize_code, normalize_year, listing_sort_key)
+from app.utils.code_ranges import code_sort_key
+
+# Setup logging
+logging.basicConfig(level=logging.INFO, 
+                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Fields stored in their own column; anything else goes into the JSON 'extra' column
+COLUMNS = ('code', 'code_type', 'payer_name', 'line_of_business', 'year', 'source_file', 'page', 'description',
+           'range_end', 'category', 'category_description')
+
+# Label a code or code range is compared by in diffs, as listing_label
+# (codes saved as numbers are labelled as text)
+_LISTING_LABEL = "CASE WHEN range_end IS NULL THEN CAST(code AS TEXT) ELSE code || '-' || range_end END"
+
+# Rows per executemany call when saving
+INSERT_BATCH_SIZE = 5000
+
+# Run in every transaction that changes codes, so readers can tell their copy is stale
+_BUMP_VERSION = "UPDATE meta SET value = CAST(value AS INTEGER) + 1 WHERE key = 'version'"
+
+class SQLiteStorage:
+    """
+    SQLite storage for extracted codes with the same interface as MemStorage
+    The database runs in WAL mode, so several worker processes can share one
+    file: readers don't block the writer and every worker sees the same data.
+    Filters use per-field indexes and search uses an FTS5 trigram index, which
+    keeps the case-insensitive substring semantics of MemStorage. Code ranges
+    are also kept in an R*Tree over their code_sort_key bounds for coverage
+    lookups. Each row stores an indexed hash of its natural key, which makes
+    saving idempotent; rows whose keys' hashes collide are told apart by
+    comparing the keys.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        
+        self._create_schema()
+        logger.info(f"Using SQLite storage at {path}")
+    
+    def _connection(self):
+        """
+        Get this thread's connection, opening it on first use
+        """
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            # Transactions are managed explicitly with BEGIN/COMMIT
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+        return connection
+    
+    def _create_schema(self):
+        connection = self._connection()
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS codes (id INTEGER PRIMARY KEY, extra TEXT, natural_key INTEGER)"
+        )
+        connection.execute('CREATE INDEX IF NOT EXISTS idx_codes_natural_key ON codes (natural_key)')
+        
+        # Add columns missing from databases created by older versions
+        existing = {row[1] for row in connection.execute('PRAGMA table_info(codes)')}
+        for column in COLUMNS:
+            if column not in existing:
+                connection.execute(f'ALTER TABLE codes ADD COLUMN {column}')
+        
+        for field in INDEXED_FIELDS:
+            connection.execute(f'CREATE INDEX IF NOT EXISTS idx_codes_{field} ON codes ({field})')
+        
+        connection.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        connection.execute(
+            "INSERT OR IGNORE INTO meta (key, value) VALUES ('generation', ?)", (uuid.uuid4().hex,)
+        )
+        connection.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('version', 0)")
+        
+        try:
+            connection.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS codes_fts USING fts5("
+                f"{', '.join(SEARCH_FIELDS)}, content='codes', content_rowid='id', tokenize='trigram')"
+            )
+            self._fts = True
+        except sqlite3.OperationalError as e:
+            logger.warning(f"FTS5 trigram index unavailable, search will scan: {str(e)}")
+            self._fts = False
+        
+        try:
+            created = connection.execute(
+                "SELECT COUNT(*) FROM sqlite_master WHERE name = 'code_ranges'"
+            ).fetchone()[0] == 0
+            connection.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS code_ranges USING rtree_i32(id, start_key, end_key)"
+            )
+            self._rtree = True
+        except sqlite3.OperationalError as e:
+            logger.warning(f"R*Tree module unavailable, coverage lookups will scan ranges: {str(e)}")
+            self._rtree = False
+        
+        if self._rtree and created:
+            # Index ranges saved while the R*Tree was missing
+            rows = connection.execute('SELECT id, code, range_end FROM codes WHERE range_end IS NOT NULL')
+            connection.executemany(
+                'INSERT INTO code_ranges (id, start_key, end_key) VALUES (?, ?, ?)',
+                self._range_rows(rows)
+            )
+    
+    @staticmethod
+    def _range_rows(rows):
+        """
+        Turn (id, code, range_end) rows into code_ranges rows, skipping values that aren't codes
+        """
+        for code_id, code, range_end in rows:
+            start, end = code_sort_key(code), code_sort_key(range_end)
+            if start is not None and end is not None:
+                yield code_id, start, end
+    
+    def _row_to_code(self, row):
+        """
+        Turn a (id, extra, *COLUMNS) row into a code dictionary
+        """
+        code = {
+            column: value
+            for column, value in zip(COLUMNS, row[2:])
+            if value is not None
+        }
+        if row[1]:
+            code.update(json.loads(row[1]))
+        code['id'] = row[0]
+        return code
+    
+    def _select(self, where='', params=(), suffix=''):
+        """
+        Select codes as dictionaries
+        Args:
+            where: Optional SQL condition
+            params: Parameters for the condition and suffix
+            suffix: Optional ORDER BY / LIMIT clause; defaults to id order
+        Returns:
+            list: List of code dictionaries
+        """
+        sql = f"SELECT id, extra, {', '.join(COLUMNS)} FROM codes"
+        if where:
+            sql += f" WHERE {where}"
+        sql += f" {suffix or 'ORDER BY id'}"
+        return [self._row_to_code(row) for row in self._connection().execute(sql, params)]
+    
+    def get_all_codes(self):
+        """
+        Get all extracted codes
+        Returns:
+            list: List of dictionaries containing all extracted codes
+        """
+        return self._select()
+    
+    def count_codes(self):
+        """
+        Get the number of stored codes
+        Returns:
+            int: Number of codes
+        """
+        return self._connection().execute('SELECT COUNT(*) FROM codes').fetchone()[0]
+    
+    def get_size_bytes(self):
+        """
+        Get the size of the database file
+        Returns:
+            int: Allocated pages times the page size in bytes
+        """
+        connection = self._connection()
+        page_count = connection.execute('PRAGMA page_count').fetchone()[0]
+        page_size = connection.execute('PRAGMA page_size').fetchone()[0]
+        return page_count * page_size
+    
+    def get_generation(self):
+        """
+        Get the current storage generation, which changes when storage is cleared
+        Returns:
+            str: Generation identifier
+        """
+        return self._connection().execute("SELECT value FROM meta WHERE key = 'generation'").fetchone()[0]
+    
+    def get_last_id(self):
+        """
+        Get the id of the most recently saved code
+        Returns:
+            int: Largest id, or 0 if storage is empty
+        """
+        return self._connection().execute('SELECT COALESCE(MAX(id), 0) FROM codes').fetchone()[0]
+    
+    def get_version(self):
+        """
+        Get a counter that changes whenever stored codes change
+        Together with the generation it identifies the current contents.
+        Returns:
+            int: Version number
+        """
+        return int(self._connection().execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0])
+    
+    def get_codes_since(self, last_id, limit=None):
+        """
+        Get codes saved after a given id
+        Args:
+            last_id: Id of the last code already seen (0 for all codes)
+            limit: Maximum number of codes to return (all if None)
+        Returns:
+            list: List of dictionaries containing the codes, in id order
+        """
+        return self._select('id > ?', (last_id, -1 if limit is None else limit), 'ORDER BY id LIMIT ?')
+    
+    def iter_codes(self, batch_size=1000, after_id=0, **filters):
+        """
+        Iterate over codes without materializing them all at once
+        Each batch is a short keyset query, so no read transaction stays open
+        while the caller consumes rows.
+        Args:
+            batch_size: Number of codes fetched per batch
+            after_id: Only include codes with a larger id
+            **filters: Field values to match, as for filter_codes
+        Yields:
+            dict: Each matching code, in id order
+        """
+        condition, params = self._filter_clause(filters)
+        where = f'id > ? AND {condition}' if condition else 'id > ?'
+        
+        last_id = after_id
+        while True:
+            batch = self._select(where, (last_id,) + params + (batch_size,), 'ORDER BY id LIMIT ?')
+            if not batch:
+                return
+            yield from batch
+            last_id = batch[-1]['id']
+    
+    def get_codes_by_payer(self, payer_name):
+        """
+        Get extracted codes by payer name
+        Args:
+            payer_name: Payer name to filter by
+        Returns:
+            list: List of dictionaries containing extracted codes for the specified payer
+        """
+        return self.filter_codes(payer_name=payer_name)
+    
+    def get_codes_by_line_of_business(self, line_of_business):
+        """
+        Get extracted codes by line of business
+        Args:
+            line_of_business: Line of business to filter by
+        Returns:
+            list: List of dictionaries containing extracted codes for the specified line of business
+        """
+        return self.filter_codes(line_of_business=line_of_business)
+    
+    def get_codes_by_year(self, year):
+        """
+        Get extracted codes by year
+        Args:
+            year: Year to filter by
+        Returns:
+            list: List of dictionaries containing extracted codes for the specified year
+        """
+        return self.filter_codes(year=year)
+    
+    def _filter_clause(self, filters):
+        """
+        Build a WHERE clause for indexed field filters
+        Args:
+            filters: Field values keyed by field name; None values are ignored
+        Returns:
+            tuple: (condition, params); condition is '' when there are no filters
+        """
+        filters = {field: value for field, value in filters.items() if value is not None}
+        
+        unknown = set(filters) - set(INDEXED_FIELDS)
+        if unknown:
+            raise ValueError(f"Cannot filter on {', '.join(sorted(unknown))}")
+        
+        if 'year' in filters:
+            filters['year'] = normalize_year(filters['year'])
+        
+        condition = ' AND '.join(f'{field} = ?' for field in filters)
+        return condition, tuple(filters.values())
+    
+    def filter_codes(self, **filters):
+        """
+        Get extracted codes matching all given field values
+        Args:
+            **filters: Field values to match, keyed by any of INDEXED_FIELDS;
+                None values are ignored
+        Returns:
+            list: List of dictionaries containing the matching codes, in id order
+        """
+        condition, params = self._filter_clause(filters)
+        return self._select(condition, params)
+    
+    def _slice_clause(self, filters):
+        """
+        Build a WHERE clause selecting a slice of codes, always non-empty
+        Raises:
+            ValueError: If a field is not one of SLICE_FIELDS
+        """
+        filters = {field: value for field, value in filters.items() if value is not None}
+        unknown = set(filters) - set(SLICE_FIELDS)
+        if unknown:
+            raise ValueError(f"Cannot compare codes by {', '.join(sorted(unknown))}")
+        
+        condition, params = self._filter_clause(filters)
+        return condition or '1', params
+    
+    def diff_codes(self, base, other):
+        """
+        Compare the codes of two slices of storage
+        Args:
+            base: Field values selecting the first slice, keyed by any of
+                SLICE_FIELDS, e.g. {'payer_name': 'Aetna', 'year': 2024}
+            other: Field values selecting the second slice
+        Returns:
+            dict: 'added' (codes only in other), 'removed' (codes only in base)
+                and 'common' lists of codes and code ranges, in code order
+        """
+        base_condition, base_params = self._slice_clause(base)
+        other_condition, other_params = self._slice_clause(other)
+        connection = self._connection()
+        
+        def compound(first, operator, second):
+            (first_condition, first_params), (second_condition, second_params) = first, second
+            rows = connection.execute(
+                f"SELECT {_LISTING_LABEL} FROM codes WHERE {first_condition} {operator} "
+                f"SELECT {_LISTING_LABEL} FROM codes WHERE {second_condition}",
+                first_params + second_params
+            )
+            return sorted((row[0] for row in rows), key=listing_sort_key)
+        
+        base_slice = (base_condition, base_params)
+        other_slice = (other_condition, other_params)
+        return {
+            'added': compound(other_slice, 'EXCEPT', base_slice),
+            'removed': compound(base_slice, 'EXCEPT', other_slice),
+            'common': compound(base_slice, 'INTERSECT', other_slice)
+        }
+    
+    def compare_codes(self, group_by, **filters):
+        """
+        Compare the codes of every value of a field, e.g. of every payer
+        Args:
+            group_by: One of SLICE_FIELDS
+            **filters: Field values the compared codes must have, keyed by
+                any of SLICE_FIELDS
+        Returns:
+            dict: 'groups' (one dictionary per value with 'value', 'total'
+                distinct codes and the 'unique' codes no other value has) and
+                'common' (codes every value has)
+        """
+        if group_by not in SLICE_FIELDS:
+            raise ValueError(f"Cannot compare codes by {group_by}")
+        condition, params = self._slice_clause(filters)
+        
+        groups = {}
+        rows = self._connection().execute(
+            f"SELECT DISTINCT {group_by}, {_LISTING_LABEL} FROM codes WHERE {condition}", params
+        )
+        for value, label in rows:
+            groups.setdefault(value, set()).add(label)
+        
+        # Labels held by a single group are unique to it
+        holders = Counter(label for labels in groups.values() for label in labels)
+        values = sorted(groups, key=str)
+        return {
+            'groups': [
+                {
+                    'value': value,
+                    'total': len(groups[value]),
+                    'unique': sorted((label for label in groups[value] if holders[label] == 1), key=listing_sort_key)
+                }
+                for value in values
+            ],
+            'common': sorted((label for label, count in holders.items() if count == len(groups)),
+                             key=listing_sort_key)
+        }
+    
+    def find_covering_codes(self, code, **filters):
+        """
+        Get the stored codes and code ranges that cover a code
+        A code is covered by records of that code and by ranges it falls in,
+        such as 70010-79999 for 71250. Ranges are found through the R*Tree.
+        Args:
+            code: Code to look up
+            **filters: Field values the covering records must have, as for
+                filter_codes; usually payer_name
+        Returns:
+            list: List of dictionaries containing the covering codes and ranges, in id order
+        """
+        key = code_sort_key(code)
+        if key is None:
+            return []
+        
+        filters = {field: value for field, value in filters.items() if value is not None and field != 'code'}
+        _, params = self._filter_clause(filters)
+        # Unary + keeps SQLite from picking a filter index over the code and R*Tree lookups
+        condition = ''.join(f' AND +{field} = ?' for field in filters)
+        
+        codes = {row['id']: row for row in self._select(f'code = ?{condition}', (code,) + params)}
+        if self._rtree:
+            ranges = self._select(
+                f'id IN (SELECT id FROM code_ranges WHERE start_key <= ? AND end_key >= ?){condition}',
+                (key, key) + params
+            )
+        else:
+            # Text comparison can match codes of another type; the keys decide
+            ranges = []
+            candidates = self._select(
+                f'range_end IS NOT NULL AND code <= ? AND range_end >= ?{condition}', (code, code) + params
+            )
+            for row in candidates:
+                start, end = code_sort_key(row['code']), code_sort_key(row['range_end'])
+                if start is not None and end is not None and start <= key <= end:
+                    ranges.append(row)
+        codes.update((row['id'], row) for row in ranges)
+        
+        return [codes[code_id] for code_id in sorted(codes)]
+    
+    def get_facet_values(self, field):
+        """
+        Get the distinct values of an indexed field
+        Args:
+            field: One of INDEXED_FIELDS
+        Returns:
+            list: Distinct values present in storage
+        """
+        if field not in INDEXED_FIELDS:
+            raise ValueError(f"Cannot get values of {field}")
+        
+        rows = self._connection().execute(
+            f'SELECT DISTINCT {field} FROM codes WHERE {field} IS NOT NULL'
+        )
+        return [row[0] for row in rows]
+    
+    def save_codes(self, codes_to_save):
+        """
+        Save extracted codes to storage, skipping codes that are already stored
+        Args:
+            codes_to_save: List of dictionaries containing extracted codes to save
+        Returns:
+            list: List of dictionaries containing all saved codes with IDs
+        """
+        return self.upsert_codes(codes_to_save)['codes']
+    
+    def upsert_codes(self, codes_to_save):
+        """
+        Save extracted codes to storage, keyed on their natural key
+        A code with the same natural key as a stored code (or an earlier code
+        in the same call) is not added again; the stored code is returned in
+        its place, unchanged. Years are stored normalized (see normalize_year).
+        Args:
+            codes_to_save: List of dictionaries containing extracted codes to save
+        Returns:
+            dict: 'codes' (the saved or already stored code for every input
+                code, with IDs), 'inserted' and 'unchanged' counts
+        """
+        connection = self._connection()
+        saved_codes = []
+        inserted = 0
+        
+        insert_code = (
+            f"INSERT INTO codes (id, extra, natural_key, {', '.join(COLUMNS)}) "
+            f"VALUES ({', '.join('?' * (len(COLUMNS) + 3))})"
+        )
+        select_stored = f"SELECT id, extra, {', '.join(COLUMNS)} FROM codes WHERE natural_key = ?"
+        insert_fts = (
+            f"INSERT INTO codes_fts (rowid, {', '.join(SEARCH_FIELDS)}) "
+            f"VALUES ({', '.join('?' * (len(SEARCH_FIELDS) + 1))})"
+        )
+        
+        # IMMEDIATE takes the write lock up front so ids can be assigned here
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            current_id = connection.execute('SELECT COALESCE(MAX(id), 0) FROM codes').fetchone()[0]
+            # Codes of this call that are not yet written, by key hash
+            batch_codes = {}
+            
+            for start in range(0, len(codes_to_save), INSERT_BATCH_SIZE):
+                code_rows = []
+                fts_rows = []
+                range_rows = []
+                for code in codes_to_save[start:start + INSERT_BATCH_SIZE]:
+                    code = normalize_code(code)
+                    code_key = natural_key(code)
+                    key_hash = natural_key_hash(code_key)
+                    candidates = batch_codes.get(key_hash, [])
+                    if not candidates:
+                        candidates = [self._row_to_code(row)
+                                      for row in connection.execute(select_stored, (key_hash,))]
+                    # Codes whose keys merely share the hash are skipped
+                    stored = next((candidate for candidate in candidates if natural_key(candidate) == code_key), None)
+                    if stored is not None:
+                        saved_codes.append(stored)
+                        continue
+                    
+                    current_id += 1
+                    code_with_id = {**code, 'id': current_id}
+                    saved_codes.append(code_with_id)
+                    inserted += 1
+                    # Stored codes sharing the hash stay candidates for later codes
+                    batch_codes[key_hash] = candidates + [code_with_id]
+                    
+                    extra = {key: value for key, value in code.items() if key not in COLUMNS and key != 'id'}
+                    code_rows.append(
+                        (current_id, json.dumps(extra) if extra else None, key_hash) +
+                        tuple(code.get(column) for column in COLUMNS)
+                    )
+                    fts_rows.append((current_id,) + tuple(code.get(field) for field in SEARCH_FIELDS))
+                    if code.get('range_end') is not None:
+                        range_rows.append((current_id, code.get('code'), code['range_end']))
+                
+                connection.executemany(insert_code, code_rows)
+                if self._fts:
+                    connection.executemany(insert_fts, fts_rows)
+                if self._rtree and range_rows:
+                    connection.executemany(
+                        'INSERT INTO code_ranges (id, start_key, end_key) VALUES (?, ?, ?)',
+                        self._range_rows(range_rows)
+                    )
+                batch_codes.clear()
+            
+            if inserted:
+                connection.execute(_BUMP_VERSION)
+            connection.execute('COMMIT')
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+        
+        return {'codes': saved_codes, 'inserted': inserted, 'unchanged': len(saved_codes) - inserted}
+    
+    def _search_clause(self, search_term):
+        """
+        Build a WHERE clause matching codes whose searchable fields contain the term
+        """
+        if self._fts and len(search_term) >= 3:
+            # A quoted phrase of the term's trigrams matches it as a substring
+            phrase = '"' + search_term.replace('"', '""') + '"'
+            return 'id IN (SELECT rowid FROM codes_fts WHERE codes_fts MATCH ?)', (phrase,)
+        
+        pattern = '%' + search_term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        condition = ' OR '.join(f"{field} LIKE ? ESCAPE '\\'" for field in SEARCH_FIELDS)
+        return f'({condition})', (pattern,) * len(SEARCH_FIELDS)
+    
+    def search_codes(self, search_term, limit=None, offset=0, **filters):
+        """
+        Search extracted codes
+        Args:
+            search_term: Term to search for
+            limit: Maximum number of codes to return (all if None)
+            offset: Number of matching codes to skip
+            **filters: Field values to match, as for filter_codes
+        Returns:
+            list: List of dictionaries containing extracted codes that match the search term
+        """
+        return self.search_codes_page(search_term, limit=limit, offset=offset, **filters)['codes']
+    
+    def search_codes_page(self, search_term, limit=None, offset=0, **filters):
+        """
+        Search extracted codes, returning one page of results
+        A code matches when its code, payer name, line of business, or source
+        file contains the term, ignoring case, and it has all the filter values.
+        Args:
+            search_term: Term to search for; an empty term matches every code
+            limit: Maximum number of codes to return (all if None)
+            offset: Number of matching codes to skip
+            **filters: Field values to match, as for filter_codes
+        Returns:
+            dict: 'codes' (the page, in id order), 'total' (number of matches),
+                'offset' and 'limit'
+        """
+        conditions = [self._search_clause(search_term) if search_term else ('', ()), self._filter_clause(filters)]
+        condition = ' AND '.join(clause for clause, _ in conditions if clause)
+        params = sum((clause_params for _, clause_params in conditions), ())
+        
+        count_sql = 'SELECT COUNT(*) FROM codes' + (f' WHERE {condition}' if condition else '')
+        total = self._connection().execute(count_sql, params).fetchone()[0]
+        
+        codes = self._select(condition, params + (-1 if limit is None else limit, offset),
+                             'ORDER BY id LIMIT ? OFFSET ?')
+        
+        return {'codes': codes, 'total': total, 'offset': offset, 'limit': limit}
+    
+    def clear_all_codes(self):
+        """
+        Clear all extracted codes from storage
+        """
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.execute('DELETE FROM codes')
+            if self._rtree:
+                connection.execute('DELETE FROM code_ranges')
+            if self._fts:
+                connection.execute("INSERT INTO codes_fts (codes_fts) VALUES ('delete-all')")
+            # Ids start again from 1, so readers tracking ids must start over
+            connection.execute(
+                "UPDATE meta SET value = ? WHERE key = 'generation'", (uuid.uuid4().hex,)
+            )
+            connection.execute(_BUMP_VERSION)
+            connection.execute('COMMIT')
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
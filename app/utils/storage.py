@@ -1,10 +1,209 @@
+import os
+import uuid
+import heapq
+import bisect
+import hashlib
+import operator
+import threading
+from functools import reduce
+from itertools import accumulate
+from app.utils.column_store import ColumnStore, HashIndex
+from app.utils.code_ranges import IntervalIndex, code_sort_key
+
+# Fields with a secondary index mapping each value to the rows holding it
+INDEXED_FIELDS = ('code', 'code_type', 'payer_name', 'line_of_business', 'year', 'source_file', 'category')
+
+# Fields matched by search_codes (case-insensitive substring match)
+SEARCH_FIELDS = ('code', 'payer_name', 'line_of_business', 'source_file')
+
+# Fields identifying one listing of a code; saving a code whose values
+# match a stored code keeps the stored one instead of adding a duplicate.
+# range_end keeps a range apart from the single code it starts with.
+NATURAL_KEY_FIELDS = ('code', 'code_type', 'payer_name', 'line_of_business', 'year', 'source_file', 'range_end')
+
+# Fields selecting the slices of codes compared by diff_codes and compare_codes
+SLICE_FIELDS = ('payer_name', 'line_of_business', 'year', 'source_file')
+
+def normalize_year(year):
+    """
+    Get the stored form of a year: years written as digits become integers,
+    so 2023 and '2023' are the same year
+    Args:
+        year: Year as given
+    Returns:
+        The year as an int, or the value unchanged if it is not a number
+    """
+    if isinstance(year, str):
+        text = year.strip()
+        if text.isascii() and text.isdigit():
+            return int(text)
+    return year
+
+def normalize_code(code):
+    """
+    Get a code in the form it is stored and keyed by
+    Args:
+        code: Code dictionary
+    Returns:
+        dict: The code, or a copy with its year normalized if that changes it
+    """
+    year = code.get('year')
+    normalized = normalize_year(year)
+    if normalized is year:
+        return code
+    return {**code, 'year': normalized}
+
+def natural_key(code):
+    """
+    Get the natural key of a code
+    Args:
+        code: Code dictionary, as returned by normalize_code
+    Returns:
+        tuple: Values of NATURAL_KEY_FIELDS
+    """
+    return tuple(code.get(field) for field in NATURAL_KEY_FIELDS)
+
+def natural_key_hash(key):
+    """
+    Hash a natural key to a signed 64-bit integer that is the same in
+    every process, so it can be stored
+    Args:
+        key: Tuple returned by natural_key
+    Returns:
+        int: Hash value
+    """
+    text = '\x1f'.join('' if value is None else str(value) for value in key)
+    return int.from_bytes(hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest(), 'big', signed=True)
+
+def _trigrams(text):
+    """
+    Get the set of 3-character substrings of a string
+    """
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+def listing_label(code):
+    """
+    Get the label a code or code range is compared by in diffs
+    Codes saved through the API may not be strings, e.g. 99213 given as a
+    number; labels are always text.
+    Args:
+        code: Code dictionary
+    Returns:
+        str: The code, or the first and last code of a range, e.g. '70010-79999';
+            None if the code has no code
+    """
+    value, range_end = code.get('code'), code.get('range_end')
+    if value is None:
+        return None
+    return str(value) if range_end is None else f"{value}-{range_end}"
+
+def listing_sort_key(label):
+    """
+    Sort key ordering diff labels by code, each range after the code it starts with
+    """
+    label = '' if label is None else str(label)
+    key = code_sort_key(label[:5])
+    return (key is None, key or 0, label)
+
+def _bitmap(ids):
+    """
+    Build an integer with a bit set for each id
+    """
+    bits = bytearray((max(ids) >> 3) + 1)
+    for index in ids:
+        bits[index >> 3] |= 1 << (index & 7)
+    return int.from_bytes(bits, 'little')
+
+def _bitmap_ids(bitmap):
+    """
+    Get the ids whose bits are set in a bitmap, in ascending order
+    """
+    # Lowest bit first, so string positions are ids
+    bits = bin(bitmap)[:1:-1]
+    ids = []
+    index = bits.find('1')
+    while index >= 0:
+        ids.append(index)
+        index = bits.find('1', index + 1)
+    return ids
+
+def _check_slice_filters(filters):
+    """
+    Drop None filter values and reject fields that don't select slices
+    Raises:
+        ValueError: If a field is not one of SLICE_FIELDS
+    """
+    filters = {field: value for field, value in filters.items() if value is not None}
+    
+    unknown = set(filters) - set(SLICE_FIELDS)
+    if unknown:
+        raise ValueError(f"Cannot compare codes by {', '.join(sorted(unknown))}")
+    
+    # Slices are keyed by stored values, whose years are normalized
+    if 'year' in filters:
+        filters['year'] = normalize_year(filters['year'])
+    return filters
+
+def _check_filters(filters):
+    """
+    Drop None filter values and reject fields that can't be filtered on
+    Args:
+        filters: Field values keyed by field name
+    Returns:
+        dict: The filters that apply
+    Raises:
+        ValueError: If a field is not one of INDEXED_FIELDS
+    """
+    filters = {field: value for field, value in filters.items() if value is not None}
+    
+    unknown = set(filters) - set(INDEXED_FIELDS)
+    if unknown:
+        raise ValueError(f"Cannot filter on {', '.join(sorted(unknown))}")
+    
+    if 'year' in filters:
+        filters['year'] = normalize_year(filters['year'])
+    return filters
+
 class MemStorage:
     """
     In-memory storage for extracted codes
+    Codes are kept in a ColumnStore: repeated values are dictionary encoded,
+    ids live in an array and rows are only materialized when returned.
+    Lookups by facet value are answered from per-value posting arrays kept
+    up to date as codes are saved. Search uses a trigram index over the
+    distinct lowercased values of the searchable fields, so its cost depends
+    on the number of distinct values rather than the number of rows.
+    Coverage lookups use an interval index of each payer's code ranges,
+    built when first needed after the payer's ranges change.
+    Saving is idempotent: a hash of each code's natural key maps to its row,
+    so codes that are already stored are found in constant time and kept.
+    Codes whose keys' hashes collide are all indexed under that hash.
+    For diffs, every distinct code or range gets a small integer id and each
+    (payer, line of business, year, source file) slice keeps a bitmap of its
+    ids in a Python int, so comparing slices is plain bitwise arithmetic.
+    Safe to use from request threads and background jobs at the same time.
+    Ids only ever grow within a generation; clearing storage starts a new
+    generation and ids start again from 1.
     """
     def __init__(self):
-        self.codes = {}
         self.current_id = 0
+        self.generation = uuid.uuid4().hex
+        self.version = 0
+        self._store = ColumnStore(INDEXED_FIELDS)
+        # lowercased value -> ((field, value), ...) for every distinct searchable value
+        self._search_values = {}
+        # trigram -> set of lowercased values containing it
+        self._trigram_index = {}
+        # payer name -> positions of code ranges, and the interval index built from them
+        self._range_positions = {}
+        self._range_indexes = {}
+        # hash of the natural key -> row position
+        self._positions_by_key = HashIndex()
+        # code or range label -> id, id -> label, and slice -> bitmap of ids
+        self._listing_ids = {}
+        self._listing_labels = []
+        self._slice_bitmaps = {}
+        self._lock = threading.RLock()
     
     def get_all_codes(self):
         """
@@ -12,7 +211,92 @@ class MemStorage:
         Returns:
             list: List of dictionaries containing all extracted codes
         """
-        return list(self.codes.values())
+        with self._lock:
+            return self._store.rows(range(len(self._store)))
+    
+    def count_codes(self):
+        """
+        Get the number of stored codes
+        Returns:
+            int: Number of codes
+        """
+        return len(self._store)
+    
+    def get_size_bytes(self):
+        """
+        Get the approximate memory used by stored codes
+        Returns:
+            int: Size of the column arrays in bytes
+        """
+        with self._lock:
+            return self._store.nbytes() + self._positions_by_key.nbytes()
+    
+    def get_generation(self):
+        """
+        Get the current storage generation, which changes when storage is cleared
+        Returns:
+            str: Generation identifier
+        """
+        return self.generation
+    
+    def get_last_id(self):
+        """
+        Get the id of the most recently saved code
+        Returns:
+            int: Largest id, or 0 if storage is empty
+        """
+        return self.current_id
+    
+    def get_version(self):
+        """
+        Get a counter that changes whenever stored codes change
+        Together with the generation it identifies the current contents.
+        Returns:
+            int: Version number
+        """
+        return self.version
+    
+    def get_codes_since(self, last_id, limit=None):
+        """
+        Get codes saved after a given id
+        Args:
+            last_id: Id of the last code already seen (0 for all codes)
+            limit: Maximum number of codes to return (all if None)
+        Returns:
+            list: List of dictionaries containing the codes, in id order
+        """
+        with self._lock:
+            start = bisect.bisect_right(self._store.ids, last_id)
+            end = len(self._store) if limit is None else min(start + limit, len(self._store))
+            return self._store.rows(range(start, end))
+    
+    def iter_codes(self, batch_size=1000, after_id=0, **filters):
+        """
+        Iterate over codes without materializing them all at once
+        Rows are materialized one batch at a time and the lock is released
+        between batches. Codes saved after iteration starts are not included.
+        Args:
+            batch_size: Number of codes materialized per batch
+            after_id: Only include codes with a larger id
+            **filters: Field values to match, as for filter_codes
+        Yields:
+            dict: Each matching code, in id order
+        """
+        filters = _check_filters(filters)
+        
+        with self._lock:
+            store = self._store
+            start = bisect.bisect_right(store.ids, after_id)
+            if filters:
+                positions = self._filter_positions(filters)
+                positions = positions[bisect.bisect_left(positions, start):]
+            else:
+                positions = range(start, len(store))
+        
+        for start in range(0, len(positions), batch_size):
+            with self._lock:
+                batch = store.rows(positions[start:start + batch_size])
+            yield from batch
     
     def get_codes_by_payer(self, payer_name):
         """
@@ -22,7 +306,7 @@ class MemStorage:
         Returns:
             list: List of dictionaries containing extracted codes for the specified payer
         """
-        return [code for code in self.codes.values() if code['payer_name'] == payer_name]
+        return self.filter_codes(payer_name=payer_name)
     
     def get_codes_by_line_of_business(self, line_of_business):
         """
@@ -32,7 +316,7 @@ class MemStorage:
         Returns:
             list: List of dictionaries containing extracted codes for the specified line of business
         """
-        return [code for code in self.codes.values() if code['line_of_business'] == line_of_business]
+        return self.filter_codes(line_of_business=line_of_business)
     
     def get_codes_by_year(self, year):
         """
@@ -42,53 +326,423 @@ class MemStorage:
         Returns:
             list: List of dictionaries containing extracted codes for the specified year
         """
-        return [code for code in self.codes.values() if code['year'] == year]
+        return self.filter_codes(year=year)
+    
+    def _column_checks(self, filters):
+        """
+        Get (column codes, dictionary index) pairs that test rows against
+        filters (called with the lock held)
+        Returns:
+            list: One pair per filter, or None if a value was never stored
+        """
+        checks = []
+        for field, value in filters.items():
+            column = self._store.column(field)
+            code = column.code_of(value)
+            if code is None:
+                return None
+            checks.append((column.codes, code))
+        return checks
+    
+    def _filter_positions(self, filters):
+        """
+        Get the positions of rows matching all filters (called with the lock held)
+        Args:
+            filters: Non-empty dictionary of indexed field values
+        Returns:
+            list: Matching row positions in ascending order
+        """
+        postings = sorted(
+            ((self._store.positions(field, value), field, value) for field, value in filters.items()),
+            key=lambda item: len(item[0])
+        )
+        
+        # Walk the most selective posting array and probe the other columns
+        smallest = postings[0][0]
+        checks = self._column_checks({field: value for _, field, value in postings[1:]})
+        if checks is None:
+            return []
+        
+        if not checks:
+            return list(smallest)
+        return [
+            position for position in smallest
+            if all(codes[position] == code for codes, code in checks)
+        ]
+    
+    def filter_codes(self, **filters):
+        """
+        Get extracted codes matching all given field values
+        Args:
+            **filters: Field values to match, keyed by any of INDEXED_FIELDS;
+                None values are ignored
+        Returns:
+            list: List of dictionaries containing the matching codes, in id order
+        """
+        filters = _check_filters(filters)
+        
+        with self._lock:
+            if not filters:
+                return self.get_all_codes()
+            
+            return self._store.rows(self._filter_positions(filters))
+    
+    def _range_index(self, payer_name):
+        """
+        Get the interval index of a payer's code ranges (called with the lock held)
+        Returns:
+            IntervalIndex: Index whose values are row positions
+        """
+        index = self._range_indexes.get(payer_name)
+        if index is None:
+            codes = self._store.column('code')
+            range_ends = self._store.column('range_end')
+            intervals = []
+            for position in self._range_positions.get(payer_name, ()):
+                start = code_sort_key(codes.value_at(position))
+                end = code_sort_key(range_ends.value_at(position))
+                if start is not None and end is not None:
+                    intervals.append((start, end, position))
+            index = self._range_indexes[payer_name] = IntervalIndex(intervals)
+        return index
+    
+    def find_covering_codes(self, code, **filters):
+        """
+        Get the stored codes and code ranges that cover a code
+        A code is covered by records of that code and by ranges it falls in,
+        such as 70010-79999 for 71250. Ranges are found with a per-payer
+        interval index, so a lookup takes logarithmic time in the number of
+        ranges plus the number of matches, even when a catch-all range
+        contains many narrower ones.
+        Args:
+            code: Code to look up
+            **filters: Field values the covering records must have, as for
+                filter_codes; usually payer_name
+        Returns:
+            list: List of dictionaries containing the covering codes and ranges, in id order
+        """
+        filters = _check_filters(filters)
+        filters.pop('code', None)
+        key = code_sort_key(code)
+        if key is None:
+            return []
+        
+        with self._lock:
+            positions = set(self._filter_positions({**filters, 'code': code}))
+            
+            checks = self._column_checks({field: value for field, value in filters.items() if field != 'payer_name'})
+            if checks is not None:
+                payers = [filters['payer_name']] if 'payer_name' in filters else list(self._range_positions)
+                for payer_name in payers:
+                    positions.update(
+                        position for position in self._range_index(payer_name).find(key)
+                        if all(codes[position] == value for codes, value in checks)
+                    )
+            
+            return self._store.rows(sorted(positions))
+    
+    def _slice_bitmaps_matching(self, filters):
+        """
+        Get the (slice, bitmap) pairs of slices matching filters (called with the lock held)
+        """
+        checks = [(SLICE_FIELDS.index(field), value) for field, value in filters.items()]
+        return [
+            (slice_key, bitmap) for slice_key, bitmap in self._slice_bitmaps.items()
+            if all(slice_key[index] == value for index, value in checks)
+        ]
+    
+    def _labels(self, bitmap):
+        """
+        Get the sorted labels of the ids in a bitmap (called with the lock held)
+        """
+        return sorted((self._listing_labels[index] for index in _bitmap_ids(bitmap)), key=listing_sort_key)
+    
+    def diff_codes(self, base, other):
+        """
+        Compare the codes of two slices of storage
+        Args:
+            base: Field values selecting the first slice, keyed by any of
+                SLICE_FIELDS, e.g. {'payer_name': 'Aetna', 'year': 2024}
+            other: Field values selecting the second slice
+        Returns:
+            dict: 'added' (codes only in other), 'removed' (codes only in base)
+                and 'common' lists of codes and code ranges, in code order
+        """
+        base = _check_slice_filters(base)
+        other = _check_slice_filters(other)
+        
+        with self._lock:
+            base_bitmap = reduce(operator.or_, (bitmap for _, bitmap in self._slice_bitmaps_matching(base)), 0)
+            other_bitmap = reduce(operator.or_, (bitmap for _, bitmap in self._slice_bitmaps_matching(other)), 0)
+            return {
+                'added': self._labels(other_bitmap & ~base_bitmap),
+                'removed': self._labels(base_bitmap & ~other_bitmap),
+                'common': self._labels(base_bitmap & other_bitmap)
+            }
+    
+    def compare_codes(self, group_by, **filters):
+        """
+        Compare the codes of every value of a field, e.g. of every payer
+        Args:
+            group_by: One of SLICE_FIELDS
+            **filters: Field values the compared codes must have, keyed by
+                any of SLICE_FIELDS
+        Returns:
+            dict: 'groups' (one dictionary per value with 'value', 'total'
+                distinct codes and the 'unique' codes no other value has) and
+                'common' (codes every value has)
+        """
+        if group_by not in SLICE_FIELDS:
+            raise ValueError(f"Cannot compare codes by {group_by}")
+        filters = _check_slice_filters(filters)
+        group_index = SLICE_FIELDS.index(group_by)
+        
+        with self._lock:
+            groups = {}
+            for slice_key, bitmap in self._slice_bitmaps_matching(filters):
+                value = slice_key[group_index]
+                groups[value] = groups.get(value, 0) | bitmap
+            
+            values = sorted(groups, key=str)
+            bitmaps = [groups[value] for value in values]
+            # Codes of the groups before and after each one
+            before = list(accumulate([0] + bitmaps[:-1], operator.or_))
+            after = list(accumulate([0] + bitmaps[:0:-1], operator.or_))[::-1]
+            
+            return {
+                'groups': [
+                    {
+                        'value': value,
+                        'total': bitmap.bit_count(),
+                        'unique': self._labels(bitmap & ~(earlier | later))
+                    }
+                    for value, bitmap, earlier, later in zip(values, bitmaps, before, after)
+                ],
+                'common': self._labels(reduce(operator.and_, bitmaps) if bitmaps else 0)
+            }
+    
+    def get_facet_values(self, field):
+        """
+        Get the distinct values of an indexed field
+        Args:
+            field: One of INDEXED_FIELDS
+        Returns:
+            list: Distinct values present in storage
+        """
+        if field not in INDEXED_FIELDS:
+            raise ValueError(f"Cannot get values of {field}")
+        
+        with self._lock:
+            return self._store.distinct_values(field)
     
     def save_codes(self, codes_to_save):
         """
-        Save extracted codes to storage
+        Save extracted codes to storage, skipping codes that are already stored
         Args:
             codes_to_save: List of dictionaries containing extracted codes to save
         Returns:
             list: List of dictionaries containing all saved codes with IDs
         """
+        return self.upsert_codes(codes_to_save)['codes']
+    
+    def upsert_codes(self, codes_to_save):
+        """
+        Save extracted codes to storage, keyed on their natural key
+        A code with the same NATURAL_KEY_FIELDS values as a stored code (or
+        an earlier code in the same call) is not added again; the stored
+        code is returned in its place, unchanged. Years are stored
+        normalized (see normalize_year).
+        Args:
+            codes_to_save: List of dictionaries containing extracted codes to save
+        Returns:
+            dict: 'codes' (the saved or already stored code for every input
+                code, with IDs), 'inserted' and 'unchanged' counts
+        """
         saved_codes = []
+        inserted = 0
+        # slice -> ids of the codes added to it
+        slice_ids = {}
         
-        for code in codes_to_save:
-            self.current_id += 1
-            code_with_id = {**code, 'id': self.current_id}
-            self.codes[self.current_id] = code_with_id
-            saved_codes.append(code_with_id)
+        with self._lock:
+            for code in codes_to_save:
+                code = normalize_code(code)
+                key = natural_key(code)
+                # Python's hash fits the index and needn't be stable across processes
+                key_hash = hash(key)
+                stored = None
+                for position in self._positions_by_key.find(key_hash):
+                    row = self._store.row(position)
+                    # Rows whose keys merely share the hash are skipped
+                    if natural_key(row) == key:
+                        stored = row
+                        break
+                if stored is not None:
+                    saved_codes.append(stored)
+                    continue
+                
+                for field in SEARCH_FIELDS:
+                    value = code.get(field)
+                    if isinstance(value, str) and self._store.column(field).code_of(value) is None:
+                        self._add_search_value(field, value)
+                
+                self.current_id += 1
+                code_with_id = {**code, 'id': self.current_id}
+                position = self._store.append(code_with_id)
+                saved_codes.append(code_with_id)
+                inserted += 1
+                self._positions_by_key.add(key_hash, position)
+                
+                label = listing_label(code)
+                listing_id = self._listing_ids.get(label)
+                if listing_id is None:
+                    listing_id = self._listing_ids[label] = len(self._listing_labels)
+                    self._listing_labels.append(label)
+                slice_ids.setdefault(tuple(code.get(field) for field in SLICE_FIELDS), []).append(listing_id)
+                
+                if code.get('range_end') is not None:
+                    payer_name = code.get('payer_name')
+                    self._range_positions.setdefault(payer_name, []).append(position)
+                    self._range_indexes.pop(payer_name, None)
+            
+            # One big-integer OR per slice and call rather than per code
+            for slice_key, ids in slice_ids.items():
+                self._slice_bitmaps[slice_key] = self._slice_bitmaps.get(slice_key, 0) | _bitmap(ids)
+            
+            if inserted:
+                self.version += 1
         
-        return saved_codes
+        return {'codes': saved_codes, 'inserted': inserted, 'unchanged': len(saved_codes) - inserted}
     
-    def search_codes(self, search_term):
+    def _add_search_value(self, field, value):
+        """
+        Add a new distinct value of a searchable field to the search index
+        """
+        lowered = value.lower()
+        if lowered == value:
+            # Share the stored string instead of keeping an equal copy
+            lowered = value
+        
+        if lowered not in self._search_values:
+            self._search_values[lowered] = ()
+            for trigram in _trigrams(lowered):
+                self._trigram_index.setdefault(trigram, set()).add(lowered)
+        self._search_values[lowered] += ((field, value),)
+    
+    def _search_positions(self, search_term):
+        """
+        Get the positions of codes with a searchable field containing the term
+        (called with the lock held)
+        Args:
+            search_term: Lowercased, non-empty search term
+        Returns:
+            set: Matching row positions
+        """
+        if len(search_term) >= 3:
+            # Candidate values contain every trigram of the term
+            posting_sets = [self._trigram_index.get(trigram, set()) for trigram in _trigrams(search_term)]
+            posting_sets.sort(key=len)
+            candidates = posting_sets[0].intersection(*posting_sets[1:])
+        else:
+            # Too short for trigrams; the distinct values are few enough to scan
+            candidates = self._search_values
+        
+        return set().union(*(
+            self._store.positions(field, value)
+            for lowered in candidates if search_term in lowered
+            for field, value in self._search_values[lowered]
+        ))
+    
+    def search_codes(self, search_term, limit=None, offset=0, **filters):
         """
         Search extracted codes
         Args:
             search_term: Term to search for
+            limit: Maximum number of codes to return (all if None)
+            offset: Number of matching codes to skip
+            **filters: Field values to match, as for filter_codes
         Returns:
             list: List of dictionaries containing extracted codes that match the search term
         """
-        if not search_term:
-            return self.get_all_codes()
+        return self.search_codes_page(search_term, limit=limit, offset=offset, **filters)['codes']
+    
+    def search_codes_page(self, search_term, limit=None, offset=0, **filters):
+        """
+        Search extracted codes, returning one page of results
+        A code matches when its code, payer name, line of business, or source
+        file contains the term, ignoring case, and it has all the filter values.
+        Args:
+            search_term: Term to search for; an empty term matches every code
+            limit: Maximum number of codes to return (all if None)
+            offset: Number of matching codes to skip
+            **filters: Field values to match, as for filter_codes
+        Returns:
+            dict: 'codes' (the page, in id order), 'total' (number of matches),
+                'offset' and 'limit'
+        """
+        filters = _check_filters(filters)
+        end = None if limit is None else offset + limit
         
-        search_term = search_term.lower()
+        with self._lock:
+            if filters:
+                positions = self._filter_positions(filters)
+                if search_term:
+                    matching_positions = self._search_positions(search_term.lower())
+                    positions = [position for position in positions if position in matching_positions]
+                total = len(positions)
+                positions = positions[offset:end]
+            elif not search_term:
+                total = len(self._store)
+                positions = range(offset, total if end is None else min(end, total))
+            else:
+                matching_positions = self._search_positions(search_term.lower())
+                total = len(matching_positions)
+                if end is None:
+                    positions = sorted(matching_positions)[offset:]
+                else:
+                    # Only the first offset + limit positions need ordering
+                    positions = heapq.nsmallest(end, matching_positions)[offset:]
+            codes = self._store.rows(positions)
         
-        return [
-            code for code in self.codes.values() 
-            if search_term in code['code'].lower() or
-               search_term in code['payer_name'].lower() or
-               search_term in code['line_of_business'].lower() or
-               search_term in code['source_file'].lower()
-        ]
+        return {'codes': codes, 'total': total, 'offset': offset, 'limit': limit}
     
     def clear_all_codes(self):
         """
         Clear all extracted codes from storage
         """
-        self.codes = {}
-        self.current_id = 0
+        with self._lock:
+            self.current_id = 0
+            self.generation = uuid.uuid4().hex
+            self.version += 1
+            self._store = ColumnStore(INDEXED_FIELDS)
+            self._search_values = {}
+            self._trigram_index = {}
+            self._range_positions = {}
+            self._range_indexes = {}
+            self._positions_by_key = HashIndex()
+            self._listing_ids = {}
+            self._listing_labels = []
+            self._slice_bitmaps = {}
+
+def create_storage():
+    """
+    Create the storage backend selected by the STORAGE_BACKEND environment variable
+    'memory' (the default) keeps codes in this process only. 'sqlite' keeps
+    them in the database file at SQLITE_PATH, shared by every worker process
+    and kept across restarts.
+    Returns:
+        MemStorage or SQLiteStorage: Storage backend
+    """
+    backend = os.environ.get('STORAGE_BACKEND', 'memory').lower()
+    
+    if backend == 'sqlite':
+        from app.utils.sqlite_storage import SQLiteStorage
+        default_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'tmp', 'codes.db')
+        return SQLiteStorage(os.environ.get('SQLITE_PATH', default_path))
+    
+    if backend != 'memory':
+        raise ValueError(f"Unknown storage backend: {backend}")
+    
+    return MemStorage()
 
 # Create a singleton instance of the storage
-storage = MemStorage()
\ No newline at end of file
+storage = create_storage()
@@ -0,0 +1 @@
+# benchmarks package initialization file
\ No newline at end of file
@@ -0,0 +1,88 @@
+"""
+Micro-benchmark for code range coverage lookups
+Compares IntervalIndex against the previous sorted list with a running
+maximum end, on many narrow ranges with and without one catch-all range
+nesting them all. The running maximum walked back over every range after
+a catch-all one; the interval tree visits one path of nodes plus the
+matches.
+Usage:
+    python -m benchmarks.bench_code_ranges [--ranges 200000] [--lookups 1000]
+"""
+import argparse
+import random
+import time
+from bisect import bisect_right
+from itertools import accumulate
+
+from app.utils.code_ranges import IntervalIndex
+
+class LegacyIntervalIndex:
+    """
+    Previous implementation: intervals sorted by start with a prefix
+    maximum of their ends, walked back from the point
+    """
+    def __init__(self, intervals=()):
+        entries = sorted(intervals, key=lambda entry: (entry[0], entry[1]))
+        self.starts = [entry[0] for entry in entries]
+        self.ends = [entry[1] for entry in entries]
+        self.values = [entry[2] for entry in entries]
+        self.max_ends = list(accumulate(self.ends, max))
+    
+    def find(self, point):
+        found = []
+        index = bisect_right(self.starts, point) - 1
+        while index >= 0 and self.max_ends[index] >= point:
+            if self.ends[index] >= point:
+                found.append(self.values[index])
+            index -= 1
+        return found
+
+def make_ranges(count, catch_all, seed=42):
+    """
+    Build narrow (start, end, value) ranges spread over 10**7 points
+    Args:
+        count: Number of narrow ranges
+        catch_all: Whether to add one range covering all of them
+        seed: Random seed so runs are reproducible
+    Returns:
+        list: Intervals
+    """
+    rnd = random.Random(seed)
+    intervals = []
+    for value in range(count):
+        start = rnd.randrange(10 ** 7)
+        intervals.append((start, start + rnd.randint(0, 20), value))
+    if catch_all:
+        intervals.append((0, 10 ** 7, count))
+    return intervals
+
+def time_lookups(index, points):
+    """
+    Look up every point and return the mean time per lookup and the results
+    """
+    started = time.perf_counter()
+    results = [sorted(index.find(point)) for point in points]
+    return (time.perf_counter() - started) / len(points), results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--ranges', type=int, default=200000)
+    parser.add_argument('--lookups', type=int, default=1000)
+    args = parser.parse_args()
+    
+    rnd = random.Random(7)
+    points = [rnd.randrange(10 ** 7) for _ in range(args.lookups)]
+    
+    for catch_all in (False, True):
+        intervals = make_ranges(args.ranges, catch_all)
+        legacy_time, legacy_results = time_lookups(LegacyIntervalIndex(intervals), points)
+        current_time, current_results = time_lookups(IntervalIndex(intervals), points)
+        
+        label = 'with catch-all range' if catch_all else 'narrow ranges only'
+        print(f"{len(intervals)} ranges, {label}")
+        print(f"  legacy (running max):  {legacy_time * 1e6:10.1f} us/lookup")
+        print(f"  current (tree):        {current_time * 1e6:10.1f} us/lookup")
+        print(f"  speedup: {legacy_time / current_time:.1f}x  identical output: {legacy_results == current_results}")
+
+if __name__ == '__main__':
+    main()
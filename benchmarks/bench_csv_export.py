@@ -0,0 +1,75 @@
+"""
+Benchmark for the CSV export endpoint
+Compares the previous export (every code materialized, turned into a
+DataFrame and written to a buffer before the first byte is sent) with the
+streaming export, measuring time to first byte, total time and peak
+traced memory while the response is produced.
+Usage:
+    python -m benchmarks.bench_csv_export [--codes 500000]
+"""
+import argparse
+import gc
+import time
+import tracemalloc
+from io import BytesIO
+
+from flask import send_file
+
+from app.app import app
+from app.utils.storage import storage
+from app.utils.csv_exporter import generate_csv_from_codes
+from benchmarks.bench_storage_memory import make_synthetic_codes
+
+@app.route('/bench/legacy-export-csv', methods=['GET'])
+def legacy_export_csv():
+    """
+    Previous implementation of /api/export-csv
+    """
+    csv_buffer = generate_csv_from_codes(storage.get_all_codes())
+    return send_file(
+        BytesIO(csv_buffer.getvalue().encode()),
+        mimetype='text/csv',
+        as_attachment=True,
+        download_name='extracted_codes.csv'
+    )
+
+def measure(client, url):
+    """
+    Download url, consuming the response as it arrives
+    Returns:
+        tuple: (time to first byte, total time, peak traced bytes, response bytes)
+    """
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    
+    response = client.get(url, buffered=False)
+    chunks = iter(response.response)
+    size = len(next(chunks))
+    first_byte = time.perf_counter() - start
+    for chunk in chunks:
+        size += len(chunk)
+    response.close()
+    
+    total = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return first_byte, total, peak, size
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--codes', type=int, default=500000)
+    args = parser.parse_args()
+    
+    storage.clear_all_codes()
+    storage.save_codes(make_synthetic_codes(args.codes))
+    client = app.test_client()
+    
+    print(f"{storage.count_codes()} codes")
+    for label, url in (('buffered', '/bench/legacy-export-csv'), ('streaming', '/api/export-csv')):
+        first_byte, total, peak, size = measure(client, url)
+        print(f"{label:10s} first byte {first_byte * 1000:8.1f} ms  "
+              f"total {total:6.2f} s  peak {peak / 2**20:7.1f} MB  ({size / 2**20:.1f} MB sent)")
+
+if __name__ == '__main__':
+    main()
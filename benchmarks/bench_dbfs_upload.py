@@ -0,0 +1,171 @@
+"""
+Benchmark for Databricks uploads against a local stand-in DBFS server
+Uploads synthetic codes through upload_to_azure_databricks, plain and
+gzip-compressed, with a share of requests failing with HTTP 503 so retries
+are exercised, and checks the stored file against the CSV export. Then
+runs incremental uploads with upload_new_codes as codes are added, and
+checks that the parts in the manifest add up to everything in storage.
+Usage:
+    python -m benchmarks.bench_dbfs_upload [--codes 200000] [--fail-rate 0.05]
+"""
+import argparse
+import base64
+import gzip
+import json
+import random
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from app.utils import azure_uploader
+from app.utils.azure_uploader import MANIFEST_NAME, upload_to_azure_databricks, upload_new_codes
+from app.utils.csv_exporter import iter_csv_from_codes
+from app.utils.storage import MemStorage
+from benchmarks.bench_storage_memory import make_synthetic_codes
+
+class StandInDBFS(ThreadingHTTPServer):
+    """
+    Minimal in-memory implementation of the DBFS put, handle, read and
+    delete API. Enforces the 1 MB limit on put contents and add-block data,
+    and fails a random fail_rate share of POST requests with HTTP 503.
+    """
+    daemon_threads = True
+    
+    def __init__(self, fail_rate=0.0, seed=1):
+        super().__init__(('127.0.0.1', 0), _Handler)
+        self.fail_rate = fail_rate
+        self.random = random.Random(seed)
+        self.files = {}
+        self.handles = {}
+        self.last_handle = 0
+        self.requests = 0
+        self.lock = threading.Lock()
+    
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+class _Handler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+    
+    def reply(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+    
+    def do_POST(self):
+        server = self.server
+        payload = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        endpoint = self.path.rsplit('/', 1)[-1]
+        
+        with server.lock:
+            server.requests += 1
+            if server.random.random() < server.fail_rate:
+                return self.reply(503, {'error_code': 'TEMPORARILY_UNAVAILABLE'})
+            
+            if endpoint == 'put':
+                contents = base64.b64decode(payload['contents'])
+                if len(contents) > 1024 * 1024:
+                    return self.reply(400, {'error_code': 'MAX_BLOCK_SIZE_EXCEEDED'})
+                server.files[payload['path']] = contents
+                return self.reply(200, {})
+            if endpoint == 'create':
+                server.last_handle += 1
+                server.handles[server.last_handle] = (payload['path'], bytearray())
+                return self.reply(200, {'handle': server.last_handle})
+            if endpoint == 'add-block':
+                data = base64.b64decode(payload['data'])
+                if len(data) > 1024 * 1024:
+                    return self.reply(400, {'error_code': 'MAX_BLOCK_SIZE_EXCEEDED'})
+                server.handles[payload['handle']][1].extend(data)
+                return self.reply(200, {})
+            if endpoint == 'close':
+                path, data = server.handles.pop(payload['handle'])
+                server.files[path] = bytes(data)
+                return self.reply(200, {})
+            if endpoint == 'delete':
+                server.files.pop(payload['path'], None)
+                return self.reply(200, {})
+        
+        self.reply(404, {'error_code': 'ENDPOINT_NOT_FOUND'})
+    
+    def do_GET(self):
+        server = self.server
+        url = urlparse(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        
+        with server.lock:
+            server.requests += 1
+            if url.path.endswith('/read'):
+                if query['path'] not in server.files:
+                    return self.reply(404, {'error_code': 'RESOURCE_DOES_NOT_EXIST'})
+                offset, length = int(query['offset']), int(query['length'])
+                data = server.files[query['path']][offset:offset + length]
+                return self.reply(200, {'bytes_read': len(data), 'data': base64.b64encode(data).decode()})
+        
+        self.reply(404, {'error_code': 'ENDPOINT_NOT_FOUND'})
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--codes', type=int, default=200000)
+    parser.add_argument('--fail-rate', type=float, default=0.05)
+    args = parser.parse_args()
+    
+    codes = make_synthetic_codes(args.codes)
+    expected = ''.join(iter_csv_from_codes(codes)).encode()
+    
+    server = StandInDBFS(fail_rate=args.fail_rate)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    azure_uploader.RETRY_BACKOFF = 0.01
+    
+    print(f"{len(codes)} codes, {len(expected) / 2**20:.1f} MB of CSV, {args.fail_rate:.0%} of requests fail")
+    for compress in (False, True):
+        connection = {'workspace_url': server.url, 'access_token': 'token',
+                      'directory_path': '/bench', 'compress': compress}
+        result = upload_to_azure_databricks(iter(codes), connection)
+        if not result['success']:
+            print(result['message'])
+            continue
+        
+        metrics = result['metrics']
+        path = '/bench/extracted_codes.csv' + ('.gz' if compress else '')
+        stored = server.files[path]
+        matches = (gzip.decompress(stored) if compress else stored) == expected
+        print(f"{'gzip' if compress else 'plain':6s} {metrics['bytes'] / 2**20:6.1f} MB stored  "
+              f"{metrics['bytes_sent'] / 2**20:6.1f} MB sent  {metrics['blocks']:3d} blocks  "
+              f"{metrics['retries']:2d} retries  {metrics['mb_per_second']:6.1f} MB/s  "
+              f"{'matches export' if matches else 'MISMATCH'}")
+    
+    # Incremental: most codes first, then two smaller batches
+    storage = MemStorage()
+    connection = {'workspace_url': server.url, 'access_token': 'token',
+                  'directory_path': '/incremental', 'compress': True}
+    batches = [codes[:len(codes) * 9 // 10], codes[len(codes) * 9 // 10:-100], codes[-100:], []]
+    for batch in batches:
+        storage.save_codes(batch)
+        result = upload_new_codes(storage, connection)
+        if not result['success']:
+            print(result['message'])
+            break
+        metrics = result['metrics']
+        print(f"incremental +{result['rows']:6d} codes  {metrics['files']:2d} files  "
+              f"{metrics['bytes'] / 2**20:6.2f} MB stored  {metrics['seconds']:5.2f} s")
+    
+    manifest = json.loads(server.files[f"/incremental/{MANIFEST_NAME}"])
+    rebuilt = b''.join(
+        gzip.decompress(server.files[part['path']]).split(b'\n', 1)[1]
+        for part in manifest['parts']
+    )
+    rebuilt_rows = sorted(rebuilt.splitlines())
+    stored_rows = sorted(''.join(iter_csv_from_codes(storage.iter_codes())).encode().splitlines()[1:])
+    print(f"manifest: {len(manifest['parts'])} parts, high-water mark {manifest['high_water_mark']}, "
+          f"{'matches storage' if rebuilt_rows == stored_rows else 'MISMATCH'}")
+    
+    server.shutdown()
+
+if __name__ == '__main__':
+    main()
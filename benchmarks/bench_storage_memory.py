@@ -0,0 +1,100 @@
+"""
+Memory benchmark for code storage
+Compares bytes per stored code for MemStorage against the previous
+dict-of-dicts layout, using records shaped like process_pdf output.
+Usage:
+    python -m benchmarks.bench_storage_memory [--codes 500000]
+"""
+import argparse
+import gc
+import random
+import tracemalloc
+
+from app.utils.storage import MemStorage
+
+def make_synthetic_codes(count, seed=42):
+    """
+    Build extracted code records spread over documents, payers and years
+    Records from one document share their metadata string objects, as
+    they do when they come out of process_pdf.
+    Args:
+        count: Number of records
+        seed: Random seed so runs are reproducible
+    Returns:
+        list: List of code dictionaries
+    """
+    rnd = random.Random(seed)
+    payers = [f"Payer {index} Health Plan" for index in range(40)]
+    lines_of_business = ["Medicare", "Medicaid", "Commercial", "Marketplace", "Other"]
+    # Prior-auth lists draw from a limited universe of codes
+    universe = (
+        [(f"{rnd.randint(10000, 99999)}", 'CPT') for _ in range(9000)] +
+        [(f"{rnd.choice('AEGJKLQ')}{rnd.randint(0, 9999):04d}", 'HCPCS') for _ in range(5000)] +
+        [(f"{number:04d}U", 'PLA') for number in range(1, 390)]
+    )
+    codes = []
+    document = 0
+    
+    while len(codes) < count:
+        document += 1
+        metadata = {
+            'payer_name': rnd.choice(payers),
+            'year': rnd.randint(2020, 2025),
+            'line_of_business': rnd.choice(lines_of_business),
+            'source_file': f"prior_auth_list_{document}.pdf"
+        }
+        for code, code_type in rnd.sample(universe, min(rnd.randint(200, 3000), count - len(codes))):
+            codes.append({'code': code, 'code_type': code_type, **metadata, 'page': rnd.randint(1, 600)})
+    
+    return codes
+
+def legacy_store(codes):
+    """
+    Previous layout: one dictionary per code keyed by id
+    """
+    store = {}
+    for code_id, code in enumerate(codes, start=1):
+        store[code_id] = {**code, 'id': code_id}
+    return store
+
+def column_store(codes):
+    """
+    Current layout: MemStorage
+    """
+    storage = MemStorage()
+    storage.save_codes(codes)
+    return storage
+
+def measure(build, codes):
+    """
+    Measure the memory retained by the structure build(codes) returns
+    Returns:
+        int: Retained bytes
+    """
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build(codes)
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del result
+    return after - before
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--codes', type=int, default=500000)
+    args = parser.parse_args()
+    
+    codes = make_synthetic_codes(args.codes)
+    
+    legacy_bytes = measure(legacy_store, codes)
+    column_bytes = measure(column_store, codes)
+    
+    print(f"{len(codes)} codes")
+    print(f"dict-of-dicts: {legacy_bytes / len(codes):8.1f} bytes/code  ({legacy_bytes / 2**20:.1f} MB)")
+    print(f"MemStorage:    {column_bytes / len(codes):8.1f} bytes/code  ({column_bytes / 2**20:.1f} MB)")
+    print(f"reduction: {legacy_bytes / column_bytes:.1f}x")
+
+if __name__ == '__main__':
+    main()
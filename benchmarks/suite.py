@@ -0,0 +1,201 @@
+"""
+Benchmark suite for extraction, storage, export and the API
+Runs every case on synthetic prior-authorization PDFs and code records,
+prints the timings and can write them as JSON. Given the results of an
+earlier run as a baseline, any case whose median got slower by more than
+the threshold fails the run, so it can guard CI.
+Usage:
+    python -m benchmarks.suite [--pages 10,200,2000] [--codes 100000] [--repeat 3]
+        [--output results.json] [--baseline previous.json] [--threshold 0.25]
+"""
+import argparse
+import io
+import json
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+
+from app.app import app
+from app.utils.storage import MemStorage, storage
+from app.utils.extraction_cache import extraction_cache
+from app.utils.csv_exporter import generate_csv_from_codes
+from app.utils.pdf_processor import extract_text_from_pdf, extract_codes_from_text
+from benchmarks.bench_storage_memory import make_synthetic_codes
+from benchmarks.synthetic_pdf import make_prior_auth_pdf
+
+RESULTS_VERSION = 1
+
+METADATA = {
+    'payer_name': 'Synthetic Health',
+    'year': 2025,
+    'line_of_business': 'Commercial',
+    'source_file': 'synthetic.pdf'
+}
+
+SEARCH_TERMS = ['99213', 'j12', 'health plan', 'medicare', 'prior_auth_list_7']
+
+def time_case(run, repeat, setup=None):
+    """
+    Time a benchmark case
+    Args:
+        run: Function to time; receives whatever setup returned
+        repeat: Number of timed runs
+        setup: Optional function called before every run, outside the timing
+    Returns:
+        dict: Median, minimum and every run in seconds
+    """
+    runs = []
+    for _ in range(repeat):
+        state = setup() if setup else None
+        started = time.perf_counter()
+        run(state)
+        runs.append(time.perf_counter() - started)
+    return {'median': statistics.median(runs), 'min': min(runs), 'runs': runs}
+
+def pdf_cases(pages, repeat):
+    """
+    Yield (case name, timing) for extraction from a synthetic PDF
+    """
+    pdf_bytes = make_prior_auth_pdf(pages)
+    text = extract_text_from_pdf(pdf_bytes)
+    
+    yield f"extract_text_from_pdf[pages={pages}]", time_case(lambda _: extract_text_from_pdf(pdf_bytes), repeat)
+    yield f"extract_codes_from_text[pages={pages}]", time_case(lambda _: extract_codes_from_text(text, METADATA), repeat)
+
+def storage_cases(codes, repeat):
+    """
+    Yield (case name, timing) for MemStorage and the CSV export
+    """
+    count = len(codes)
+    yield f"MemStorage.save_codes[codes={count}]", time_case(lambda memory: memory.save_codes(codes), repeat, MemStorage)
+    
+    memory = MemStorage()
+    memory.save_codes(codes)
+    
+    def search(_):
+        for term in SEARCH_TERMS:
+            memory.search_codes(term, limit=100)
+            memory.search_codes(term, payer_name='Payer 3 Health Plan')
+    
+    yield f"MemStorage.search_codes[codes={count}]", time_case(search, repeat)
+    
+    saved = memory.get_all_codes()
+    yield f"generate_csv_from_codes[codes={count}]", time_case(lambda _: generate_csv_from_codes(saved), repeat)
+
+def endpoint_cases(pages, codes, repeat):
+    """
+    Yield (case name, timing) for API endpoints through the Flask test client
+    The PDF is processed with a cold extraction cache each time, the read
+    endpoints run against the synthetic codes.
+    """
+    client = app.test_client()
+    pdf_bytes = make_prior_auth_pdf(pages)
+    # Keep the benchmark out of the on-disk cache tier
+    cache_dir = extraction_cache.cache_dir
+    extraction_cache.configure(cache_dir=None)
+    
+    def prepare_upload():
+        storage.clear_all_codes()
+        extraction_cache.clear()
+        return {
+            'file': (io.BytesIO(pdf_bytes), 'synthetic.pdf'),
+            'payer_name': METADATA['payer_name'],
+            'line_of_business': METADATA['line_of_business'],
+            'year': str(METADATA['year'])
+        }
+    
+    def upload(data):
+        response = client.post('/api/process-pdf', data=data, content_type='multipart/form-data')
+        assert response.status_code == 200, response.get_data(as_text=True)
+    
+    yield f"POST /api/process-pdf[pages={pages}]", time_case(upload, repeat, prepare_upload)
+    
+    storage.clear_all_codes()
+    storage.save_codes(codes)
+    count = len(codes)
+    
+    def get(url):
+        def run(_):
+            response = client.get(url)
+            response.get_data()
+            assert response.status_code == 200, url
+        return run
+    
+    yield f"GET /api/codes[codes={count}]", time_case(get('/api/codes?limit=1000'), repeat)
+    yield f"GET /api/codes/search[codes={count}]", time_case(get('/api/codes/search?term=health+plan&limit=100'), repeat)
+    yield f"GET /api/export-csv[codes={count}]", time_case(get('/api/export-csv'), repeat)
+    
+    storage.clear_all_codes()
+    extraction_cache.configure(cache_dir=cache_dir)
+
+def compare(results, baseline, threshold):
+    """
+    Find cases that got slower than the baseline
+    Args:
+        results: Case name -> timing, from this run
+        baseline: Case name -> timing, from an earlier run
+        threshold: Allowed slowdown of the median, e.g. 0.25 for 25%
+    Returns:
+        list: (case name, baseline median, median) for every regression
+    """
+    regressions = []
+    for name, timing in results.items():
+        previous = baseline.get(name)
+        if previous and timing['median'] > previous['median'] * (1 + threshold):
+            regressions.append((name, previous['median'], timing['median']))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--pages', default='10,200', help='Comma-separated PDF sizes, up to 2000 pages')
+    parser.add_argument('--codes', type=int, default=100000, help='Code records for storage, export and API cases')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', help='Write the results to this JSON file')
+    parser.add_argument('--baseline', help='JSON results of an earlier run to compare against')
+    parser.add_argument('--threshold', type=float, default=0.25, help='Allowed slowdown before a case fails')
+    args = parser.parse_args()
+    
+    # The API cases clear storage, so keep them away from a real database
+    if not isinstance(storage, MemStorage):
+        parser.error('run the suite with STORAGE_BACKEND=memory')
+    
+    page_counts = [int(pages) for pages in args.pages.split(',')]
+    codes = make_synthetic_codes(args.codes)
+    
+    cases = [pdf_cases(pages, args.repeat) for pages in page_counts]
+    cases.append(storage_cases(codes, args.repeat))
+    cases.append(endpoint_cases(page_counts[0], codes, args.repeat))
+    
+    results = {}
+    for group in cases:
+        for name, timing in group:
+            results[name] = timing
+            print(f"{name:48s} median {timing['median'] * 1000:10.1f} ms  min {timing['min'] * 1000:10.1f} ms")
+    
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'version': RESULTS_VERSION,
+                'created': datetime.now(timezone.utc).isoformat(),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'parameters': {'pages': page_counts, 'codes': args.codes, 'repeat': args.repeat},
+                'results': results
+            }, f, indent=2)
+        print(f"Results written to {args.output}")
+    
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results, baseline, args.threshold)
+        for name, previous, current in regressions:
+            print(f"REGRESSION {name}: {previous * 1000:.1f} ms -> {current * 1000:.1f} ms "
+                  f"(+{(current / previous - 1) * 100:.0f}%)")
+        if regressions:
+            sys.exit(1)
+        print(f"No case slower than the baseline by more than {args.threshold:.0%}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+"""
+Synthetic prior-authorization PDFs for benchmarks
+Builds payer code lists entirely offline: every page has a title, a ruled
+table of CPT, HCPCS and PLA codes with descriptions and requirements, the
+odd code range row and a footer, much like the lists payers publish.
+Usage:
+    python -m benchmarks.synthetic_pdf PAGES OUTPUT.pdf [--seed 1]
+"""
+import argparse
+import random
+import zlib
+
+PAGE_WIDTH = 612
+PAGE_HEIGHT = 792
+ROW_HEIGHT = 20
+
+# Table column edges in points: code, description, requirement
+COLUMN_EDGES = (40, 120, 440, 572)
+
+PROCEDURES = [
+    'Magnetic resonance imaging, brain', 'Computed tomography, abdomen and pelvis',
+    'Arthroscopy, knee, surgical', 'Spinal fusion, lumbar', 'Sleep study, attended',
+    'Genetic testing panel', 'Infusion, chemotherapy', 'Durable medical equipment',
+    'Physical therapy evaluation', 'Cardiac catheterization', 'Injection, drug administration',
+    'Home health visit', 'Positron emission tomography', 'Bariatric surgery'
+]
+REQUIREMENTS = ['Prior authorization required', 'Notification only', 'Required', 'Required for outpatient']
+HCPCS_PREFIXES = 'AEGJKLQ'
+
+def _escape(text):
+    return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+def _text(x, y, text, size=9):
+    return f"BT /F1 {size} Tf {x} {y} Td ({_escape(text)}) Tj ET"
+
+def random_code(rnd):
+    """
+    Draw a code with roughly the mix of a payer list
+    Returns:
+        str: CPT code 60% of the time, HCPCS 30% and PLA 10%
+    """
+    kind = rnd.random()
+    if kind < 0.6:
+        return f"{rnd.randint(10000, 99999)}"
+    if kind < 0.9:
+        return f"{rnd.choice(HCPCS_PREFIXES)}{rnd.randint(0, 9999):04d}"
+    return f"{rnd.randint(1, 389):04d}U"
+
+def _page_content(rnd, page_number, page_count, payer_name, rows):
+    lines = [
+        _text(COLUMN_EDGES[0], 750, f"{payer_name} Prior Authorization List", 14),
+        _text(COLUMN_EDGES[0] + 2, 722, 'Code', 10),
+        _text(COLUMN_EDGES[1] + 2, 722, 'Description', 10),
+        _text(COLUMN_EDGES[2] + 2, 722, 'Requirement', 10)
+    ]
+    top = 736
+    y = 722
+    for _ in range(rows):
+        y -= ROW_HEIGHT
+        code = random_code(rnd)
+        # Some rows list a whole range of codes
+        if rnd.random() < 0.03 and code.isdigit():
+            code = f"{code} - {min(int(code) + rnd.randint(1, 50), 99999)}"
+        lines.append(_text(COLUMN_EDGES[0] + 2, y, code))
+        lines.append(_text(COLUMN_EDGES[1] + 2, y, rnd.choice(PROCEDURES)))
+        lines.append(_text(COLUMN_EDGES[2] + 2, y, rnd.choice(REQUIREMENTS)))
+    bottom = y - 6
+    
+    # Table rules
+    for row_y in range(top, bottom - 1, -ROW_HEIGHT):
+        lines.append(f"{COLUMN_EDGES[0]} {row_y} m {COLUMN_EDGES[-1]} {row_y} l S")
+    for x in COLUMN_EDGES:
+        lines.append(f"{x} {top} m {x} {bottom} l S")
+    
+    lines.append(_text(COLUMN_EDGES[0], 30, f"Page {page_number} of {page_count}", 8))
+    return '\n'.join(lines).encode('latin-1')
+
+def make_prior_auth_pdf(pages, rows_per_page=30, seed=1, payer_name='Synthetic Health'):
+    """
+    Build a synthetic prior-authorization code list
+    Args:
+        pages: Number of pages
+        rows_per_page: Table rows on each page
+        seed: Random seed so documents are reproducible
+        payer_name: Payer shown in the page titles
+    Returns:
+        bytes: PDF file content
+    """
+    rnd = random.Random(seed)
+    objects = [b'<< /Type /Catalog /Pages 2 0 R >>', None,
+               b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>']
+    page_ids = []
+    
+    for page_number in range(1, pages + 1):
+        content = zlib.compress(_page_content(rnd, page_number, pages, payer_name, rows_per_page))
+        objects.append(b'<< /Length %d /Filter /FlateDecode >>\nstream\n' % len(content) + content + b'\nendstream')
+        objects.append(
+            b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] /Resources << /Font << /F1 3 0 R >> >> '
+            b'/Contents %d 0 R >>' % (PAGE_WIDTH, PAGE_HEIGHT, len(objects))
+        )
+        page_ids.append(len(objects))
+    
+    kids = b' '.join(b'%d 0 R' % page_id for page_id in page_ids)
+    objects[1] = b'<< /Type /Pages /Kids [%s] /Count %d >>' % (kids, len(page_ids))
+    
+    output = bytearray(b'%PDF-1.4\n')
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(output))
+        output += b'%d 0 obj\n' % number + body + b'\nendobj\n'
+    
+    xref = len(output)
+    output += b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1)
+    output += b''.join(b'%010d 00000 n \n' % offset for offset in offsets)
+    output += b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objects) + 1, xref)
+    return bytes(output)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('pages', type=int)
+    parser.add_argument('output')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    
+    with open(args.output, 'wb') as f:
+        f.write(make_prior_auth_pdf(args.pages, seed=args.seed))
+
+if __name__ == '__main__':
+    main()